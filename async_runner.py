@@ -0,0 +1,140 @@
+"""
+asyncio-based runner for the external tools used by the build scripts
+(pandoc and the mermaid renderer).
+Tools are started with asyncio.create_subprocess_exec under a concurrency
+semaphore, their output is streamed rather than buffered, and each call has
+its own timeout. Only the tool processes run concurrently: Python code
+between tool calls runs on the event loop, which suits the short string
+work the build does there.
+"""
+
+import os
+import time
+import asyncio
+
+# Size of the chunks read from a tool's stdout/stderr
+READ_CHUNK_SIZE = 64 * 1024
+
+
+class ToolError(Exception):
+    """Raised when an external tool fails, times out or cannot be started."""
+
+
+class ToolResult:
+    """
+    Exit status and error output of a finished tool call.
+    elapsed is the tool's run time in seconds, not counting time spent
+    waiting for a concurrency slot.
+    """
+
+    def __init__(self, args, returncode, stderr, elapsed=None):
+        self.args = args
+        self.returncode = returncode
+        self.stderr = stderr
+        self.elapsed = elapsed
+
+
+async def read_stream(stream, on_chunk):
+    """Read a subprocess stream to EOF, passing each chunk to on_chunk."""
+    while True:
+        chunk = await stream.read(READ_CHUNK_SIZE)
+        if not chunk:
+            break
+        on_chunk(chunk)
+
+
+class ToolRunner:
+    """
+    Runs external tools concurrently.
+    max_concurrency bounds the number of tool processes alive at once.
+    """
+
+    def __init__(self, max_concurrency=None):
+        self.max_concurrency = max_concurrency or os.cpu_count() or 1
+        self.semaphore = asyncio.Semaphore(self.max_concurrency)
+
+    async def run(self, args, timeout=60, input_data=None, on_output=None, cwd=None):
+        """
+        Run a tool and return a ToolResult.
+        input_data (bytes) is written to the tool's stdin. stdout is never
+        buffered: its chunks are passed to on_output as they arrive, or
+        discarded if on_output is None.
+        Raises ToolError on a non-zero exit, a timeout, or a missing tool.
+        """
+        async with self.semaphore:
+            start = time.perf_counter()
+            try:
+                process = await asyncio.create_subprocess_exec(
+                    *args,
+                    stdin=asyncio.subprocess.PIPE if input_data is not None else asyncio.subprocess.DEVNULL,
+                    stdout=asyncio.subprocess.PIPE if on_output is not None else asyncio.subprocess.DEVNULL,
+                    stderr=asyncio.subprocess.PIPE,
+                    cwd=cwd,
+                )
+            except OSError as e:
+                raise ToolError(f"{args[0]}: {e}") from e
+
+            stderr_chunks = []
+
+            async def feed_stdin():
+                if input_data is None:
+                    return
+                try:
+                    process.stdin.write(input_data)
+                    await process.stdin.drain()
+                except (BrokenPipeError, ConnectionResetError):
+                    pass
+                finally:
+                    process.stdin.close()
+
+            async def read_stdout():
+                if on_output is not None:
+                    await read_stream(process.stdout, on_output)
+
+            async def communicate():
+                await asyncio.gather(
+                    feed_stdin(),
+                    read_stdout(),
+                    read_stream(process.stderr, stderr_chunks.append),
+                )
+                return await process.wait()
+
+            try:
+                returncode = await asyncio.wait_for(communicate(), timeout)
+            except asyncio.TimeoutError:
+                process.kill()
+                await process.wait()
+                raise ToolError(f"{args[0]} timed out after {timeout}s")
+            elapsed = time.perf_counter() - start
+
+        result = ToolResult(args, returncode, b''.join(stderr_chunks), elapsed)
+        if returncode != 0:
+            message = result.stderr.decode('utf-8', errors='replace').strip()
+            raise ToolError(f"{args[0]} exited with status {returncode}: {message}")
+        return result
+
+
+def timed_call(func, *args):
+    """
+    Call func(*args) and return (result, seconds).
+    Used to time the inline steps between tool calls, whose cost is
+    recorded separately from the tool's own run time.
+    """
+    start = time.perf_counter()
+    result = func(*args)
+    return result, time.perf_counter() - start
+
+
+def run_all(coroutine_factory, items, max_concurrency=None):
+    """
+    Run coroutine_factory(runner, item) for every item on one event loop.
+    Returns the results in item order; a failed item's result is the exception.
+    """
+    async def run():
+        runner = ToolRunner(max_concurrency)
+        return await asyncio.gather(
+            *(coroutine_factory(runner, item) for item in items),
+            return_exceptions=True,
+        )
+
+    return asyncio.run(run())
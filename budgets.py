@@ -0,0 +1,188 @@
+#!/usr/bin/env python3
+"""
+Performance budgets for diagrams, pages and PDFs.
+A single oversized diagram (e.g. a mermaid chart that renders to several
+hundred KB of SVG) makes every page that embeds it slower to load and its
+PDF slower to lay out. Budgets cap the SVG size and node count of each
+diagram, the size of each HTML page and the PDF render time of each
+document. The pipeline checks them on the data its stages already have,
+and `docs-build budgets` checks the current outputs (PDF times come from
+the build history). Offenders are listed worst first, relative to their
+budget; with --fail-on-budget the build exits non-zero when there are any.
+Budgets can be overridden per build tree in docs_budgets.json.
+"""
+
+import os
+import re
+import sys
+import glob
+import json
+import argparse
+
+import diagram_store
+import build_history
+
+BUDGETS_FILENAME = 'docs_budgets.json'
+
+# Budget name -> (default limit, unit, description)
+BUDGETS = {
+    'svg_bytes': (200 * 1024, 'bytes', 'SVG size per diagram'),
+    'svg_nodes': (150, 'nodes', 'nodes per diagram'),
+    'html_bytes': (1024 * 1024, 'bytes', 'HTML size per page'),
+    'pdf_seconds': (120, 's', 'PDF render time per document'),
+}
+
+# A diagram node group: class "node ..." but not "nodes"
+NODE_GROUP = re.compile(r'<g\b[^>]*\bclass="node[\s"]')
+
+
+def load_budgets(base_dir):
+    """Return {budget: limit}: the defaults, overridden by the build tree's budgets file."""
+    limits = {name: default for name, (default, _, _) in BUDGETS.items()}
+    path = os.path.join(base_dir, BUDGETS_FILENAME)
+    if not os.path.exists(path):
+        return limits
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            overrides = json.load(f)
+    except (OSError, ValueError) as e:
+        print(f"  Warning: ignoring {BUDGETS_FILENAME}: {e}")
+        return limits
+    if not isinstance(overrides, dict):
+        print(f"  Warning: ignoring {BUDGETS_FILENAME}: expected an object of budget limits")
+        return limits
+    for name, limit in overrides.items():
+        if name not in BUDGETS:
+            print(f"  Warning: unknown budget in {BUDGETS_FILENAME}: {name}")
+        elif limit is not None and (isinstance(limit, bool) or not isinstance(limit, (int, float))
+                                    or not limit > 0):
+            print(f"  Warning: budget {name} must be a positive number")
+        else:
+            # null disables a budget
+            limits[name] = limit
+    return limits
+
+
+def count_nodes(svg_content):
+    """Return the number of node groups in a diagram."""
+    return len(NODE_GROUP.findall(svg_content))
+
+
+def format_value(budget, value):
+    """Format a measured value or limit of a budget."""
+    unit = BUDGETS[budget][1]
+    if unit == 'bytes':
+        return f'{value / 1024:.0f} KB'
+    if unit == 's':
+        return f'{value:.1f}s'
+    return f'{value} {unit}'
+
+
+class BudgetReport:
+    """Budget checks of one build and the offenders they found."""
+
+    def __init__(self, limits):
+        self.limits = limits
+        # (budget, subject, value)
+        self.offenders = []
+
+    def check(self, budget, subject, value):
+        """Record subject as an offender if value is over the budget."""
+        limit = self.limits.get(budget)
+        if limit is not None and value is not None and value > limit:
+            self.offenders.append((budget, subject, value))
+
+    def check_diagram(self, subject, svg_content):
+        """Check a diagram's SVG size and node count."""
+        self.check('svg_bytes', subject, len(svg_content.encode('utf-8')))
+        self.check('svg_nodes', subject, count_nodes(svg_content))
+
+    def check_page(self, subject, size):
+        """Check the size in bytes of an HTML page."""
+        self.check('html_bytes', subject, size)
+
+    def check_pdf(self, subject, seconds):
+        """Check the render time of a PDF."""
+        self.check('pdf_seconds', subject, seconds)
+
+    def ranked(self):
+        """Return the offenders, furthest over their budget first."""
+        return sorted(self.offenders, key=lambda o: (-o[2] / self.limits[o[0]], o[1]))
+
+    def report_lines(self):
+        """Return the report of the offenders, one line each."""
+        lines = []
+        for budget, subject, value in self.ranked():
+            limit = self.limits[budget]
+            lines.append(f"  {subject}: {format_value(budget, value)} "
+                         f"(budget {format_value(budget, limit)}, x{value / limit:.1f}) - {BUDGETS[budget][2]}")
+        return lines
+
+    def print_report(self, fail):
+        """Print the offenders. Returns True if the build should fail."""
+        if not self.offenders:
+            print("All performance budgets met")
+            return False
+        kind = 'Error' if fail else 'Warning'
+        print(f"{kind}: {len(self.offenders)} performance budget(s) exceeded:")
+        for line in self.report_lines():
+            print(line)
+        return fail
+
+
+def diagram_subject(basename, number, svg_path):
+    """Return how a diagram is named in the report."""
+    return f'{basename} diagram {number} ({os.path.basename(svg_path)})'
+
+
+def check_outputs(report, html_dir, images_dir, history=None):
+    """
+    Check the budgets against the current outputs of a build tree.
+    Diagrams are found through the manifest, or the legacy per-document
+    files of documents that have not been migrated to the store.
+    """
+    documents = set(diagram_store.load_manifest(images_dir)) | set(diagram_store.legacy_documents(images_dir))
+    checked = set()
+    for basename in sorted(documents):
+        for number, svg_path in enumerate(diagram_store.document_diagrams(images_dir, basename), 1):
+            if svg_path in checked:
+                continue
+            checked.add(svg_path)
+            with open(svg_path, 'r', encoding='utf-8') as f:
+                report.check_diagram(diagram_subject(basename, number, svg_path), f.read())
+
+    for html_path in sorted(glob.glob(os.path.join(html_dir, '*.html'))):
+        report.check_page(os.path.basename(html_path), os.path.getsize(html_path))
+
+    if history is not None:
+        for _, document in history.documents('pdf'):
+            for seconds, _ in history.recent_runs('pdf', document, 1):
+                report.check_pdf(document.replace('.html', '.pdf'), seconds)
+
+
+def add_budget_argument(parser):
+    """Add the --fail-on-budget option to a stage's argument parser."""
+    parser.add_argument('--fail-on-budget', action='store_true',
+                        help=f'exit with an error if a performance budget is exceeded '
+                             f'(budgets: {BUDGETS_FILENAME})')
+
+
+def main():
+    """Check the current build outputs against the performance budgets."""
+    parser = argparse.ArgumentParser(description='Check build outputs against the performance budgets.')
+    add_budget_argument(parser)
+    args = parser.parse_args()
+
+    base_dir = '/home/ubuntu/go/src/customers-docs'
+    html_dir = os.path.join(base_dir, 'docs/html')
+    images_dir = os.path.join(base_dir, 'docs/images')
+
+    report = BudgetReport(load_budgets(base_dir))
+    print("Checking performance budgets")
+    print("-" * 50)
+    with build_history.open_history(base_dir) as history:
+        check_outputs(report, html_dir, images_dir, history)
+    return 1 if report.print_report(args.fail_on_budget) else 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,224 @@
+#!/usr/bin/env python3
+"""
+Build timing history.
+Each stage records how long every document took and how large its outputs
+were in a small SQLite database (.build_cache/build_history.sqlite). The
+concurrent stages use the history to start the documents expected to take
+longest first, and the report shows recent trends and flags documents whose
+build time or output size jumped, e.g. when a new diagram doubles the PDF
+render time of a document.
+"""
+
+import os
+import sys
+import time
+import sqlite3
+import argparse
+import statistics
+from contextlib import contextmanager
+
+HISTORY_FILENAME = '.build_cache/build_history.sqlite'
+
+# Number of previous runs a document's expected duration is based on
+BASELINE_RUNS = 5
+
+# Flag a document when its last run is this many times its baseline
+JUMP_THRESHOLD = 1.5
+
+# Ignore jumps in runs shorter than this, which are mostly noise
+MIN_FLAGGED_SECONDS = 0.5
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS timings (
+    id INTEGER PRIMARY KEY,
+    recorded_at REAL NOT NULL,
+    stage TEXT NOT NULL,
+    document TEXT NOT NULL,
+    seconds REAL NOT NULL,
+    output_bytes INTEGER
+);
+CREATE INDEX IF NOT EXISTS timings_stage_document ON timings (stage, document, recorded_at);
+'''
+
+
+def history_path(base_dir):
+    """Return the path of the history database for a build tree."""
+    return os.path.join(base_dir, HISTORY_FILENAME)
+
+
+def output_size(paths):
+    """Return the total size of the output files that exist, or None if none do."""
+    sizes = [os.path.getsize(path) for path in paths if os.path.exists(path)]
+    return sum(sizes) if sizes else None
+
+
+class BuildHistory:
+    """
+    Per-document, per-stage timings of past builds.
+    Records are buffered and written in one transaction on close(), so
+    sharded processes sharing the database only briefly lock it.
+    """
+
+    def __init__(self, db_path):
+        os.makedirs(os.path.dirname(db_path), exist_ok=True)
+        self.connection = sqlite3.connect(db_path, timeout=30)
+        self.connection.executescript(SCHEMA)
+        self.pending = []
+
+    def record(self, stage, document, seconds, output_bytes=None):
+        """Buffer one timing record."""
+        self.pending.append((time.time(), stage, document, seconds, output_bytes))
+
+    @contextmanager
+    def measure(self, stage, document, outputs=()):
+        """
+        Time the enclosed block and record it with the size of outputs.
+        Nothing is recorded if the block raises, so failed builds don't
+        distort the history.
+        """
+        start = time.perf_counter()
+        yield
+        self.record(stage, document, time.perf_counter() - start, output_size(outputs))
+
+    def flush(self):
+        """Write the buffered records."""
+        if self.pending:
+            with self.connection:
+                self.connection.executemany(
+                    'INSERT INTO timings (recorded_at, stage, document, seconds, output_bytes) '
+                    'VALUES (?, ?, ?, ?, ?)', self.pending)
+            self.pending = []
+
+    def close(self):
+        """Flush and close the database."""
+        self.flush()
+        self.connection.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def recent_runs(self, stage, document, limit):
+        """Return the last limit (seconds, output_bytes) records, newest first."""
+        return self.connection.execute(
+            'SELECT seconds, output_bytes FROM timings WHERE stage = ? AND document = ? '
+            'ORDER BY recorded_at DESC LIMIT ?', (stage, document, limit)).fetchall()
+
+    def expected_seconds(self, stage, document):
+        """Return the median of the document's recent durations, or None if unknown."""
+        runs = self.recent_runs(stage, document, BASELINE_RUNS)
+        if not runs:
+            return None
+        return statistics.median(seconds for seconds, _ in runs)
+
+    def longest_first(self, stage, items, document=os.path.basename):
+        """
+        Order items by expected duration, longest first.
+        Documents without history go first, since they may be the longest.
+        document maps an item to the name it is recorded under.
+        """
+        def sort_key(item):
+            expected = self.expected_seconds(stage, document(item))
+            return (expected is not None, -(expected or 0), document(item))
+        return sorted(items, key=sort_key)
+
+    def documents(self, stage=None):
+        """Return the (stage, document) pairs with history."""
+        if stage is None:
+            query = 'SELECT DISTINCT stage, document FROM timings ORDER BY stage, document'
+            return self.connection.execute(query).fetchall()
+        query = 'SELECT DISTINCT stage, document FROM timings WHERE stage = ? ORDER BY document'
+        return self.connection.execute(query, (stage,)).fetchall()
+
+
+def open_history(base_dir):
+    """Open the build history of a build tree."""
+    return BuildHistory(history_path(base_dir))
+
+
+def jump(latest, baseline, minimum=0):
+    """Return latest / baseline if it is a jump worth flagging, else None."""
+    if latest is None or not baseline or latest < minimum:
+        return None
+    ratio = latest / baseline
+    return ratio if ratio >= JUMP_THRESHOLD else None
+
+
+def format_bytes(size):
+    """Format an output size for the report."""
+    return '-' if size is None else f'{size / 1024:.0f} KB'
+
+
+def history_report(history, stage=None, runs=BASELINE_RUNS):
+    """
+    Return the report lines and the number of flagged documents.
+    Each document's latest run is compared with the median of the runs
+    before it.
+    """
+    lines = []
+    flagged = 0
+    current_stage = None
+    for doc_stage, document in history.documents(stage):
+        records = history.recent_runs(doc_stage, document, runs + 1)
+        if not records:
+            continue
+        latest_seconds, latest_bytes = records[0]
+        previous = records[1:]
+
+        if doc_stage != current_stage:
+            current_stage = doc_stage
+            lines.append(f"{doc_stage}:")
+
+        trend = ' '.join(f'{seconds:.1f}' for seconds, _ in reversed(records))
+        line = f"  {document}: {latest_seconds:.2f}s, {format_bytes(latest_bytes)} (recent: {trend})"
+
+        if previous:
+            time_jump = jump(latest_seconds, statistics.median(s for s, _ in previous),
+                             MIN_FLAGGED_SECONDS)
+            previous_sizes = [b for _, b in previous if b is not None]
+            size_jump = jump(latest_bytes, statistics.median(previous_sizes) if previous_sizes else None)
+            flags = []
+            if time_jump:
+                flags.append(f'time x{time_jump:.1f}')
+            if size_jump:
+                flags.append(f'size x{size_jump:.1f}')
+            if flags:
+                flagged += 1
+                line += f"  <-- {', '.join(flags)}"
+
+        lines.append(line)
+
+    return lines, flagged
+
+
+def main():
+    """Print the build timing report."""
+    parser = argparse.ArgumentParser(description='Show build timing trends and flag regressions.')
+    parser.add_argument('--stage', help='only report this stage (e.g. html, pdf)')
+    parser.add_argument('--runs', type=int, default=BASELINE_RUNS,
+                        help=f'number of previous runs to compare against (default: {BASELINE_RUNS})')
+    args = parser.parse_args()
+    if args.runs < 1:
+        parser.error('--runs must be at least 1')
+
+    base_dir = '/home/ubuntu/go/src/customers-docs'
+    if not os.path.exists(history_path(base_dir)):
+        print("No build history recorded yet")
+        return 0
+
+    print(f"Build history ({history_path(base_dir)})")
+    print("-" * 50)
+
+    with open_history(base_dir) as history:
+        lines, flagged = history_report(history, args.stage, args.runs)
+    for line in lines:
+        print(line)
+
+    print("-" * 50)
+    print(f"{flagged} documents flagged (last run >= {JUMP_THRESHOLD}x the median of previous runs)")
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,248 @@
+#!/usr/bin/env python3
+"""
+Script to build a static search index for the documentation portal.
+Extracts heading-aware text (including SVG diagram labels) from every page
+in docs/html and writes a sharded inverted index to docs/search, so the
+portal can answer searches in the browser without a server.
+Only pages whose content changed since the last run are re-parsed, and only
+shard files whose content changed are rewritten.
+"""
+
+import os
+import re
+import glob
+import json
+import hashlib
+import argparse
+from html.parser import HTMLParser
+
+# Number of leading characters of a term used to pick its shard
+SHARD_PREFIX_LENGTH = 2
+
+# Extra weight for terms that appear in a section heading
+HEADING_WEIGHT = 5
+
+# Common words that would only bloat the index
+STOP_WORDS = {
+    'the', 'and', 'for', 'are', 'with', 'that', 'this', 'from', 'into', 'its',
+    'was', 'were', 'been', 'be', 'is', 'it', 'of', 'on', 'or', 'to', 'in',
+    'as', 'at', 'by', 'an', 'if', 'all', 'any', 'can', 'will', 'should',
+    'must', 'may', 'not', 'our', 'we', 'you', 'your', 'they', 'their',
+}
+
+HEADING_TAGS = {'h1', 'h2', 'h3', 'h4', 'h5', 'h6'}
+SKIPPED_TAGS = {'script', 'style', 'head'}
+
+
+def tokenize(text):
+    """Split text into lowercase index terms."""
+    terms = re.findall(r'[a-z0-9]+', text.lower())
+    return [term for term in terms if len(term) > 1 and term not in STOP_WORDS]
+
+
+class SearchTextExtractor(HTMLParser):
+    """
+    Collect the text of an HTML page split into sections at each heading.
+    Text inside inline SVG diagrams is kept so diagram labels are searchable.
+    """
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.title = ''
+        self.sections = []
+        self.skip_depth = 0
+        self.in_title = False
+        self.heading_tag = None
+        self.heading_parts = []
+        self.heading_anchor = ''
+        self.start_section('', '')
+
+    def start_section(self, heading, anchor):
+        self.sections.append({'heading': heading, 'anchor': anchor, 'text': []})
+
+    def handle_starttag(self, tag, attrs):
+        if tag == 'title':
+            self.in_title = True
+        elif tag in SKIPPED_TAGS:
+            self.skip_depth += 1
+        elif tag in HEADING_TAGS and self.heading_tag is None:
+            self.heading_tag = tag
+            self.heading_parts = []
+            self.heading_anchor = dict(attrs).get('id') or ''
+
+    def handle_endtag(self, tag):
+        if tag == 'title':
+            self.in_title = False
+        elif tag in SKIPPED_TAGS:
+            self.skip_depth = max(self.skip_depth - 1, 0)
+        elif tag == self.heading_tag:
+            heading = ' '.join(''.join(self.heading_parts).split())
+            self.start_section(heading, self.heading_anchor)
+            self.heading_tag = None
+
+    def handle_data(self, data):
+        if self.in_title:
+            self.title += data
+        elif self.skip_depth:
+            return
+        elif self.heading_tag:
+            self.heading_parts.append(data)
+        else:
+            self.sections[-1]['text'].append(data)
+
+
+def extract_page(html_content):
+    """
+    Extract the title and sections of a page.
+    Each section carries its heading, anchor and term counts.
+    """
+    extractor = SearchTextExtractor()
+    extractor.feed(html_content)
+    extractor.close()
+
+    sections = []
+    for section in extractor.sections:
+        terms = {}
+        for term in tokenize(' '.join(section['text'])):
+            terms[term] = terms.get(term, 0) + 1
+        for term in tokenize(section['heading']):
+            terms[term] = terms.get(term, 0) + HEADING_WEIGHT
+        if not terms:
+            continue
+        sections.append({
+            'heading': section['heading'],
+            'anchor': section['anchor'],
+            'terms': terms,
+        })
+
+    return {'title': ' '.join(extractor.title.split()), 'sections': sections}
+
+
+def load_cache(cache_path):
+    """Load the per-page extraction cache."""
+    if not os.path.exists(cache_path):
+        return {}
+    try:
+        with open(cache_path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def write_if_changed(path, content):
+    """Write content to path unless the file already holds exactly that."""
+    if os.path.exists(path):
+        with open(path, 'r', encoding='utf-8') as f:
+            if f.read() == content:
+                return False
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write(content)
+    return True
+
+
+def shard_key(term):
+    """Return the shard a term belongs to."""
+    return term[:SHARD_PREFIX_LENGTH]
+
+
+def build_index(pages):
+    """
+    Build the document table and the sharded inverted index.
+    pages maps page filename to its extracted data. Postings are
+    [doc_number, section_number, weight] lists.
+    """
+    docs = []
+    shards = {}
+
+    for doc_number, filename in enumerate(sorted(pages)):
+        page = pages[filename]
+        docs.append({
+            'file': filename,
+            'title': page['title'],
+            'sections': [[section['heading'], section['anchor']] for section in page['sections']],
+        })
+        for section_number, section in enumerate(page['sections']):
+            for term, weight in section['terms'].items():
+                shard = shards.setdefault(shard_key(term), {})
+                shard.setdefault(term, []).append([doc_number, section_number, weight])
+
+    return docs, shards
+
+
+def build_search_index(html_dir, search_dir, cache_path):
+    """
+    Update the search index for all pages in html_dir.
+    Returns (pages_parsed, shards_written).
+    """
+    os.makedirs(search_dir, exist_ok=True)
+    os.makedirs(os.path.dirname(cache_path), exist_ok=True)
+
+    cache = load_cache(cache_path)
+    html_files = [f for f in sorted(glob.glob(os.path.join(html_dir, '*.html')))
+                  if not f.endswith('index.html')]
+
+    pages = {}
+    parsed = 0
+    for html_path in html_files:
+        filename = os.path.basename(html_path)
+        with open(html_path, 'rb') as f:
+            raw = f.read()
+        digest = hashlib.sha256(raw).hexdigest()
+
+        cached = cache.get(filename)
+        if cached and cached.get('hash') == digest:
+            pages[filename] = cached
+            continue
+
+        print(f"  Indexing: {filename}")
+        page = extract_page(raw.decode('utf-8'))
+        page['hash'] = digest
+        pages[filename] = page
+        parsed += 1
+
+    docs, shards = build_index(pages)
+
+    written = 0
+    if write_if_changed(os.path.join(search_dir, 'docs.json'),
+                        json.dumps({'shard_prefix_length': SHARD_PREFIX_LENGTH, 'docs': docs},
+                                   separators=(',', ':'), sort_keys=True)):
+        written += 1
+
+    for key, terms in shards.items():
+        shard_path = os.path.join(search_dir, f'terms_{key}.json')
+        if write_if_changed(shard_path, json.dumps(terms, separators=(',', ':'), sort_keys=True)):
+            written += 1
+
+    # Drop shards for prefixes that no longer occur
+    for shard_path in glob.glob(os.path.join(search_dir, 'terms_*.json')):
+        key = os.path.basename(shard_path)[len('terms_'):-len('.json')]
+        if key not in shards:
+            os.unlink(shard_path)
+            written += 1
+
+    with open(cache_path, 'w', encoding='utf-8') as f:
+        json.dump(pages, f, separators=(',', ':'))
+
+    return parsed, written
+
+
+def main():
+    """Main function to build the portal search index."""
+    parser = argparse.ArgumentParser(description='Build the portal search index from docs/html.')
+    parser.parse_args()
+
+    base_dir = '/home/ubuntu/go/src/customers-docs'
+    html_dir = os.path.join(base_dir, 'docs/html')
+    search_dir = os.path.join(base_dir, 'docs/search')
+    cache_path = os.path.join(base_dir, '.build_cache/search_index.json')
+
+    print(f"Building search index for {html_dir}")
+    print("-" * 50)
+
+    parsed, written = build_search_index(html_dir, search_dir, cache_path)
+
+    print("-" * 50)
+    print(f"Parsed {parsed} changed pages, wrote {written} index files")
+
+if __name__ == '__main__':
+    main()
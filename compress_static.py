@@ -0,0 +1,184 @@
+#!/usr/bin/env python3
+"""
+Script to minify and pre-compress the static documentation output.
+Collapses whitespace in the generated HTML (leaving <pre>, <textarea> and
+<script> blocks untouched) and writes .gz and .br siblings for every HTML
+and SVG file at maximum compression level, for static servers that serve
+pre-compressed files (e.g. nginx gzip_static/brotli_static).
+A manifest of content hashes means unchanged files are not recompressed.
+"""
+
+import os
+import re
+import glob
+import gzip
+import json
+import hashlib
+import argparse
+
+import diagram_store
+
+# Blocks whose whitespace is significant and must be kept verbatim
+PRESERVED_BLOCK_PATTERN = re.compile(
+    r'(<pre\b.*?</pre>|<textarea\b.*?</textarea>|<script\b.*?</script>)',
+    flags=re.DOTALL | re.IGNORECASE
+)
+
+# HTML comments, except conditional comments
+COMMENT_PATTERN = re.compile(r'<!--(?!\[if).*?-->', flags=re.DOTALL)
+
+
+def minify_html(html_content):
+    """
+    Collapse whitespace in HTML outside preserved blocks.
+    Runs containing a newline become a single newline, other runs a single
+    space, so inline spacing and rendering are unchanged.
+    """
+    parts = PRESERVED_BLOCK_PATTERN.split(html_content)
+
+    for i in range(0, len(parts), 2):
+        part = COMMENT_PATTERN.sub('', parts[i])
+        part = re.sub(r'\s*\n\s*', '\n', part)
+        part = re.sub(r'[ \t\r\f\v]+', ' ', part)
+        parts[i] = part
+
+    return ''.join(parts).strip() + '\n'
+
+
+def compress_brotli(data):
+    """Return brotli-compressed data, or None when brotli is not installed."""
+    try:
+        import brotli
+    except ImportError:
+        return None
+    return brotli.compress(data, quality=11)
+
+
+def write_compressed_siblings(path, data):
+    """
+    Write path.gz and path.br for data.
+    Returns (gzip_size, brotli_size); brotli_size is None when unavailable.
+    """
+    gz_data = gzip.compress(data, compresslevel=9, mtime=0)
+    with open(path + '.gz', 'wb') as f:
+        f.write(gz_data)
+
+    br_data = compress_brotli(data)
+    if br_data is not None:
+        with open(path + '.br', 'wb') as f:
+            f.write(br_data)
+
+    return len(gz_data), len(br_data) if br_data is not None else None
+
+
+def load_manifest(manifest_path):
+    """Load the compression manifest."""
+    if not os.path.exists(manifest_path):
+        return {}
+    try:
+        with open(manifest_path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def siblings_exist(path, want_brotli):
+    """Check that the compressed siblings of path are present."""
+    if not os.path.exists(path + '.gz'):
+        return False
+    return not want_brotli or os.path.exists(path + '.br')
+
+
+def process_file(path, manifest, minify, want_brotli):
+    """
+    Minify (HTML only) and compress a single file.
+    Returns the manifest entry, or None if the file was unchanged.
+    """
+    with open(path, 'rb') as f:
+        data = f.read()
+
+    digest = hashlib.sha256(data).hexdigest()
+    entry = manifest.get(path)
+    if entry and entry['hash'] == digest and siblings_exist(path, want_brotli):
+        return None
+
+    if minify:
+        minified = minify_html(data.decode('utf-8')).encode('utf-8')
+        if minified != data:
+            data = minified
+            with open(path, 'wb') as f:
+                f.write(data)
+            digest = hashlib.sha256(data).hexdigest()
+
+    gz_size, br_size = write_compressed_siblings(path, data)
+    return {'hash': digest, 'size': len(data), 'gzip': gz_size, 'brotli': br_size}
+
+
+def list_html_files(docs_dir):
+    """
+    Return the HTML files of the docs output: the pages in docs_dir and
+    everything under docs_dir/html, including the split section pages in
+    html/<document>/.
+    """
+    html_files = glob.glob(os.path.join(docs_dir, '*.html'))
+    for dirpath, _, filenames in os.walk(os.path.join(docs_dir, 'html')):
+        html_files.extend(os.path.join(dirpath, name) for name in filenames if name.endswith('.html'))
+    return sorted(html_files)
+
+
+def compress_static(docs_dir, manifest_path):
+    """
+    Minify and compress all HTML and SVG files under docs_dir.
+    Returns (files_processed, files_skipped).
+    """
+    os.makedirs(os.path.dirname(manifest_path), exist_ok=True)
+    manifest = load_manifest(manifest_path)
+    want_brotli = compress_brotli(b'') is not None
+    if not want_brotli:
+        print("  Warning: brotli is not installed, writing .gz files only (pip install brotli)")
+
+    html_files = list_html_files(docs_dir)
+    svg_files = diagram_store.list_svg_files(os.path.join(docs_dir, 'images'))
+
+    processed = 0
+    skipped = 0
+    for path, minify in [(f, True) for f in html_files] + [(f, False) for f in svg_files]:
+        entry = process_file(path, manifest, minify, want_brotli)
+        if entry is None:
+            skipped += 1
+            continue
+
+        manifest[path] = entry
+        processed += 1
+        br_report = f", br {entry['brotli'] / 1024:.1f} KB" if entry['brotli'] is not None else ''
+        print(f"  {os.path.relpath(path, docs_dir)}: {entry['size'] / 1024:.1f} KB, gz {entry['gzip'] / 1024:.1f} KB{br_report}")
+
+    # Forget files that no longer exist
+    for path in [p for p in manifest if not os.path.exists(p)]:
+        del manifest[path]
+
+    with open(manifest_path, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, indent=1, sort_keys=True)
+
+    return processed, skipped
+
+
+def main():
+    """Main function to minify and compress the static docs output."""
+    parser = argparse.ArgumentParser(description='Minify HTML and write .gz/.br siblings of the docs output.')
+    parser.parse_args()
+
+    base_dir = '/home/ubuntu/go/src/customers-docs'
+    docs_dir = os.path.join(base_dir, 'docs')
+    manifest_path = os.path.join(base_dir, '.build_cache/compress_manifest.json')
+
+    print(f"Compressing static output in {docs_dir}")
+    print("-" * 50)
+
+    processed, skipped = compress_static(docs_dir, manifest_path)
+
+    print("-" * 50)
+    print(f"Compressed {processed} files, {skipped} unchanged")
+
+if __name__ == '__main__':
+    main()
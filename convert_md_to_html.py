@@ -2,13 +2,31 @@
 """
 Script to convert Markdown files to HTML with Mermaid diagrams rendered as SVG.
 Uses pandoc for markdown conversion and mmdc for mermaid rendering.
+With --split, each document is also written as a set of section pages
+(one per <h2>) with a shared navigation sidebar and prev/next links.
 """
 
 import os
 import re
 import subprocess
-import tempfile
+import codecs
 import glob
+import argparse
+
+import diagram_store
+import diagram_offsets
+import md_index
+import sharding
+import build_history
+
+# Seconds a single pandoc conversion may take
+PANDOC_TIMEOUT = 60
+
+# Files to convert, relative to the repository root (the renamed _dt files)
+SOURCE_FILES = [
+    'securaa-sdlc-process.md',
+    'SECURAA_SECURE_CODING_POLICY.md',
+]
 
 # HTML template with styling
 HTML_TEMPLATE = '''<!DOCTYPE html>
@@ -163,10 +181,89 @@ HTML_TEMPLATE = '''<!DOCTYPE html>
 </html>
 '''
 
+# Extra CSS added to the page's own stylesheet for split section pages
+SECTION_STYLE = '''
+        body {
+            max-width: 1300px;
+        }
+
+        .section-layout {
+            display: grid;
+            grid-template-columns: 260px minmax(0, 1fr);
+            gap: 30px;
+        }
+
+        .section-nav {
+            position: sticky;
+            top: 20px;
+            align-self: start;
+            max-height: calc(100vh - 40px);
+            overflow-y: auto;
+            font-size: 0.9em;
+        }
+
+        .section-nav a {
+            color: #34495e;
+            text-decoration: none;
+        }
+
+        .section-nav a.current {
+            color: #3498db;
+            font-weight: 600;
+        }
+
+        .section-pager {
+            display: flex;
+            justify-content: space-between;
+            margin-top: 40px;
+            padding-top: 20px;
+            border-top: 2px solid #ecf0f1;
+        }
+
+        .section-pager a {
+            color: #3498db;
+            text-decoration: none;
+        }
+
+        @media (max-width: 800px) {
+            .section-layout {
+                grid-template-columns: 1fr;
+            }
+
+            .section-nav {
+                position: static;
+            }
+        }
+'''
+
+# Body of a split section page
+SECTION_BODY_TEMPLATE = '''<body>
+    {header}
+    <div class="section-layout">
+        <nav class="section-nav">
+            <ol>
+                {nav}
+            </ol>
+        </nav>
+        <main>
+{content}
+            <div class="section-pager">
+                <span>{prev_link}</span>
+                <span>{next_link}</span>
+            </div>
+        </main>
+    </div>
+</body>
+</html>
+'''
+
 def extract_mermaid_blocks(md_content):
-    """Extract mermaid code blocks from markdown content."""
-    pattern = r'```mermaid\s*(.*?)```'
-    return list(re.finditer(pattern, md_content, flags=re.DOTALL))
+    """
+    Extract mermaid code blocks from markdown content.
+    Returns the diagram entries of the document's structural index, each
+    with the block's 'start'/'end' offsets, its 'code' and store 'key'.
+    """
+    return md_index.scan_markdown(md_content)['diagrams']
 
 def render_mermaid_to_svg(mermaid_code, output_path):
     """Check if SVG exists, or skip rendering since mmdc has issues."""
@@ -182,23 +279,135 @@ def read_svg_content(svg_path):
     with open(svg_path, 'r', encoding='utf-8') as f:
         return f.read()
 
-def convert_md_to_html(md_path, html_dir, images_dir):
-    """Convert a markdown file to HTML with rendered mermaid diagrams."""
+def section_dir_for(html_path):
+    """Return the directory that holds the split section pages of a document."""
+    return os.path.splitext(html_path)[0]
+
+def section_filename(number):
+    """Return the file name of a section page."""
+    return f'section_{number}.html'
+
+def split_html_sections(content, default_title):
+    """
+    Split page content at each <h2>.
+    Returns a list of (title, html) tuples; content before the first <h2>
+    becomes an introductory section titled default_title.
+    """
+    starts = [m.start() for m in re.finditer(r'<h2\b', content)]
+    bounds = [0] + starts + [len(content)]
+
+    sections = []
+    for start, end in zip(bounds, bounds[1:]):
+        section_html = content[start:end]
+        if not section_html.strip():
+            continue
+        heading = re.match(r'<h2\b[^>]*>(.*?)</h2>', section_html, flags=re.DOTALL)
+        title = re.sub(r'<[^>]+>', '', heading.group(1)).strip() if heading else default_title
+        sections.append((title, section_html))
+
+    return sections
+
+def write_section_pages(html_path):
+    """
+    Write the section pages for a generated HTML document.
+    Each page keeps the document's head and header, carries only its own
+    section (and so only its own diagrams), and links to every other section.
+    Returns the number of section pages written.
+    """
+    with open(html_path, 'r', encoding='utf-8') as f:
+        html_content = f.read()
+
+    head, _, body = html_content.partition('<body>')
+    head = head.replace('</style>', SECTION_STYLE + '    </style>', 1)
+    body = body.rsplit('</body>', 1)[0]
+
+    title_match = re.search(r'<title>(.*?)</title>', head, flags=re.DOTALL)
+    doc_title = title_match.group(1).strip() if title_match else os.path.basename(html_path)
+
+    header = ''
+    header_match = re.search(r'<div class="header-section">.*?</div>', body, flags=re.DOTALL)
+    if header_match:
+        header = header_match.group(0)
+        body = body[header_match.end():]
+
+    sections = split_html_sections(body, doc_title)
+
+    # Map every anchor to the page it ends up on so in-document links still work
+    anchor_pages = {}
+    for number, (_, section_html) in enumerate(sections, 1):
+        for anchor in re.findall(r'<h[1-6][^>]*\bid="([^"]+)"', section_html):
+            anchor_pages[anchor] = number
+
+    sections_dir = section_dir_for(html_path)
+    os.makedirs(sections_dir, exist_ok=True)
+
+    for number, (title, section_html) in enumerate(sections, 1):
+        def fix_anchor_link(match):
+            page = anchor_pages.get(match.group(2))
+            if page is None or page == number:
+                return match.group(0)
+            return f'{match.group(1)}{section_filename(page)}#{match.group(2)}"'
+
+        section_html = re.sub(r'(<a\b[^>]*\bhref=")#([^"]+)"', fix_anchor_link, section_html)
+
+        nav = []
+        for other, (other_title, _) in enumerate(sections, 1):
+            current = ' class="current"' if other == number else ''
+            nav.append(f'<li><a href="{section_filename(other)}"{current}>{other_title}</a></li>')
+
+        prev_link = ''
+        if number > 1:
+            prev_link = f'<a href="{section_filename(number - 1)}">&larr; {sections[number - 2][0]}</a>'
+        next_link = ''
+        if number < len(sections):
+            next_link = f'<a href="{section_filename(number + 1)}">{sections[number][0]} &rarr;</a>'
+
+        page = head + SECTION_BODY_TEMPLATE.format(
+            header=header,
+            nav='\n                '.join(nav),
+            content=section_html.strip(),
+            prev_link=prev_link,
+            next_link=next_link,
+        )
+        with open(os.path.join(sections_dir, section_filename(number)), 'w', encoding='utf-8') as f:
+            f.write(page)
+
+    # Remove pages left over from a previous split with more sections
+    for stale_path in glob.glob(os.path.join(sections_dir, 'section_*.html')):
+        stale_number = os.path.basename(stale_path)[len('section_'):-len('.html')]
+        if stale_number.isdigit() and int(stale_number) > len(sections):
+            os.unlink(stale_path)
+
+    return len(sections)
+
+def prepare_markdown(md_path, images_dir, index_dir=None):
+    """
+    Read a markdown file and swap its mermaid blocks for placeholders.
+    Diagram blocks come from the document's structural index (cached in
+    index_dir when given) and are resolved through the diagram store.
+    Returns (basename, modified_md, svg_contents, diagram_keys).
+    """
     basename = os.path.basename(md_path).replace('.md', '')
-    html_path = os.path.join(html_dir, f'{basename}.html')
 
     print(f"Converting: {basename}.md")
 
-    with open(md_path, 'r', encoding='utf-8') as f:
-        md_content = f.read()
+    md_content, index = md_index.load_index(md_path, index_dir)
 
     # Extract and render mermaid blocks
-    mermaid_blocks = extract_mermaid_blocks(md_content)
+    mermaid_blocks = index['diagrams']
     svg_contents = []
+    diagram_keys = []
+
+    for i, block in enumerate(mermaid_blocks, 1):
+        mermaid_code = block['code']
+        key = block['key']
+        svg_path = diagram_store.blob_path(images_dir, key)
+        diagram_keys.append(key)
 
-    for i, match in enumerate(mermaid_blocks, 1):
-        mermaid_code = match.group(1).strip()
-        svg_path = os.path.join(images_dir, f'{basename}_diagram_{i}.svg')
+        # Adopt a diagram rendered before the store existed
+        legacy_path = diagram_store.legacy_diagram_path(images_dir, basename, i)
+        if not os.path.exists(svg_path) and os.path.exists(legacy_path):
+            diagram_store.store_svg(images_dir, key, legacy_path)
 
         print(f"  Rendering diagram {i}...")
         if render_mermaid_to_svg(mermaid_code, svg_path):
@@ -207,67 +416,180 @@ def convert_md_to_html(md_path, html_dir, images_dir):
         else:
             svg_contents.append(f'<p>Diagram {i} failed to render</p>')
 
-    # Replace mermaid blocks with placeholders
+    modified_md = replace_diagram_blocks(md_content, mermaid_blocks)
+    return basename, modified_md, svg_contents, diagram_keys
+
+def replace_diagram_blocks(md_content, mermaid_blocks):
+    """Replace the mermaid blocks of markdown text with numbered diagram placeholders."""
     modified_md = md_content
-    for i, match in enumerate(reversed(mermaid_blocks)):
+    for i, block in enumerate(reversed(mermaid_blocks)):
         placeholder = f'DIAGRAM_PLACEHOLDER_{len(mermaid_blocks) - i}'
-        modified_md = modified_md[:match.start()] + placeholder + modified_md[match.end():]
-
-    # Convert to HTML using pandoc
-    with tempfile.NamedTemporaryFile(mode='w', suffix='.md', delete=False) as f:
-        f.write(modified_md)
-        temp_md = f.name
-
-    try:
-        result = subprocess.run(
-            ['pandoc', temp_md, '-f', 'gfm', '-t', 'html'],
-            capture_output=True,
-            text=True,
-            timeout=60
-        )
-        html_content = result.stdout
-    finally:
-        os.unlink(temp_md)
+        modified_md = modified_md[:block['start']] + placeholder + modified_md[block['end']:]
+    return modified_md
+
+def build_html_page(basename, html_content, svg_contents):
+    """Insert the diagrams into pandoc's output and wrap it in the page template."""
+    # Replace placeholders with SVG diagrams. Matched by number in one pass,
+    # since DIAGRAM_PLACEHOLDER_1 is also a prefix of DIAGRAM_PLACEHOLDER_10
+    def insert_diagram(match):
+        number = int(match.group(1) or match.group(2))
+        return f'<div class="diagram">\n{svg_contents[number - 1]}\n</div>'
 
-    # Replace placeholders with SVG diagrams
-    for i, svg_content in enumerate(svg_contents, 1):
-        placeholder = f'DIAGRAM_PLACEHOLDER_{i}'
-        diagram_html = f'<div class="diagram">\n{svg_content}\n</div>'
-        html_content = html_content.replace(f'<p>{placeholder}</p>', diagram_html)
-        html_content = html_content.replace(placeholder, diagram_html)
+    html_content = re.sub(r'<p>DIAGRAM_PLACEHOLDER_(\d+)</p>|DIAGRAM_PLACEHOLDER_(\d+)',
+                          insert_diagram, html_content)
 
     # Generate title from filename
     title = basename.replace('_', ' ').replace('-', ' ').title()
 
     # Create final HTML
-    final_html = HTML_TEMPLATE.format(title=title, content=html_content)
+    return HTML_TEMPLATE.format(title=title, content=html_content)
+
+def write_html_page(html_path, final_html, split_sections=False, offsets_dir=None):
+    """
+    Write the final HTML page and, if requested, its section pages.
+    With offsets_dir, the byte offsets of the page's diagrams are recorded
+    there for update_html_svgs.
+    """
+    page = final_html.encode('utf-8')
+    with open(html_path, 'wb') as f:
+        f.write(page)
+    diagram_offsets.record_page(offsets_dir, html_path, page)
+
+    basename = os.path.splitext(os.path.basename(html_path))[0]
+    print(f"  Created: {basename}.html")
 
-    with open(html_path, 'w', encoding='utf-8') as f:
-        f.write(final_html)
+    if split_sections:
+        count = write_section_pages(html_path)
+        print(f"  Created: {basename}/ ({count} section pages)")
 
-    print(f"  Created: {basename}.html")
+def document_outputs(md_path, html_dir, images_dir):
+    """Return the files a conversion of md_path produced: page, section pages and diagrams."""
+    basename = os.path.basename(md_path).replace('.md', '')
+    html_path = os.path.join(html_dir, f'{basename}.html')
+    section_pages = sorted(glob.glob(os.path.join(section_dir_for(html_path), 'section_*.html')))
+    diagrams = diagram_store.document_diagrams(images_dir, basename)
+    return [html_path] + section_pages + diagrams
+
+def run_pandoc(markdown):
+    """Convert GitHub-flavoured markdown to an HTML fragment with pandoc, via stdin."""
+    result = subprocess.run(
+        ['pandoc', '-f', 'gfm', '-t', 'html'],
+        input=markdown.encode('utf-8'),
+        capture_output=True,
+        timeout=PANDOC_TIMEOUT
+    )
+    return result.stdout.decode('utf-8')
+
+def convert_md_to_html(md_path, html_dir, images_dir, split_sections=False, index_dir=None,
+                       offsets_dir=None):
+    """
+    Convert a markdown file to HTML with rendered mermaid diagrams.
+    With split_sections=True, section pages are written as well.
+    """
+    basename, modified_md, svg_contents, diagram_keys = prepare_markdown(md_path, images_dir, index_dir)
+    diagram_store.record_document(images_dir, basename, diagram_keys)
+    html_path = os.path.join(html_dir, f'{basename}.html')
+
+    html_content = run_pandoc(modified_md)
+    final_html = build_html_page(basename, html_content, svg_contents)
+    write_html_page(html_path, final_html, split_sections, offsets_dir)
+    return html_path
+
+async def convert_md_to_html_async(runner, md_path, html_dir, images_dir, split_sections=False,
+                                   history=None, index_dir=None, offsets_dir=None):
+    """
+    Asynchronous variant of convert_md_to_html for use with async_runner.
+    pandoc reads the markdown from stdin, so no temporary file is needed,
+    and its output is decoded as it streams in rather than buffered as
+    bytes. Markdown preparation and page assembly are cheap string work
+    and run inline on the event loop; only the pandoc calls of different
+    documents overlap.
+    If history is given, the document's build time is recorded, counting
+    only the work itself and not the wait for a pandoc slot.
+    """
+    from async_runner import timed_call
+
+    (basename, modified_md, svg_contents, diagram_keys), prepare_seconds = timed_call(
+        prepare_markdown, md_path, images_dir, index_dir)
+    diagram_store.record_document(images_dir, basename, diagram_keys)
+    html_path = os.path.join(html_dir, f'{basename}.html')
+
+    decoder = codecs.getincrementaldecoder('utf-8')()
+    html_pieces = []
+    result = await runner.run(
+        ['pandoc', '-f', 'gfm', '-t', 'html'],
+        timeout=PANDOC_TIMEOUT,
+        input_data=modified_md.encode('utf-8'),
+        on_output=lambda chunk: html_pieces.append(decoder.decode(chunk)),
+    )
+    html_pieces.append(decoder.decode(b'', final=True))
+    html_content = ''.join(html_pieces)
+
+    final_html, build_seconds = timed_call(build_html_page, basename, html_content, svg_contents)
+    write_html_page(html_path, final_html, split_sections, offsets_dir)
+
+    if history is not None:
+        history.record('html', os.path.basename(md_path), prepare_seconds + result.elapsed + build_seconds,
+                       build_history.output_size([html_path]))
     return html_path
 
 def main():
     """Main function to convert specified markdown files."""
+    parser = argparse.ArgumentParser(description='Convert Markdown files to HTML.')
+    parser.add_argument('--split', action='store_true',
+                        help='also write one page per <h2> section with a navigation sidebar')
+    parser.add_argument('--jobs', type=int, default=1,
+                        help='number of pandoc processes to run concurrently (default: 1)')
+    sharding.add_shard_argument(parser)
+    args = parser.parse_args()
+
     base_dir = '/home/ubuntu/go/src/customers-docs'
     html_dir = os.path.join(base_dir, 'docs/html')
     images_dir = os.path.join(base_dir, 'docs/images')
+    index_dir = md_index.index_dir(base_dir)
+    offsets_dir = diagram_offsets.offsets_dir(base_dir)
 
-    # Files to convert (the renamed _dt files)
-    files_to_convert = [
-        os.path.join(base_dir, 'securaa-sdlc-process.md'),
-        os.path.join(base_dir, 'SECURAA_SECURE_CODING_POLICY.md')
-    ]
+    files_to_convert = [os.path.join(base_dir, name) for name in SOURCE_FILES]
 
     print(f"Converting {len(files_to_convert)} markdown files to HTML")
     print("-" * 50)
 
     for md_path in files_to_convert:
-        if os.path.exists(md_path):
-            convert_md_to_html(md_path, html_dir, images_dir)
-        else:
+        if not os.path.exists(md_path):
             print(f"File not found: {md_path}")
+    all_files = [f for f in files_to_convert if os.path.exists(f)]
+    files_to_convert = sharding.select_shard(
+        all_files, args.shard, cost=lambda path: sharding.markdown_cost(path, index_dir))
+
+    with build_history.open_history(base_dir) as history:
+        if args.jobs > 1:
+            from async_runner import run_all
+
+            async def convert(runner, md_path):
+                return await convert_md_to_html_async(
+                    runner, md_path, html_dir, images_dir, split_sections=args.split, history=history,
+                    index_dir=index_dir, offsets_dir=offsets_dir)
+
+            # Start the documents expected to take longest first
+            scheduled = history.longest_first('html', files_to_convert)
+            results = run_all(convert, scheduled, max_concurrency=args.jobs)
+            for md_path, result in zip(scheduled, results):
+                if isinstance(result, Exception):
+                    print(f"  Error converting {os.path.basename(md_path)}: {result}")
+        else:
+            for md_path in files_to_convert:
+                html_path = os.path.join(html_dir, os.path.basename(md_path).replace('.md', '.html'))
+                with history.measure('html', os.path.basename(md_path), [html_path]):
+                    convert_md_to_html(md_path, html_dir, images_dir, split_sections=args.split,
+                                       index_dir=index_dir, offsets_dir=offsets_dir)
+
+    if args.shard:
+        diagram_manifest = diagram_store.load_manifest(images_dir)
+        basenames = [os.path.basename(f).replace('.md', '') for f in files_to_convert]
+        sharding.write_shard_manifest(
+            base_dir, 'html', args.shard, all_files,
+            {md_path: document_outputs(md_path, html_dir, images_dir) for md_path in files_to_convert},
+            diagrams={b: diagram_manifest[b] for b in basenames if b in diagram_manifest})
 
     print("-" * 50)
     print("Conversion complete")
@@ -0,0 +1,112 @@
+"""
+Offset index of the inline diagrams of an HTML page.
+The HTML stage records where the <svg> of each <div class="diagram"> block
+starts and ends in the written page (as byte offsets), so the update-html
+stage can splice in just the diagrams that changed in one linear pass
+instead of regex-matching the whole page again. An index is only used
+while the page's size and modification time match the ones it was recorded
+for and each offset still lands on an <svg>...</svg>; otherwise the page is
+rescanned.
+"""
+
+import os
+import re
+import json
+
+OFFSETS_DIRNAME = '.build_cache/diagram_offsets'
+
+# Bump when the index format changes so stale entries are ignored
+OFFSETS_VERSION = 1
+
+DIAGRAM_BLOCK = re.compile(rb'<div class="diagram">\s*(<svg[^>]*>.*?</svg>)\s*</div>', flags=re.DOTALL)
+
+
+def offsets_dir(base_dir):
+    """Return the offset index directory of a build tree."""
+    return os.path.join(base_dir, OFFSETS_DIRNAME)
+
+
+def index_path(index_dir, html_path):
+    """Return the index file of a page."""
+    return os.path.join(index_dir, os.path.basename(html_path) + '.json')
+
+
+def scan_diagram_blocks(page):
+    """Return the (start, end) byte offsets of the <svg> of every diagram block in page."""
+    return [match.span(1) for match in DIAGRAM_BLOCK.finditer(page)]
+
+
+def save_offsets(index_dir, html_path, blocks):
+    """Record the diagram offsets of a page that was just written."""
+    stat = os.stat(html_path)
+    index = {
+        'version': OFFSETS_VERSION,
+        'path': os.path.abspath(html_path),
+        'size': stat.st_size,
+        'mtime_ns': stat.st_mtime_ns,
+        'blocks': blocks,
+    }
+    os.makedirs(index_dir, exist_ok=True)
+    path = index_path(index_dir, html_path)
+    temp_path = f'{path}.{os.getpid()}.tmp'
+    with open(temp_path, 'w', encoding='utf-8') as f:
+        json.dump(index, f)
+    os.replace(temp_path, path)
+
+
+def record_page(index_dir, html_path, page):
+    """Scan a page that was just written and record its diagram offsets."""
+    if index_dir:
+        save_offsets(index_dir, html_path, scan_diagram_blocks(page))
+
+
+def load_offsets(index_dir, html_path, page):
+    """
+    Return the recorded diagram offsets of a page, or None if there is no
+    index or it doesn't match the page as it is now.
+    """
+    try:
+        with open(index_path(index_dir, html_path), 'r', encoding='utf-8') as f:
+            index = json.load(f)
+        stat = os.stat(html_path)
+    except (OSError, ValueError):
+        return None
+    if (index.get('version') != OFFSETS_VERSION or index.get('path') != os.path.abspath(html_path)
+            or index.get('size') != stat.st_size or index.get('mtime_ns') != stat.st_mtime_ns
+            or len(page) != stat.st_size):
+        return None
+
+    blocks = [tuple(block) for block in index['blocks']]
+    for start, end in blocks:
+        if not (page.startswith(b'<svg', start) and page.endswith(b'</svg>', start, end)):
+            return None
+    return blocks
+
+
+def splice_diagrams(page, blocks, svgs):
+    """
+    Replace the diagrams at blocks with svgs (bytes), in order, skipping
+    those that are unchanged. Blocks beyond the last SVG are kept.
+    Returns (new page, new blocks, number of diagrams replaced).
+    """
+    pieces = []
+    new_blocks = []
+    last = 0
+    shift = 0
+    changed = 0
+    for (start, end), svg in zip(blocks, svgs):
+        if page[start:end] == svg:
+            new_blocks.append((start + shift, end + shift))
+            continue
+        pieces.append(page[last:start])
+        pieces.append(svg)
+        last = end
+        new_blocks.append((start + shift, start + shift + len(svg)))
+        shift += len(svg) - (end - start)
+        changed += 1
+    new_blocks.extend((start + shift, end + shift) for start, end in blocks[len(svgs):])
+
+    if not changed:
+        return page, new_blocks, 0
+    pieces.append(page[last:])
+    return b''.join(pieces), new_blocks, changed
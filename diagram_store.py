@@ -0,0 +1,194 @@
+#!/usr/bin/env python3
+"""
+Content-addressed store for rendered diagram SVGs.
+Each unique mermaid source is stored once as docs/images/store/<hash>.svg,
+where <hash> is derived from the mermaid source, so identical diagrams in
+different documents are rendered and fixed only once. A manifest
+(docs/images/manifest.json) lists each document's diagrams in order, and the
+HTML stages resolve diagrams through it.
+Documents that have not been migrated yet fall back to the legacy
+<doc>_diagram_<n>.svg files.
+"""
+
+import os
+import re
+import glob
+import json
+import fcntl
+import shutil
+import hashlib
+import argparse
+
+STORE_DIRNAME = 'store'
+MANIFEST_FILENAME = 'manifest.json'
+
+# Length of the hex digest used for blob names
+KEY_LENGTH = 16
+
+
+def source_key(mermaid_code):
+    """Return the store key for a mermaid diagram source."""
+    return hashlib.sha256(mermaid_code.strip().encode('utf-8')).hexdigest()[:KEY_LENGTH]
+
+
+def blob_path(images_dir, key):
+    """Return the path of the blob for a store key."""
+    return os.path.join(images_dir, STORE_DIRNAME, f'{key}.svg')
+
+
+def legacy_diagram_path(images_dir, basename, number):
+    """Return the path of a per-document diagram file."""
+    return os.path.join(images_dir, f'{basename}_diagram_{number}.svg')
+
+
+def legacy_diagram_files(images_dir, basename):
+    """Return a document's per-document diagram files in diagram order."""
+    pattern = re.compile(re.escape(basename) + r'_diagram_(\d+)\.svg$')
+    numbered = []
+    for path in glob.glob(os.path.join(images_dir, f'{glob.escape(basename)}_diagram_*.svg')):
+        match = pattern.search(os.path.basename(path))
+        if match:
+            numbered.append((int(match.group(1)), path))
+    # Sort numerically so diagram_10 comes after diagram_9, not after diagram_1
+    return [path for _, path in sorted(numbered)]
+
+
+def legacy_documents(images_dir):
+    """Return the names of the documents that have per-document diagram files."""
+    pattern = re.compile(r'(.+)_diagram_\d+\.svg$')
+    names = set()
+    for path in glob.glob(os.path.join(images_dir, '*_diagram_*.svg')):
+        match = pattern.match(os.path.basename(path))
+        if match:
+            names.add(match.group(1))
+    return sorted(names)
+
+
+def load_manifest(images_dir):
+    """Load the document -> diagram keys manifest."""
+    manifest_path = os.path.join(images_dir, MANIFEST_FILENAME)
+    if not os.path.exists(manifest_path):
+        return {}
+    with open(manifest_path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def save_manifest(images_dir, manifest):
+    """Write the manifest atomically, so readers never see a partial file."""
+    manifest_path = os.path.join(images_dir, MANIFEST_FILENAME)
+    temp_path = f'{manifest_path}.{os.getpid()}.tmp'
+    with open(temp_path, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+        f.write('\n')
+    os.replace(temp_path, manifest_path)
+
+
+def record_document(images_dir, basename, keys):
+    """
+    Record the ordered diagram keys of a document in the manifest.
+    Holds a lock while updating, since sharded builds running as separate
+    processes on one machine update the same manifest.
+    """
+    os.makedirs(images_dir, exist_ok=True)
+    with open(os.path.join(images_dir, MANIFEST_FILENAME + '.lock'), 'w') as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        manifest = load_manifest(images_dir)
+        if manifest.get(basename) != keys:
+            manifest[basename] = keys
+            save_manifest(images_dir, manifest)
+
+
+def store_svg(images_dir, key, svg_path):
+    """Copy an existing SVG into the store under key unless already stored."""
+    target = blob_path(images_dir, key)
+    if not os.path.exists(target):
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        shutil.copyfile(svg_path, target)
+    return target
+
+
+def document_diagrams(images_dir, basename):
+    """
+    Return the SVG files of a document in diagram order.
+    Uses the manifest when the document is recorded there, otherwise the
+    legacy per-document files. Diagrams that failed to render are recorded
+    in the manifest but have no blob; they are skipped, as they have no
+    inline SVG in the page either.
+    """
+    keys = load_manifest(images_dir).get(basename)
+    if keys is not None:
+        paths = [blob_path(images_dir, key) for key in keys]
+        return [path for path in paths if os.path.exists(path)]
+    return legacy_diagram_files(images_dir, basename)
+
+
+def list_svg_files(images_dir):
+    """Return every SVG to process: store blobs plus any legacy files."""
+    return sorted(glob.glob(os.path.join(images_dir, '*.svg')) +
+                  glob.glob(os.path.join(images_dir, STORE_DIRNAME, '*.svg')))
+
+
+def migrate_document(md_path, images_dir, prune=False):
+    """
+    Move a document's legacy diagram files into the store.
+    Returns (diagrams, newly_stored), or None if the document's diagrams
+    don't line up with its mermaid blocks.
+    """
+    from convert_md_to_html import extract_mermaid_blocks
+
+    basename = os.path.basename(md_path).replace('.md', '')
+    with open(md_path, 'r', encoding='utf-8') as f:
+        blocks = extract_mermaid_blocks(f.read())
+
+    legacy_files = legacy_diagram_files(images_dir, basename)
+    if len(legacy_files) != len(blocks):
+        print(f"  Skipping {basename}: {len(blocks)} mermaid blocks but {len(legacy_files)} SVG files")
+        return None
+
+    keys = []
+    stored = 0
+    for block, svg_path in zip(blocks, legacy_files):
+        key = block['key']
+        if not os.path.exists(blob_path(images_dir, key)):
+            stored += 1
+        store_svg(images_dir, key, svg_path)
+        keys.append(key)
+
+    record_document(images_dir, basename, keys)
+
+    if prune:
+        for svg_path in legacy_files:
+            os.unlink(svg_path)
+
+    return len(keys), stored
+
+
+def main():
+    """Migrate legacy per-document diagram files into the store."""
+    parser = argparse.ArgumentParser(description='Move diagram SVGs into the content-addressed store.')
+    parser.add_argument('--prune', action='store_true',
+                        help='delete the legacy <doc>_diagram_<n>.svg files after migrating')
+    args = parser.parse_args()
+
+    base_dir = '/home/ubuntu/go/src/customers-docs'
+    images_dir = os.path.join(base_dir, 'docs/images')
+    md_files = sorted(glob.glob(os.path.join(base_dir, 'source', '*', '*.md')))
+
+    print(f"Migrating diagrams for {len(md_files)} documents")
+    print("-" * 50)
+
+    total = 0
+    unique = 0
+    for md_path in md_files:
+        result = migrate_document(md_path, images_dir, prune=args.prune)
+        if result is None:
+            continue
+        total += result[0]
+        unique += result[1]
+        print(f"  {os.path.basename(md_path)}: {result[0]} diagrams, {result[1]} new blobs")
+
+    print("-" * 50)
+    print(f"Stored {unique} new blobs for {total} diagrams")
+
+if __name__ == '__main__':
+    main()
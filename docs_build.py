@@ -0,0 +1,66 @@
+#!/usr/bin/env python3
+"""
+docs-build: single entry point for the documentation build scripts.
+Each subcommand runs the main() of one stage script. Stage modules are
+imported only when their subcommand runs, and heavy dependencies
+(WeasyPrint, pikepdf, brotli) are imported inside the stages that use them,
+so commands that don't render PDFs start quickly.
+"""
+
+import sys
+import argparse
+import importlib
+
+# Subcommand -> (module, description)
+COMMANDS = {
+    'build': ('pipeline', 'Run the html, SVG fix, update-html and pdf stages in one in-memory pass'),
+    'html': ('convert_md_to_html', 'Convert Markdown sources to HTML with inline diagrams'),
+    'migrate-diagrams': ('diagram_store', 'Move diagram SVGs into the content-addressed store'),
+    'fix-svg-text': ('fix_svg_text', 'Convert foreignObject labels in SVGs to native text'),
+    'fix-svg-colors': ('fix_all_svg_text', 'Fix text colors in colored SVG nodes'),
+    'fix-ha-dr-colors': ('fix_svg_text_colors', 'Fix text colors in the HA/DR dt3 diagrams'),
+    'update-html': ('update_html_svgs', 'Replace inline SVGs in HTML with the fixed versions'),
+    'pdf': ('regenerate_pdfs', 'Render PDFs from the HTML documents'),
+    'optimize-pdf': ('optimize_pdfs', 'Compress, dedupe and optionally linearize PDFs'),
+    'previews': ('previews', 'Render page and diagram previews into the portal index'),
+    'search-index': ('build_search_index', 'Build the portal search index'),
+    'compress': ('compress_static', 'Minify HTML and write .gz/.br siblings'),
+    'merge-shards': ('sharding', 'Merge and verify the outputs of a sharded stage'),
+    'budgets': ('budgets', 'Check diagrams, pages and PDF times against performance budgets'),
+    'history': ('build_history', 'Show build timing trends and flag regressions'),
+    'serve': ('serve', 'Serve the docs locally, building pages and PDFs on request'),
+    'snapshot': ('snapshot', 'Snapshot output hashes or compare outputs with a snapshot'),
+}
+
+
+def build_parser():
+    """Build the top-level argument parser."""
+    width = max(len(name) for name in COMMANDS)
+    listing = '\n'.join(f'  {name:<{width}}  {description}'
+                        for name, (_, description) in COMMANDS.items())
+    parser = argparse.ArgumentParser(
+        prog='docs-build',
+        description='Build the SECURAA customer documentation.',
+        epilog=f'commands:\n{listing}\n\nRun "docs-build <command> --help" for command options.',
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+    )
+    parser.add_argument('command', choices=COMMANDS, metavar='command',
+                        help='build stage to run (see below)')
+    return parser
+
+
+def main(argv=None):
+    """Dispatch to the requested build stage."""
+    argv = sys.argv[1:] if argv is None else list(argv)
+    parser = build_parser()
+    args = parser.parse_args(argv[:1])
+
+    module_name = COMMANDS[args.command][0]
+    module = importlib.import_module(module_name)
+
+    # Stage scripts parse sys.argv themselves
+    sys.argv = [f'docs-build {args.command}'] + argv[1:]
+    return module.main()
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,108 @@
+"""
+In-memory API to the documentation build, for embedding it in a service.
+DocsLibrary converts markdown text to a finished HTML page, fixes diagram
+SVGs and renders HTML to PDF bytes without writing any build files. State
+that is costly to set up is loaded once per instance: the diagram
+manifest, each stored diagram (read and fixed on first use), and
+WeasyPrint with the parsed PDF stylesheet. All methods may be called
+concurrently from threads; PDF layout runs one document at a time, as
+WeasyPrint is not documented to be thread-safe.
+The stage scripts and the pipeline are not wrappers around this class:
+they keep their own orchestration (diagram store updates, build history,
+memory-capped PDF workers) and only share the individual steps with it:
+replace_diagram_blocks, run_pandoc, build_html_page, fix_diagram and
+render_pdf_bytes. A change to the order of those steps has to be made
+here and in convert_md_to_html / pipeline alike.
+"""
+
+import os
+import threading
+
+import diagram_store
+import md_index
+from convert_md_to_html import replace_diagram_blocks, run_pandoc, build_html_page
+from fix_svg_text import convert_foreignobject_to_text
+from fix_all_svg_text import fix_svg_text_in_colored_nodes
+from fix_svg_text_colors import HA_DR_DOCUMENT, fix_text_colors_in_svg
+from update_html_svgs import fix_svg_dimensions
+
+
+def fix_diagram(svg_content, ha_dr):
+    """Apply the SVG fix stages, in stage order, to one diagram."""
+    if '<foreignObject' in svg_content:
+        svg_content = convert_foreignobject_to_text(svg_content)
+    svg_content = fix_svg_text_in_colored_nodes(svg_content)
+    if ha_dr:
+        svg_content = fix_text_colors_in_svg(svg_content)
+    return svg_content
+
+
+class DocsLibrary:
+    """
+    Markdown -> HTML -> PDF conversion in memory.
+    images_dir is the diagram store the markdown's mermaid blocks are
+    resolved from; base_url is where the PDF renderer resolves relative
+    links, as docs/html does for the pdf stage.
+    """
+
+    def __init__(self, images_dir, base_url=None):
+        self.images_dir = images_dir
+        self.base_url = base_url
+        self.ha_dr_keys = set(diagram_store.load_manifest(images_dir).get(HA_DR_DOCUMENT, []))
+
+        # (key, ha_dr) -> page-ready SVG, or None if the store doesn't have it
+        self.diagrams = {}
+        self.diagram_lock = threading.Lock()
+
+        self.stylesheets = None
+        self.pdf_lock = threading.Lock()
+
+    def fix_svg(self, svg_content, ha_dr=False):
+        """Return an SVG diagram with the SVG fix stages applied."""
+        return fix_diagram(svg_content, ha_dr)
+
+    def diagram(self, key, ha_dr=False):
+        """Return the fixed, page-ready SVG of a stored diagram, or None if it isn't stored."""
+        with self.diagram_lock:
+            if (key, ha_dr) in self.diagrams:
+                return self.diagrams[(key, ha_dr)]
+
+        svg_path = diagram_store.blob_path(self.images_dir, key)
+        svg_content = None
+        if os.path.exists(svg_path):
+            with open(svg_path, 'r', encoding='utf-8') as f:
+                svg_content = f.read()
+            svg_content = fix_svg_dimensions(self.fix_svg(svg_content, ha_dr))
+
+        with self.diagram_lock:
+            return self.diagrams.setdefault((key, ha_dr), svg_content)
+
+    def markdown_to_html(self, markdown, name):
+        """
+        Convert markdown text to the final HTML page of a document called
+        name, with its mermaid diagrams inlined from the store.
+        """
+        blocks = md_index.scan_markdown(markdown)['diagrams']
+        svg_contents = []
+        for i, block in enumerate(blocks, 1):
+            ha_dr = name == HA_DR_DOCUMENT or block['key'] in self.ha_dr_keys
+            svg_content = self.diagram(block['key'], ha_dr)
+            svg_contents.append(svg_content if svg_content is not None
+                                else f'<p>Diagram {i} failed to render</p>')
+
+        html_content = run_pandoc(replace_diagram_blocks(markdown, blocks))
+        return build_html_page(name, html_content, svg_contents)
+
+    def html_to_pdf(self, html_content):
+        """Render an HTML page to PDF and return the PDF bytes."""
+        from regenerate_pdfs import PDF_STYLESHEET, import_weasyprint, render_pdf_bytes
+
+        with self.pdf_lock:
+            if self.stylesheets is None:
+                weasyprint = import_weasyprint()
+                self.stylesheets = [weasyprint.CSS(string=PDF_STYLESHEET)]
+            return render_pdf_bytes(html_content, self.base_url, self.stylesheets)
+
+    def markdown_to_pdf(self, markdown, name):
+        """Convert markdown text straight to PDF bytes."""
+        return self.html_to_pdf(self.markdown_to_html(markdown, name))
@@ -8,68 +8,41 @@ Fixes text visibility issues in SVG diagrams by:
 
 import os
 import re
-import glob
-
-def fix_svg_text_in_colored_nodes(svg_content, filename):
+import argparse
+
+import diagram_store
+import sharding
+import build_history
+from prescreen import find_markers, matches_pattern
+from node_colors import fix_node_text
+
+# Fills of rects whose following text label needs to be white
+COLORED_RECT_FILLS = ['4169e1', '10b981', '6b7280', 'f59e0b', 'ef4444']
+
+# Byte markers used to pre-screen files before decoding them
+COLORED_MARKERS = [fill.encode() for fill in COLORED_RECT_FILLS] + [
+    fill.upper().encode() for fill in COLORED_RECT_FILLS]
+NODE_MARKERS = [b'class="node', b'class="cluster']
+DARK_TEXT_MARKERS = [b'#333']
+SECTION_MARKER = b'.section-'
+
+# A colored rect directly followed by text that is not yet white
+UNFIXED_COLORED_RECT = re.compile(
+    rb'<rect[^>]*fill="#(?:' + '|'.join(COLORED_RECT_FILLS).encode() + rb')"[^>]*/>\s*<text(?![^>]*fill="white")',
+    flags=re.IGNORECASE
+)
+
+# A mindmap section text rule whose fill is not yet !important
+UNFIXED_SECTION_RULE = re.compile(rb'\.section--?\d+\s+text\s*\{[^}]*fill:[^;!}]*[^;!}\s]\s*[;}]')
+
+def fix_svg_text_in_colored_nodes(svg_content):
     """
     Fix text colors in SVGs to ensure visibility on colored backgrounds.
     """
-    changes_made = []
-
-    # Pattern 1: Fix text inside nodes with colored styles (primaryStyle, secondaryStyle, etc.)
-    # These styles in mermaid have color:#fff but it may not be applied to text elements
-
-    # Find all node groups and fix text fill inside colored ones
-    def fix_node_group(match):
-        node_content = match.group(0)
-        original = node_content
-
-        # Check if this node has a colored style class
-        colored_styles = ['primaryStyle', 'secondaryStyle', 'arbiterStyle', 'userStyle',
-                         'soarStyle', 'failoverStyle', 'titleStyle']
-
-        has_colored_style = any(style in node_content for style in colored_styles)
-
-        # Also check for inline fill colors that indicate colored background
-        # These are typically blue, green, gray, orange backgrounds
-        colored_fills = ['fill:#4169e1', 'fill:#10b981', 'fill:#6b7280', 'fill:#f59e0b',
-                        'fill:#ef4444', 'fill:#4169E1', 'fill:#10B981', 'fill:#6B7280',
-                        'fill:#F59E0B', 'fill:#EF4444']
-        has_colored_fill = any(fill in node_content for fill in colored_fills)
-
-        if has_colored_style or has_colored_fill:
-            # Change text fill from #333 to #fff (white)
-            node_content = re.sub(
-                r'(<text[^>]*style="[^"]*)(fill:\s*#333)([^"]*")',
-                r'\1fill: #fff\3',
-                node_content
-            )
-            node_content = re.sub(
-                r'(<text[^>]*style="[^"]*)(fill:#333)([^"]*")',
-                r'\1fill:#fff\3',
-                node_content
-            )
-            # Also fix tspan fill
-            node_content = re.sub(
-                r'(<tspan[^>]*style="[^"]*)(fill:\s*#333)([^"]*")',
-                r'\1fill: #fff\3',
-                node_content
-            )
-            node_content = re.sub(
-                r'(<tspan[^>]*style="[^"]*)(fill:#333)([^"]*")',
-                r'\1fill:#fff\3',
-                node_content
-            )
-
-        return node_content
-
-    # Process node groups
-    svg_content = re.sub(
-        r'<g class="node[^"]*"[^>]*>.*?</g>',
-        fix_node_group,
-        svg_content,
-        flags=re.DOTALL
-    )
+    # Pattern 1: Fix text inside nodes and clusters with colored backgrounds.
+    # Backgrounds come from the SVG's own style rules (e.g. mermaid classDef
+    # primaryStyle ... color:#fff), so any colored style is handled
+    svg_content = fix_node_text(svg_content)
 
     # Pattern 2: Fix CSS style rules in the SVG
     # Add !important to text fill rules for colored sections
@@ -78,13 +51,15 @@ def fix_svg_text_in_colored_nodes(svg_content, filename):
 
         # Make sure section text colors are applied with higher specificity
         # For mermaid mindmaps, sections have colors defined
+        # The fill value must end right before ; or } so rules that already
+        # carry !important are left alone
         css = re.sub(
-            r'(\.section-\d+\s+text\s*\{[^}]*fill:)([^;!}]+)([^}]*\})',
+            r'(\.section-\d+\s+text\s*\{[^}]*fill:)([^;!}]*[^;!}\s])(\s*[;}])',
             r'\1\2 !important\3',
             css
         )
         css = re.sub(
-            r'(\.section--\d+\s+text\s*\{[^}]*fill:)([^;!}]+)([^}]*\})',
+            r'(\.section--\d+\s+text\s*\{[^}]*fill:)([^;!}]*[^;!}\s])(\s*[;}])',
             r'\1\2 !important\3',
             css
         )
@@ -93,13 +68,6 @@ def fix_svg_text_in_colored_nodes(svg_content, filename):
 
     svg_content = re.sub(r'<style[^>]*>.*?</style>', fix_css_style, svg_content, flags=re.DOTALL)
 
-    # Pattern 3: For flowcharts, fix text in nodes with colored class definitions
-    # These nodes have class assignments like "class DC_PRI,DR_PRI primaryStyle"
-    # and text elements need white fill
-
-    # Find nodes that are assigned to colored classes by checking classDef
-    class_defs = re.findall(r'classDef\s+(\w+Style)\s+[^;]*color:#fff', svg_content)
-
     # Pattern 4: Direct fix for text elements with fill:#333 that are inside
     # elements with colored backgrounds
 
@@ -109,7 +77,7 @@ def fix_svg_text_in_colored_nodes(svg_content, filename):
         # In mermaid, the structure is often <rect .../><text>...</text>
 
         # Fix text after colored rects in same group
-        colored_rect_pattern = r'(<rect[^>]*fill="(#4169e1|#10b981|#6b7280|#f59e0b|#ef4444)"[^>]*/>\s*)(<text[^>]*)'
+        colored_rect_pattern = r'(<rect[^>]*fill="#(' + '|'.join(COLORED_RECT_FILLS) + r')"[^>]*/>\s*)(<text[^>]*)'
 
         def add_white_fill_to_text(match):
             rect_part = match.group(1)
@@ -131,14 +99,33 @@ def fix_svg_text_in_colored_nodes(svg_content, filename):
 
     return svg_content
 
+def needs_fix(filepath):
+    """
+    Cheap byte-level check for whether fix_svg_text_in_colored_nodes could
+    change the file: dark text in a node or cluster, a colored rect whose
+    text is not yet white, or a mindmap section rule that still needs
+    !important.
+    """
+    found = find_markers(filepath, NODE_MARKERS + DARK_TEXT_MARKERS + COLORED_MARKERS + [SECTION_MARKER])
+    if found & set(NODE_MARKERS) and found & set(DARK_TEXT_MARKERS):
+        return True
+    if found & set(COLORED_MARKERS):
+        if matches_pattern(filepath, UNFIXED_COLORED_RECT, required_marker=b'<rect'):
+            return True
+    if SECTION_MARKER in found:
+        return matches_pattern(filepath, UNFIXED_SECTION_RULE)
+    return False
+
 def fix_svg_file(filepath):
     """Fix a single SVG file."""
+    if not needs_fix(filepath):
+        return False
+
     with open(filepath, 'r', encoding='utf-8') as f:
         content = f.read()
 
-    filename = os.path.basename(filepath)
     original = content
-    content = fix_svg_text_in_colored_nodes(content, filename)
+    content = fix_svg_text_in_colored_nodes(content)
 
     if content != original:
         with open(filepath, 'w', encoding='utf-8') as f:
@@ -148,21 +135,33 @@ def fix_svg_file(filepath):
 
 def main():
     """Fix all SVG files in the images directory."""
-    images_dir = '/home/ubuntu/go/src/customers-docs/docs/images'
+    parser = argparse.ArgumentParser(description='Fix text colors in colored SVG nodes.')
+    sharding.add_shard_argument(parser)
+    args = parser.parse_args()
+
+    base_dir = '/home/ubuntu/go/src/customers-docs'
+    images_dir = os.path.join(base_dir, 'docs/images')
 
     # Get all SVG files
-    svg_files = glob.glob(os.path.join(images_dir, '*.svg'))
+    all_files = diagram_store.list_svg_files(images_dir)
+    svg_files = sharding.select_shard(all_files, args.shard)
 
     print(f"Found {len(svg_files)} SVG files")
     print("-" * 50)
 
     fixed_count = 0
-    for svg_file in sorted(svg_files):
-        if fix_svg_file(svg_file):
-            print(f"  Fixed: {os.path.basename(svg_file)}")
-            fixed_count += 1
-        else:
-            print(f"  No changes: {os.path.basename(svg_file)}")
+    with build_history.open_history(base_dir) as history:
+        for svg_file in sorted(svg_files):
+            with history.measure('fix-svg-colors', os.path.basename(svg_file), [svg_file]):
+                fixed = fix_svg_file(svg_file)
+            if fixed:
+                print(f"  Fixed: {os.path.basename(svg_file)}")
+                fixed_count += 1
+            else:
+                print(f"  No changes: {os.path.basename(svg_file)}")
+
+    sharding.write_shard_manifest(base_dir, 'fix-svg-colors', args.shard, all_files,
+                                  {path: [path] for path in svg_files})
 
     print("-" * 50)
     print(f"Fixed {fixed_count} out of {len(svg_files)} files")
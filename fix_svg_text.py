@@ -7,9 +7,14 @@ Handles multi-line text, cluster labels, node labels, and edge labels.
 
 import os
 import re
-import glob
+import argparse
 from html import unescape
 
+import diagram_store
+import sharding
+import build_history
+from prescreen import contains_any
+
 
 def extract_text_lines_from_html(html_content):
     """
@@ -264,14 +269,14 @@ def convert_foreignobject_to_text(svg_content):
 
 def process_svg_file(filepath):
     """Process a single SVG file."""
-    with open(filepath, 'r', encoding='utf-8') as f:
-        content = f.read()
-
-    # Check if this file has foreignObject elements
-    if '<foreignObject' not in content:
+    # Check if this file has foreignObject elements before decoding it
+    if not contains_any(filepath, [b'<foreignObject']):
         print(f"  Skipping {os.path.basename(filepath)} - no foreignObject elements")
         return False
 
+    with open(filepath, 'r', encoding='utf-8') as f:
+        content = f.read()
+
     new_content = convert_foreignobject_to_text(content)
 
     if new_content != content:
@@ -285,16 +290,27 @@ def process_svg_file(filepath):
 
 def main():
     """Main function to process all SVG files."""
-    svg_dir = '/home/ubuntu/go/src/customers-docs/docs/images'
-    svg_files = glob.glob(os.path.join(svg_dir, '*.svg'))
+    parser = argparse.ArgumentParser(description='Convert foreignObject labels in SVGs to native text.')
+    sharding.add_shard_argument(parser)
+    args = parser.parse_args()
+
+    base_dir = '/home/ubuntu/go/src/customers-docs'
+    svg_dir = os.path.join(base_dir, 'docs/images')
+    all_files = diagram_store.list_svg_files(svg_dir)
+    svg_files = sharding.select_shard(all_files, args.shard)
 
     print(f"Found {len(svg_files)} SVG files to process")
     print("-" * 50)
 
     fixed_count = 0
-    for filepath in sorted(svg_files):
-        if process_svg_file(filepath):
-            fixed_count += 1
+    with build_history.open_history(base_dir) as history:
+        for filepath in sorted(svg_files):
+            with history.measure('fix-svg-text', os.path.basename(filepath), [filepath]):
+                if process_svg_file(filepath):
+                    fixed_count += 1
+
+    sharding.write_shard_manifest(base_dir, 'fix-svg-text', args.shard, all_files,
+                                  {path: [path] for path in svg_files})
 
     print("-" * 50)
     print(f"Fixed {fixed_count} out of {len(svg_files)} files")
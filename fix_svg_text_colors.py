@@ -6,58 +6,38 @@ that need white text.
 """
 
 import os
-import re
-import glob
+import argparse
+
+import diagram_store
+import sharding
+import build_history
+from prescreen import find_markers
+from node_colors import fix_node_text
+
+# The document whose diagrams this fix applies to
+HA_DR_DOCUMENT = 'HA_DR_Architecture_Documentation_dt3'
+
+# Byte markers used to pre-screen files before decoding them
+NODE_MARKERS = [b'class="node', b'class="cluster']
+DARK_TEXT_MARKERS = [b'#333']
 
 def fix_text_colors_in_svg(svg_content):
     """
     Fix text colors in SVG to ensure visibility.
     Text inside nodes with colored backgrounds should be white.
     """
-
     # The SVG uses CSS classes like .primaryStyle, .secondaryStyle, etc.
     # that have tspan{fill:#fff!important} but the text elements have
-    # inline fill:#333 that may override this.
-
-    # Fix: In text elements inside .node groups that have colored styles,
-    # change fill:#333 to fill:#fff
-
-    # Pattern to find text elements with fill:#333 inside node groups
-    # These are the ones inside colored boxes
-
-    # First, let's find all node groups with primaryStyle, secondaryStyle, arbiterStyle, userStyle
-    # and fix the text fill inside them
-
-    def fix_node_text(match):
-        node_content = match.group(0)
-        # Check if this is a styled node (colored background)
-        if any(style in node_content for style in ['primaryStyle', 'secondaryStyle', 'arbiterStyle', 'userStyle']):
-            # Change fill: #333 to fill: #fff in text elements
-            node_content = re.sub(
-                r'(<text[^>]*style="[^"]*)(fill:\s*#333)([^"]*")',
-                r'\1fill: #fff\3',
-                node_content
-            )
-            # Also fix fill:#333 (no space)
-            node_content = re.sub(
-                r'(<text[^>]*style="[^"]*)(fill:#333)([^"]*")',
-                r'\1fill:#fff\3',
-                node_content
-            )
-        return node_content
-
-    # Process node groups
-    svg_content = re.sub(
-        r'<g class="node[^"]*"[^>]*>.*?</g>',
-        fix_node_text,
-        svg_content,
-        flags=re.DOTALL
-    )
-
-    return svg_content
+    # inline fill:#333 that may override this
+    return fix_node_text(svg_content, elements=('text',))
 
 def fix_svg_file(filepath):
     """Fix a single SVG file."""
+    # Only nodes with dark text can change; skip other files undecoded
+    found = find_markers(filepath, NODE_MARKERS + DARK_TEXT_MARKERS)
+    if not (found & set(NODE_MARKERS) and found & set(DARK_TEXT_MARKERS)):
+        return False
+
     with open(filepath, 'r', encoding='utf-8') as f:
         content = f.read()
 
@@ -72,20 +52,32 @@ def fix_svg_file(filepath):
 
 def main():
     """Fix all HA_DR SVG files."""
-    images_dir = '/home/ubuntu/go/src/customers-docs/docs/images'
+    parser = argparse.ArgumentParser(description='Fix text colors in the HA/DR dt3 diagrams.')
+    sharding.add_shard_argument(parser)
+    args = parser.parse_args()
+
+    base_dir = '/home/ubuntu/go/src/customers-docs'
+    images_dir = os.path.join(base_dir, 'docs/images')
 
     # Get HA_DR SVG files
-    svg_files = glob.glob(os.path.join(images_dir, 'HA_DR_Architecture_Documentation_dt3_diagram_*.svg'))
+    all_files = diagram_store.document_diagrams(images_dir, HA_DR_DOCUMENT)
+    svg_files = sharding.select_shard(all_files, args.shard)
 
     print(f"Found {len(svg_files)} HA_DR SVG files")
 
     fixed_count = 0
-    for svg_file in sorted(svg_files):
-        if fix_svg_file(svg_file):
-            print(f"  Fixed: {os.path.basename(svg_file)}")
-            fixed_count += 1
-        else:
-            print(f"  No changes: {os.path.basename(svg_file)}")
+    with build_history.open_history(base_dir) as history:
+        for svg_file in sorted(svg_files):
+            with history.measure('fix-ha-dr-colors', os.path.basename(svg_file), [svg_file]):
+                fixed = fix_svg_file(svg_file)
+            if fixed:
+                print(f"  Fixed: {os.path.basename(svg_file)}")
+                fixed_count += 1
+            else:
+                print(f"  No changes: {os.path.basename(svg_file)}")
+
+    sharding.write_shard_manifest(base_dir, 'fix-ha-dr-colors', args.shard, all_files,
+                                  {path: [path] for path in svg_files})
 
     print(f"\nFixed {fixed_count} files")
 
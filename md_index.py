@@ -0,0 +1,162 @@
+"""
+Structural index of a markdown source document.
+A single line-by-line pass records the offsets of ATX headings, fenced code
+blocks (``` and ~~~, at any indentation so fences inside list items are
+found) and the mermaid diagram blocks among them, with each diagram's
+dedented source and diagram store key. Indexes are cached by content hash
+under .build_cache/md_index/, so diagram extraction, cost estimates and
+diagram change detection read the index instead of re-scanning markdown.
+"""
+
+import os
+import re
+import json
+import hashlib
+
+import diagram_store
+
+INDEX_DIRNAME = '.build_cache/md_index'
+
+# Bump when the index format changes so stale cache entries are ignored
+INDEX_VERSION = 1
+
+FENCE_OPEN = re.compile(r'^([ \t]*)(`{3,}|~{3,})[ \t]*([^\s`]*)([^\n]*)$')
+FENCE_CLOSE = re.compile(r'^[ \t]*(`{3,}|~{3,})[ \t]*$')
+ATX_HEADING = re.compile(r'^ {0,3}(#{1,6})(?:[ \t]+(.*?))?(?:[ \t]+#+)?[ \t]*$')
+
+
+def index_dir(base_dir):
+    """Return the index cache directory of a build tree."""
+    return os.path.join(base_dir, INDEX_DIRNAME)
+
+
+def dedent_line(line, indent):
+    """Strip up to indent columns of leading whitespace from a fence body line."""
+    strip = 0
+    while strip < len(line) and strip < indent and line[strip] in ' \t':
+        strip += 1
+    return line[strip:]
+
+
+def scan_markdown(text):
+    """
+    Scan markdown text and return its structural index.
+    Offsets are character offsets into text; a block's start is the first
+    character of its opening fence (after any indentation) and its end is
+    the end of its closing fence, not counting the newline. An unclosed
+    fence runs to the end of the document.
+    """
+    headings = []
+    fences = []
+    diagrams = []
+
+    fence = None
+    offset = 0
+    for number, line in enumerate(text.splitlines(keepends=True), 1):
+        content = line.rstrip('\r\n')
+        line_end = offset + len(content)
+
+        if fence is None:
+            match = FENCE_OPEN.match(content)
+            if match and not (match.group(2)[0] == '`' and '`' in match.group(4)):
+                indent = len(match.group(1))
+                fence = {
+                    'line': number,
+                    'marker': match.group(2),
+                    'indent': indent,
+                    'lang': match.group(3).lower(),
+                    'start': offset + indent,
+                    'body_start': offset + len(line),
+                    'body': [],
+                }
+            else:
+                heading = ATX_HEADING.match(content)
+                if heading:
+                    headings.append({
+                        'line': number,
+                        'level': len(heading.group(1)),
+                        'title': (heading.group(2) or '').strip(),
+                        'start': offset,
+                        'end': line_end,
+                    })
+        else:
+            match = FENCE_CLOSE.match(content)
+            marker = fence['marker']
+            if match and match.group(1)[0] == marker[0] and len(match.group(1)) >= len(marker):
+                fence['body_end'] = offset
+                fence['end'] = line_end
+                fences.append(fence)
+                fence = None
+            else:
+                fence['body'].append(dedent_line(content, fence['indent']))
+
+        offset += len(line)
+
+    if fence is not None:
+        fence['body_end'] = fence['end'] = len(text)
+        fences.append(fence)
+
+    for number, fence in enumerate(fences):
+        lines = fence.pop('body')
+        del fence['marker']
+        if fence['lang'] == 'mermaid':
+            code = '\n'.join(lines).strip()
+            diagrams.append({
+                'fence': number,
+                'start': fence['start'],
+                'end': fence['end'],
+                'code': code,
+                'key': diagram_store.source_key(code),
+            })
+
+    return {
+        'version': INDEX_VERSION,
+        'headings': headings,
+        'fences': fences,
+        'diagrams': diagrams,
+    }
+
+
+def cache_path(cache_dir, digest):
+    """Return the cache file of the index for a content hash."""
+    return os.path.join(cache_dir, f'{digest}.json')
+
+
+def load_cached(cache_dir, digest):
+    """Return the cached index for a content hash, or None."""
+    path = cache_path(cache_dir, digest)
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            index = json.load(f)
+    except (OSError, ValueError):
+        return None
+    return index if index.get('version') == INDEX_VERSION else None
+
+
+def save_cached(cache_dir, digest, index):
+    """Write an index to the cache atomically."""
+    os.makedirs(cache_dir, exist_ok=True)
+    path = cache_path(cache_dir, digest)
+    temp_path = f'{path}.{os.getpid()}.tmp'
+    with open(temp_path, 'w', encoding='utf-8') as f:
+        json.dump(index, f)
+    os.replace(temp_path, path)
+
+
+def load_index(md_path, cache_dir=None):
+    """
+    Read a markdown file and return (text, index).
+    The index comes from the cache when the content is unchanged; without
+    a cache_dir the file is always scanned.
+    """
+    with open(md_path, 'r', encoding='utf-8') as f:
+        text = f.read()
+
+    digest = hashlib.sha256(text.encode('utf-8')).hexdigest()
+    index = load_cached(cache_dir, digest) if cache_dir else None
+    if index is None:
+        index = scan_markdown(text)
+        index['hash'] = digest
+        if cache_dir:
+            save_cached(cache_dir, digest, index)
+    return text, index
@@ -0,0 +1,349 @@
+"""
+Resolve the background color behind diagram node text.
+The SVG's <style> rules (and any mermaid classDef lines) are parsed into a
+class -> background / text color table, once per distinct stylesheet. Only
+the node and cluster groups are walked: each gets its effective background,
+the fill of its first shape if set inline, otherwise the fill of its
+classes. Text on that background gets the text color the style declares,
+or failing that whichever of light and dark text has the higher contrast.
+"""
+
+import re
+import html
+import colorsys
+import functools
+
+LIGHT_TEXT = '#fff'
+DARK_TEXT = '#333'
+
+STYLE_BLOCK = re.compile(r'<style[^>]*>([^<]*(?:<(?!/style>)[^<]*)*)</style>')
+CSS_RULE = re.compile(r'([^{}]+)\{([^{}]*)\}')
+CLASS_SELECTOR = re.compile(r'^(?:#[\w-]+\s+)?\.([\w-]+)\s*(>\s*\*|\s[\w.-]+)?$')
+CLASS_DEF = re.compile(r'classDef\s+([\w,-]+)\s+([^;\n<]*)')
+
+# The class list of a node or cluster group, whose text sits on its own
+# background; mermaid writes node or cluster as the first class
+BACKGROUND_CLASS = re.compile(r'class="(?:node|cluster)[\s"]')
+# The tags walked inside such a group: group opens, runs of group closes
+# and text with an inline dark fill
+NODE_TAG = re.compile(r'<g\b[^>]*>|</g>(?:</g>)*|<(text|tspan)\b([^>]*fill:\s*#333(?![0-9a-fA-F])[^>]*)>')
+SHAPE_TAG = re.compile(r'<(?:rect|polygon|circle|ellipse|path)\b([^>]*)>')
+# Attributes; the lookbehind follows the literal so the search can skip
+# ahead to it, which matters on paths with hundreds of KB of d="..."
+CLASS_ATTR = re.compile(r'class="(?<=\sclass=")([^"]*)"')
+STYLE_ATTR = re.compile(r'style="(?<=\sstyle=")([^"]*)"')
+FILL_ATTR = re.compile(r'fill="(?<=\sfill=")([^"]*)"')
+DARK_FILL = re.compile(r'(fill:\s*)#333(?![0-9a-fA-F])')
+
+# Selector tails that paint a node's background, and those that style its text
+SHAPE_TAILS = {None, '*', 'rect', 'polygon', 'circle', 'ellipse', 'path'}
+TEXT_TAILS = {'text', 'tspan'}
+LABEL_TAILS = {'span', 'label', '.label', 'p'}
+
+# First classes of the groups whose text sits on their own background
+BACKGROUND_GROUPS = {'node', 'cluster'}
+
+NAMED_COLORS = {'white': (255, 255, 255), 'black': (0, 0, 0)}
+
+
+@functools.lru_cache(maxsize=1024)
+def parse_color(value):
+    """Return the (r, g, b) of a CSS color value, or None if it isn't a plain color."""
+    if not value:
+        return None
+    value = value.strip().lower()
+    if value in NAMED_COLORS:
+        return NAMED_COLORS[value]
+    match = re.fullmatch(r'#([0-9a-f]{3}|[0-9a-f]{6})', value)
+    if match:
+        digits = match.group(1)
+        if len(digits) == 3:
+            digits = ''.join(c * 2 for c in digits)
+        return tuple(int(digits[i:i + 2], 16) for i in (0, 2, 4))
+    match = re.fullmatch(r'rgba?\(\s*(\d+)\s*,\s*(\d+)\s*,\s*(\d+)\s*(?:,[^)]*)?\)', value)
+    if match:
+        return tuple(min(int(c), 255) for c in match.groups())
+    match = re.fullmatch(r'hsla?\(\s*([\d.]+)\s*,\s*([\d.]+)%\s*,\s*([\d.]+)%\s*(?:,[^)]*)?\)', value)
+    if match:
+        hue, saturation, lightness = (float(c) for c in match.groups())
+        rgb = colorsys.hls_to_rgb(hue / 360 % 1, min(lightness, 100) / 100, min(saturation, 100) / 100)
+        return tuple(round(c * 255) for c in rgb)
+    return None
+
+
+def luminance(rgb):
+    """Return the WCAG relative luminance of an (r, g, b) color."""
+    def channel(c):
+        c /= 255
+        return c / 12.92 if c <= 0.03928 else ((c + 0.055) / 1.055) ** 2.4
+    r, g, b = (channel(c) for c in rgb)
+    return 0.2126 * r + 0.7152 * g + 0.0722 * b
+
+
+def contrast(first, second):
+    """Return the WCAG contrast ratio of two (r, g, b) colors."""
+    lighter, darker = sorted((luminance(first), luminance(second)), reverse=True)
+    return (lighter + 0.05) / (darker + 0.05)
+
+
+@functools.lru_cache(maxsize=1024)
+def text_color_for(background):
+    """Return the light or dark text color with the higher contrast on a background."""
+    rgb = parse_color(background)
+    if rgb is None:
+        return None
+    if contrast(rgb, parse_color(LIGHT_TEXT)) > contrast(rgb, parse_color(DARK_TEXT)):
+        return LIGHT_TEXT
+    return DARK_TEXT
+
+
+@functools.lru_cache(maxsize=1024)
+def is_light(color):
+    """Check whether a color reads as light text (luminance above mid grey)."""
+    rgb = parse_color(color)
+    return rgb is not None and luminance(rgb) > 0.5
+
+
+def parse_declarations(text, separator=';'):
+    """Return {property: value} for a CSS declaration list, without !important."""
+    declarations = {}
+    for declaration in text.split(separator):
+        name, colon, value = declaration.partition(':')
+        if colon:
+            value = value.replace('!important', '').strip()
+            declarations[name.strip().lower()] = value
+    return declarations
+
+
+class ColorTable:
+    """
+    Background and text colors per class, from an SVG's stylesheet.
+    Later rules override earlier ones, as in CSS. A text color from a
+    text/tspan fill rule wins over a 'color' declaration.
+    """
+
+    def __init__(self):
+        self.backgrounds = {}
+        self.text_fills = {}
+        self.colors = {}
+
+    def add_rule(self, cls, tail, declarations):
+        """Record one class rule; tail is the part of the selector after the class."""
+        if tail in SHAPE_TAILS:
+            if 'fill' in declarations:
+                self.backgrounds[cls] = declarations['fill']
+            if 'color' in declarations:
+                self.colors[cls] = declarations['color']
+        elif tail in TEXT_TAILS:
+            if 'fill' in declarations:
+                self.text_fills[cls] = declarations['fill']
+        elif tail in LABEL_TAILS:
+            if 'color' in declarations:
+                self.colors[cls] = declarations['color']
+
+    def background(self, cls):
+        return self.backgrounds.get(cls)
+
+    def text_color(self, cls):
+        return self.text_fills.get(cls) or self.colors.get(cls)
+
+
+def selector_tail(tail):
+    """Normalise the part of a selector after the class name."""
+    if tail is None:
+        return None
+    tail = tail.strip()
+    return '*' if tail.startswith('>') else tail
+
+
+def parse_color_table(svg_content):
+    """Return the class color table of an SVG from its <style> blocks and classDef lines."""
+    return build_color_table(tuple(STYLE_BLOCK.findall(svg_content)), tuple(CLASS_DEF.findall(svg_content)))
+
+
+@functools.lru_cache(maxsize=64)
+def build_color_table(style_blocks, class_defs):
+    """
+    Build a color table from style blocks and (names, body) classDef pairs.
+    Diagrams rendered with the same theme share their stylesheet, so the
+    table is built once per distinct stylesheet; callers must not modify it.
+    """
+    table = ColorTable()
+    for block in style_blocks:
+        for selectors, body in CSS_RULE.findall(html.unescape(block)):
+            declarations = None
+            for selector in selectors.split(','):
+                match = CLASS_SELECTOR.match(selector.strip())
+                if match:
+                    if declarations is None:
+                        declarations = parse_declarations(body)
+                    table.add_rule(match.group(1), selector_tail(match.group(2)), declarations)
+
+    for names, body in class_defs:
+        declarations = parse_declarations(body, separator=',')
+        for cls in names.split(','):
+            table.add_rule(cls, None, declarations)
+    return table
+
+
+class Background:
+    """
+    The resolved background and declared text color of a node group.
+    shape_from is where to look for the shape that paints the node, or
+    None once it has been found or when it doesn't matter.
+    """
+
+    def __init__(self, background=None, text=None, shape_from=None):
+        self.background = background
+        self.text = text
+        self.shape_from = shape_from
+
+    def find_shape(self, svg_content, end):
+        """Look for the node's first shape before end; an inline fill overrides its classes."""
+        shape = SHAPE_TAG.search(svg_content, self.shape_from, end)
+        if shape is None:
+            self.shape_from = end
+            return
+        self.shape_from = None
+        fill = inline_value(shape.group(1), 'fill')
+        if parse_color(fill):
+            self.background = fill
+
+    def text_color(self):
+        """Return the text color to use on this background, or None if unknown."""
+        return self.text or text_color_for(self.background)
+
+
+@functools.lru_cache(maxsize=1024)
+def group_background(classes, table):
+    """
+    Resolve a node group's background from its classes (a tuple); the last
+    class wins. The result is shared between calls and must not be modified.
+    """
+    background = Background()
+    for cls in classes:
+        if table.background(cls):
+            background.background = table.background(cls)
+        if table.text_color(cls):
+            background.text = table.text_color(cls)
+    return background
+
+
+def inline_value(attrs, name):
+    """Return a presentation value from a tag's style or attribute, or None."""
+    if name not in attrs:
+        return None
+    style = STYLE_ATTR.search(attrs)
+    if style:
+        declarations = parse_declarations(style.group(1))
+        if declarations.get(name):
+            return declarations[name]
+    if name == 'fill':
+        fill = FILL_ATTR.search(attrs)
+        if fill:
+            return fill.group(1)
+    return None
+
+
+def fix_group_text(svg_content, start, table, elements, edits):
+    """
+    Walk the node or cluster group whose open tag is at start, and the
+    sibling groups straight after it, appending (start, end, replacement)
+    to edits for each dark text fill that needs to be light.
+    Returns the offset just past the last group walked.
+    """
+    # One entry per open <g>: the Background its content sits on
+    stack = []
+    end = start
+    for match in NODE_TAG.finditer(svg_content, start):
+        if not stack and match.start() != end:
+            break
+        tag = match.group()
+        if tag[1] == '/':
+            if not stack:
+                break
+            closed = stack[-1]
+            del stack[max(len(stack) - len(tag) // len('</g>'), 0):]
+            if not stack:
+                end = match.end()
+                continue
+            current = stack[-1]
+            # A node's shape is only looked for while its own content is open
+            if current is not closed and current.shape_from is not None:
+                current.shape_from = match.end()
+            continue
+
+        current = stack[-1] if stack else None
+        if tag[1] == 'g':
+            if tag.endswith('/>'):
+                if not stack:
+                    end = match.end()
+                continue
+            group = current
+            if 'node' in tag or 'cluster' in tag:
+                class_attr = CLASS_ATTR.search(tag)
+                classes = tuple(class_attr.group(1).split()) if class_attr else ()
+                if classes and classes[0] in BACKGROUND_GROUPS:
+                    background = group_background(classes, table)
+                    # With a declared text color the shape's fill doesn't matter
+                    shape_from = None if background.text else match.end()
+                    group = Background(background.background, background.text, shape_from)
+            if group is None:
+                break
+            color = inline_value(tag, 'color') if 'color' in tag else None
+            if (color or group is not current) and current is not None and current.shape_from is not None:
+                # The node's own content pauses here; look for its shape so far
+                current.find_shape(svg_content, match.start())
+            if color:
+                group = Background(group.background, color)
+            stack.append(group)
+            continue
+
+        if current is None:
+            break
+        if match.group(1) not in elements:
+            continue
+        if current.shape_from is not None:
+            current.find_shape(svg_content, match.start())
+        color = current.text_color()
+        if is_light(color):
+            attrs = match.group(2)
+            fixed = DARK_FILL.sub(lambda m: m.group(1) + color, attrs, count=1)
+            if fixed != attrs:
+                edits.append((match.start(2), match.end(2), fixed))
+    # A group left open runs to the end of the SVG
+    return len(svg_content) if stack else end
+
+
+def fix_node_text(svg_content, elements=('text', 'tspan')):
+    """
+    Give dark text on dark node and cluster backgrounds a light fill.
+    elements names the tags whose inline fill:#333 may be replaced.
+    Returns the fixed SVG content.
+    Only the content of node and cluster groups is walked; text outside
+    them keeps its fill.
+    """
+    table = None
+    edits = []
+    position = 0
+    for match in BACKGROUND_CLASS.finditer(svg_content):
+        start = svg_content.rfind('<', 0, match.start())
+        # Nested in a group already walked, or not the class of a <g>
+        if start < position or not svg_content.startswith('<g', start):
+            continue
+        if svg_content[start + 2] not in ' \t\r\n' or svg_content.find('>', start, match.start()) != -1:
+            continue
+        if table is None:
+            table = parse_color_table(svg_content)
+        position = fix_group_text(svg_content, start, table, elements, edits)
+
+    if not edits:
+        return svg_content
+    pieces = []
+    last = 0
+    for start, end, fixed in edits:
+        pieces.append(svg_content[last:start])
+        pieces.append(fixed)
+        last = end
+    pieces.append(svg_content[last:])
+    return ''.join(pieces)
@@ -0,0 +1,322 @@
+#!/usr/bin/env python3
+"""
+Script to post-process generated PDFs to reduce their size.
+Rewrites each PDF with object streams and maximum-level stream compression,
+and dedupes identical image/form XObjects and embedded font programs.
+Can also linearize PDFs ("fast web view") so browsers show page one early.
+Uses pikepdf (qpdf) for the rewrite.
+"""
+
+import os
+import re
+import io
+import glob
+import hashlib
+import argparse
+
+# Font descriptor keys that hold embedded font programs
+FONT_FILE_KEYS = ('/FontFile', '/FontFile2', '/FontFile3')
+
+
+def object_key(value, memo, active=()):
+    """
+    Return (key, complete): a hashable identity for a PDF object's full content.
+    Nested streams and indirect objects are keyed by what they contain,
+    since repr() only shows the start of a stream's data; memo caches keys
+    of indirect objects and active breaks reference cycles. A key that cut
+    a cycle depends on where the walk entered it, so it is not complete
+    and is not cached.
+    """
+    import pikepdf
+
+    if not isinstance(value, pikepdf.Object):
+        return repr(value), True
+    if value.is_indirect:
+        objgen = value.objgen
+        if objgen in memo:
+            return memo[objgen], True
+        if objgen in active:
+            return ('cycle', objgen), False
+        active = active + (objgen,)
+
+    if isinstance(value, pikepdf.Stream):
+        key, complete = stream_key(value, memo, active)
+    elif isinstance(value, pikepdf.Dictionary):
+        items = [(str(name), object_key(item, memo, active)) for name, item in value.items()]
+        key = tuple(sorted((name, item_key) for name, (item_key, _) in items))
+        complete = all(item_complete for _, (_, item_complete) in items)
+    elif isinstance(value, pikepdf.Array):
+        items = [object_key(item, memo, active) for item in value]
+        key = tuple(item_key for item_key, _ in items)
+        complete = all(item_complete for _, item_complete in items)
+    else:
+        key, complete = repr(value), True
+
+    if value.is_indirect and complete:
+        memo[value.objgen] = key
+    return key, complete
+
+
+def stream_key(stream, memo=None, active=()):
+    """Return (key, complete) for a stream's dictionary and raw data, as object_key does."""
+    memo = {} if memo is None else memo
+    items = [
+        (str(key), object_key(value, memo, active))
+        for key, value in stream.stream_dict.items()
+        if key != '/Length'
+    ]
+    meta = tuple(sorted((name, item_key) for name, (item_key, _) in items))
+    # Folded into one digest so the keys of enclosing objects stay small
+    digest = hashlib.sha256(stream.read_raw_bytes())
+    digest.update(repr(meta).encode())
+    return digest.hexdigest(), all(item_complete for _, (_, item_complete) in items)
+
+
+def dedupe_resources(pdf):
+    """
+    Point every reference to an identical XObject or font program at one copy.
+    Returns (xobjects_replaced, fonts_replaced, non_subset_fonts).
+    Unreferenced duplicates are dropped by qpdf when the file is saved.
+    """
+    import pikepdf
+
+    canonical = {}
+    memo = {}
+    visited = set()
+    counts = {'xobjects': 0, 'fonts': 0}
+    non_subset_fonts = set()
+
+    def canonicalize(container, key, kind):
+        obj = container[key]
+        if not isinstance(obj, pikepdf.Stream):
+            return obj
+        original = canonical.setdefault(object_key(obj, memo)[0], obj)
+        if original.objgen != obj.objgen:
+            container[key] = original
+            counts[kind] += 1
+        return original
+
+    def visit_font(font):
+        base_font = str(font.get('/BaseFont', ''))
+        if base_font and '+' not in base_font:
+            non_subset_fonts.add(base_font.lstrip('/'))
+
+        descriptors = []
+        if '/FontDescriptor' in font:
+            descriptors.append(font.FontDescriptor)
+        for descendant in font.get('/DescendantFonts', []):
+            if '/FontDescriptor' in descendant:
+                descriptors.append(descendant.FontDescriptor)
+
+        for descriptor in descriptors:
+            for file_key in FONT_FILE_KEYS:
+                if file_key in descriptor:
+                    canonicalize(descriptor, file_key, 'fonts')
+
+    def visit_resources(resources):
+        if resources is None:
+            return
+
+        fonts = resources.get('/Font')
+        if fonts is not None:
+            for name in list(fonts.keys()):
+                visit_font(fonts[name])
+
+        xobjects = resources.get('/XObject')
+        if xobjects is None:
+            return
+        for name in list(xobjects.keys()):
+            xobject = canonicalize(xobjects, name, 'xobjects')
+            if not isinstance(xobject, pikepdf.Stream) or xobject.objgen in visited:
+                continue
+            visited.add(xobject.objgen)
+            # Form XObjects (the SVG diagrams) carry their own resources
+            if xobject.get('/Subtype') == '/Form':
+                visit_resources(xobject.get('/Resources'))
+
+    for page in pdf.pages:
+        visit_resources(page.obj.get('/Resources'))
+
+    return counts['xobjects'], counts['fonts'], sorted(non_subset_fonts)
+
+
+def optimize_pdf(pdf_path, output_path=None, linearize=False):
+    """
+    Optimize a single PDF in place (or to output_path).
+    With linearize=True the file is written with a hint table and
+    first-page-first object ordering.
+    Returns (size_before, size_after), or None on error.
+    """
+    try:
+        import pikepdf
+    except ImportError:
+        print("    Error: pikepdf is required for PDF optimization (pip install pikepdf)")
+        return None
+
+    output_path = output_path or pdf_path
+    temp_path = output_path + '.tmp'
+    size_before = os.path.getsize(pdf_path)
+
+    try:
+        pikepdf.settings.set_flate_compression_level(9)
+
+        # qpdf can emit hint tables that fail check_linearization when it
+        # linearizes a file with object streams it generated, whether in this
+        # rewrite or an earlier optimize run. Linearized files therefore keep
+        # the object streams they have, and are written again without any if
+        # the result doesn't pass the check
+        object_stream_modes = [pikepdf.ObjectStreamMode.generate]
+        if linearize:
+            object_stream_modes = [pikepdf.ObjectStreamMode.preserve, pikepdf.ObjectStreamMode.disable]
+
+        for object_stream_mode in object_stream_modes:
+            # Reopened for each attempt: a linearized save leaves the
+            # document in a state that a second save can't rely on
+            with pikepdf.open(pdf_path) as pdf:
+                xobjects, fonts, non_subset_fonts = dedupe_resources(pdf)
+                if linearize:
+                    # WeasyPrint shares one resource dictionary across all pages,
+                    # which would make every diagram part of the first page
+                    pdf.remove_unreferenced_resources()
+                pdf.save(
+                    temp_path,
+                    object_stream_mode=object_stream_mode,
+                    compress_streams=True,
+                    recompress_flate=True,
+                    stream_decode_level=pikepdf.StreamDecodeLevel.generalized,
+                    linearize=linearize,
+                )
+            if not linearize or verify_linearization(temp_path)[0]:
+                break
+        else:
+            raise RuntimeError('linearized output fails the linearization check')
+
+        size_after = os.path.getsize(temp_path)
+        # A linearized rewrite is kept even when it is bigger: the hint tables,
+        # per-page resource dictionaries and lack of generated object streams
+        # commonly add 10-30% to the file, more when object streams are dropped
+        if linearize and size_after > size_before:
+            print(f"    Warning: linearizing grew the file by {(size_after - size_before) / 1024:.1f} KB "
+                  f"({(size_after - size_before) / size_before * 100:.0f}%)")
+        if size_after < size_before or linearize or output_path != pdf_path:
+            os.replace(temp_path, output_path)
+        else:
+            # Never make an already-optimal file bigger
+            os.unlink(temp_path)
+            size_after = size_before
+    except Exception as e:
+        if os.path.exists(temp_path):
+            os.unlink(temp_path)
+        print(f"    Error: {e}")
+        return None
+
+    if xobjects or fonts:
+        print(f"    Deduped {xobjects} XObjects and {fonts} font programs")
+    for font_name in non_subset_fonts:
+        print(f"    Warning: font {font_name} is embedded without subsetting")
+
+    return size_before, size_after
+
+
+def verify_linearization(pdf_path):
+    """
+    Check that a PDF is correctly linearized.
+    Returns (ok, first_page_end, file_length, errors). first_page_end is the
+    byte offset at which the first page is complete (the /E entry).
+    """
+    try:
+        import pikepdf
+    except ImportError:
+        return False, None, None, ['pikepdf is required for linearization checks (pip install pikepdf)']
+
+    try:
+        with pikepdf.open(pdf_path) as pdf:
+            if not pdf.is_linearized:
+                return False, None, None, ['not linearized']
+            report = io.StringIO()
+            ok = pdf.check_linearization(report)
+    except Exception as e:
+        return False, None, None, [str(e)]
+
+    # The linearization dictionary is the first object in the file
+    with open(pdf_path, 'rb') as f:
+        head = f.read(1024)
+    first_page_end = re.search(rb'/E\s+(\d+)', head)
+    file_length = re.search(rb'/L\s+(\d+)', head)
+
+    errors = [line for line in report.getvalue().splitlines() if line.strip()]
+    return (
+        ok,
+        int(first_page_end.group(1)) if first_page_end else None,
+        int(file_length.group(1)) if file_length else None,
+        errors,
+    )
+
+
+def format_size_change(name, size_before, size_after):
+    """Format a one-line size report for a file."""
+    saved = size_before - size_after
+    percent = (saved / size_before * 100) if size_before else 0
+    change = f"{percent:.1f}% smaller" if saved >= 0 else f"{-percent:.1f}% larger"
+    return f"  {name}: {size_before / 1024:.1f} KB -> {size_after / 1024:.1f} KB ({change})"
+
+
+def verify_pdfs(pdf_files):
+    """Print a linearization report for each PDF. Returns the failure count."""
+    print(f"Verifying linearization of {len(pdf_files)} PDF files")
+    print("-" * 50)
+
+    failed = 0
+    for pdf_path in pdf_files:
+        name = os.path.basename(pdf_path)
+        ok, first_page_end, file_length, errors = verify_linearization(pdf_path)
+        if not ok:
+            failed += 1
+            print(f"  FAIL {name}")
+            for error in errors:
+                print(f"    {error}")
+            continue
+        if first_page_end and file_length:
+            percent = first_page_end / file_length * 100
+            print(f"  OK   {name} - first page after {first_page_end / 1024:.1f} KB of {file_length / 1024:.1f} KB ({percent:.0f}%)")
+        else:
+            print(f"  OK   {name}")
+
+    print("-" * 50)
+    print(f"{len(pdf_files) - failed} out of {len(pdf_files)} PDFs are correctly linearized")
+    return failed
+
+
+def main():
+    """Main function to optimize all PDFs."""
+    parser = argparse.ArgumentParser(description='Optimize generated PDF files.')
+    parser.add_argument('--linearize', action='store_true',
+                        help='write linearized ("fast web view") PDFs; these are usually larger')
+    parser.add_argument('--verify', action='store_true',
+                        help='only check that the PDFs are linearized')
+    args = parser.parse_args()
+
+    pdf_dir = '/home/ubuntu/go/src/customers-docs/docs/pdf'
+    pdf_files = sorted(glob.glob(os.path.join(pdf_dir, '*.pdf')))
+
+    if args.verify:
+        return 1 if verify_pdfs(pdf_files) else 0
+
+    print(f"Found {len(pdf_files)} PDF files to optimize")
+    print("-" * 50)
+
+    total_before = 0
+    total_after = 0
+    for pdf_path in pdf_files:
+        sizes = optimize_pdf(pdf_path, linearize=args.linearize)
+        if sizes is None:
+            continue
+        total_before += sizes[0]
+        total_after += sizes[1]
+        print(format_size_change(os.path.basename(pdf_path), *sizes))
+
+    print("-" * 50)
+    print(format_size_change('Total', total_before, total_after).strip())
+
+if __name__ == '__main__':
+    raise SystemExit(main())
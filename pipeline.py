@@ -0,0 +1,211 @@
+#!/usr/bin/env python3
+"""
+In-memory build pipeline.
+Runs the html, SVG fix, update-html and pdf stages back to back for each
+document, passing the document between stages in memory. The page HTML is
+assembled once with the fixed diagrams already in place, written once, and
+rendered to PDF from the same string, instead of being written, re-read
+and re-parsed by every stage. Diagrams are read from the store once per
+run and only written back if a fix changed them.
+The per-stage scripts remain the way to run a single stage on its own.
+"""
+
+import os
+import sys
+import time
+import argparse
+
+import diagram_store
+import sharding
+import build_history
+import md_index
+import diagram_offsets
+import budgets
+from convert_md_to_html import (
+    SOURCE_FILES, prepare_markdown, run_pandoc, build_html_page, write_html_page, document_outputs,
+)
+from fix_svg_text_colors import HA_DR_DOCUMENT
+from update_html_svgs import fix_svg_dimensions
+from docs_library import fix_diagram
+
+
+class Document:
+    """A document moving through the pipeline."""
+
+    def __init__(self, md_path):
+        self.md_path = md_path
+        self.basename = os.path.basename(md_path).replace('.md', '')
+        self.markdown = None
+        self.diagram_keys = []
+        self.diagrams = []
+        self.html = None
+
+
+def load_document(md_path, images_dir, index_dir=None):
+    """Run the markdown half of the html stage: read the source and find its diagrams."""
+    document = Document(md_path)
+    _, document.markdown, document.diagrams, document.diagram_keys = prepare_markdown(
+        md_path, images_dir, index_dir)
+    diagram_store.record_document(images_dir, document.basename, document.diagram_keys)
+    return document
+
+
+def fix_document_diagrams(document, images_dir, fixed, ha_dr_keys, report=None):
+    """
+    Fix a document's diagrams in memory, writing back store blobs that changed.
+    fixed caches fixed diagrams by key, so a diagram shared by several
+    documents is fixed once per run. Each fixed diagram is checked against
+    the budgets of report, if given.
+    """
+    for i, key in enumerate(document.diagram_keys):
+        svg_path = diagram_store.blob_path(images_dir, key)
+        if not os.path.exists(svg_path):
+            # Failed to render; keep the placeholder from prepare_markdown
+            continue
+
+        if key not in fixed:
+            content = document.diagrams[i]
+            fixed[key] = fix_diagram(content, key in ha_dr_keys)
+            if fixed[key] != content:
+                with open(svg_path, 'w', encoding='utf-8') as f:
+                    f.write(fixed[key])
+                print(f"  Fixed diagram {os.path.basename(svg_path)}")
+            if report is not None:
+                report.check_diagram(budgets.diagram_subject(document.basename, i + 1, svg_path), fixed[key])
+
+        document.diagrams[i] = fix_svg_dimensions(fixed[key])
+
+
+def build_document_html(document):
+    """Convert the document to its final HTML page, diagrams included."""
+    html_content = run_pandoc(document.markdown)
+    document.html = build_html_page(document.basename, html_content, document.diagrams)
+
+
+def render_document_pdf(document, html_dir, pdf_path):
+    """
+    Render the document's PDF from its in-memory HTML in memory-capped
+    workers (see regenerate_pdfs.render_pdf_isolated).
+    Returns the render mode used, or None if the PDF could not be rendered.
+    """
+    from regenerate_pdfs import render_pdf_isolated
+
+    print(f"  Generating: {os.path.basename(pdf_path)}")
+    mode, problems = render_pdf_isolated(document.html, pdf_path, html_dir)
+    for problem in problems:
+        print(f"    {problem}")
+    if mode is not None and mode != 'full':
+        print(f"    Degraded: rendered {mode}")
+    return mode
+
+
+def run_pipeline(md_files, html_dir, images_dir, pdf_dir, split_sections=False,
+                 optimize=False, linearize=False, history=None, index_dir=None, offsets_dir=None,
+                 report=None):
+    """
+    Build the HTML page and PDF of every document in md_files.
+    If report (a budgets.BudgetReport) is given, diagrams, pages and PDF
+    render times are checked against its budgets as they are built.
+    Returns ({md_path: [output paths]}, {pdf name: render mode}) for the
+    documents that were built and those whose PDF had to be degraded; a
+    document whose PDF failed is left out.
+    """
+    documents = [load_document(md_path, images_dir, index_dir) for md_path in md_files]
+
+    # The HA/DR colour fix applies to every diagram of that document, even
+    # when another document shares it, as it does when the stages run separately
+    ha_dr_keys = set(diagram_store.load_manifest(images_dir).get(HA_DR_DOCUMENT, []))
+    fixed = {}
+
+    built = {}
+    degraded = {}
+    for document in documents:
+        start = time.perf_counter()
+        fix_document_diagrams(document, images_dir, fixed, ha_dr_keys, report)
+        build_document_html(document)
+        html_path = os.path.join(html_dir, f'{document.basename}.html')
+        write_html_page(html_path, document.html, split_sections, offsets_dir)
+        if report is not None:
+            report.check_page(os.path.basename(html_path), os.path.getsize(html_path))
+        if history is not None:
+            history.record('pipeline-html', os.path.basename(document.md_path),
+                           time.perf_counter() - start, build_history.output_size([html_path]))
+
+        outputs = document_outputs(document.md_path, html_dir, images_dir)
+        pdf_path = os.path.join(pdf_dir, f'{document.basename}.pdf')
+        start = time.perf_counter()
+        mode = render_document_pdf(document, html_dir, pdf_path)
+        if mode is not None:
+            if report is not None:
+                report.check_pdf(os.path.basename(pdf_path), time.perf_counter() - start)
+            if mode != 'full':
+                degraded[os.path.basename(pdf_path)] = mode
+            if history is not None:
+                history.record('pdf', f'{document.basename}.html', time.perf_counter() - start,
+                               build_history.output_size([pdf_path]))
+            if optimize or linearize:
+                from optimize_pdfs import optimize_pdf, format_size_change
+                sizes = optimize_pdf(pdf_path, linearize=linearize)
+                if sizes is not None:
+                    print('  ' + format_size_change(os.path.basename(pdf_path), *sizes))
+            built[document.md_path] = outputs + [pdf_path]
+        # Release the page before moving on to the next document
+        document.html = None
+
+    return built, degraded
+
+
+def main():
+    """Build HTML and PDF for the source documents with the in-memory pipeline."""
+    parser = argparse.ArgumentParser(description='Build HTML and PDF output in one in-memory pass.')
+    parser.add_argument('--split', action='store_true',
+                        help='also write one page per <h2> section with a navigation sidebar')
+    parser.add_argument('--optimize', action='store_true',
+                        help='post-process each PDF with optimize_pdfs and report sizes')
+    parser.add_argument('--linearize', action='store_true',
+                        help='write linearized ("fast web view") PDFs for portal downloads')
+    sharding.add_shard_argument(parser)
+    budgets.add_budget_argument(parser)
+    args = parser.parse_args()
+
+    base_dir = '/home/ubuntu/go/src/customers-docs'
+    html_dir = os.path.join(base_dir, 'docs/html')
+    images_dir = os.path.join(base_dir, 'docs/images')
+    pdf_dir = os.path.join(base_dir, 'docs/pdf')
+    index_dir = md_index.index_dir(base_dir)
+    offsets_dir = diagram_offsets.offsets_dir(base_dir)
+
+    md_files = [os.path.join(base_dir, name) for name in SOURCE_FILES]
+    for md_path in md_files:
+        if not os.path.exists(md_path):
+            print(f"File not found: {md_path}")
+    all_files = [f for f in md_files if os.path.exists(f)]
+    md_files = sharding.select_shard(
+        all_files, args.shard, cost=lambda path: sharding.markdown_cost(path, index_dir))
+
+    print(f"Building {len(md_files)} documents")
+    print("-" * 50)
+
+    report = budgets.BudgetReport(budgets.load_budgets(base_dir))
+    with build_history.open_history(base_dir) as history:
+        built, degraded = run_pipeline(md_files, html_dir, images_dir, pdf_dir, split_sections=args.split,
+                                       optimize=args.optimize, linearize=args.linearize, history=history,
+                                       index_dir=index_dir, offsets_dir=offsets_dir, report=report)
+
+    if args.shard:
+        diagram_manifest = diagram_store.load_manifest(images_dir)
+        basenames = [os.path.basename(f).replace('.md', '') for f in md_files]
+        sharding.write_shard_manifest(
+            base_dir, 'build', args.shard, all_files, built,
+            diagrams={b: diagram_manifest[b] for b in basenames if b in diagram_manifest})
+
+    print("-" * 50)
+    print(f"Built {len(built)} documents")
+    for pdf_name, mode in sorted(degraded.items()):
+        print(f"  Degraded: {pdf_name} ({mode})")
+
+    print("-" * 50)
+    return 1 if report.print_report(args.fail_on_budget) else 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,52 @@
+"""
+Byte-level pre-screening of SVG and HTML files for the fix/update scripts.
+Files are memory-mapped and searched for the markers a transform acts on
+(e.g. '<foreignObject', 'fill:#333', '.section-') without decoding them, so
+the full decode and regex transform only runs on files that may need it.
+"""
+
+import mmap
+
+
+def map_file(path):
+    """
+    Memory-map a file read-only.
+    Returns None for an empty file, which cannot be mapped.
+    """
+    with open(path, 'rb') as f:
+        try:
+            return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            return None
+
+
+def find_markers(path, markers):
+    """Return the set of byte markers present in the file at path."""
+    mapped = map_file(path)
+    if mapped is None:
+        return set()
+    with mapped:
+        return {marker for marker in markers if mapped.find(marker) != -1}
+
+
+def contains_any(path, markers):
+    """Check whether the file at path contains any of the byte markers."""
+    mapped = map_file(path)
+    if mapped is None:
+        return False
+    with mapped:
+        return any(mapped.find(marker) != -1 for marker in markers)
+
+
+def matches_pattern(path, pattern, required_marker=None):
+    """
+    Check whether a compiled bytes regex matches the mapped file.
+    If required_marker is given, the regex only runs when it is present.
+    """
+    mapped = map_file(path)
+    if mapped is None:
+        return False
+    with mapped:
+        if required_marker is not None and mapped.find(required_marker) == -1:
+            return False
+        return pattern.search(mapped) is not None
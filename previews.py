@@ -0,0 +1,258 @@
+#!/usr/bin/env python3
+"""
+Build preview images for the documentation portal.
+Renders a thumbnail of each document's first PDF page (pdftoppm, from
+poppler-utils) and of its first diagram (rsvg-convert, from librsvg) and
+embeds them in the document cards of docs/index.html as lazily loaded
+images, so finding a document costs a few KB instead of opening it.
+Previews are named by the hash of the file they are rendered from, so a
+preview is only rendered again when its PDF or diagram changed.
+"""
+
+import os
+import re
+import time
+import shutil
+import hashlib
+import argparse
+import subprocess
+
+import diagram_store
+import build_history
+
+PREVIEWS_DIRNAME = 'previews'
+
+# Thumbnail width in pixels; cards show them at half size for sharp
+# rendering on high-DPI screens
+PREVIEW_WIDTH = 320
+PAGE_JPEG_QUALITY = 70
+
+# Bump when the rendering settings change so every preview is re-rendered
+PREVIEW_VERSION = 1
+
+PREVIEW_FILE = re.compile(r'^[0-9a-f]{16}-(?:page\.jpg|diagram\.png)$')
+
+CARD_START = '<div class="doc-card '
+CARD_PDF_LINK = re.compile(r'href="pdf/([^"]+)\.pdf" class="doc-link pdf"')
+CARD_BODY = '<div class="doc-card-body">'
+PREVIEW_BLOCK = re.compile(r'[ \t]*<div class="doc-previews">.*?</div>\n', flags=re.DOTALL)
+
+PREVIEW_CSS = '''
+        /* Document previews */
+        .doc-previews {
+            display: flex;
+            gap: 10px;
+            padding: 15px 20px 0;
+            background: var(--bg-color);
+        }
+
+        .doc-previews img {
+            flex: 1;
+            min-width: 0;
+            height: 160px;
+            object-fit: contain;
+            object-position: top;
+            background: white;
+            border: 1px solid var(--border-color);
+            border-radius: 6px;
+        }
+'''
+CSS_ANCHOR = '        /* Category Colors */'
+
+
+def file_digest(path):
+    """Return the preview key of an input file: a hash of its content and the settings."""
+    digest = hashlib.sha256(f'{PREVIEW_VERSION}:{PREVIEW_WIDTH}:'.encode())
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            digest.update(chunk)
+    return digest.hexdigest()[:16]
+
+
+def render_page_preview(pdf_path, output_path):
+    """Render the first page of a PDF to a JPEG thumbnail. Returns True on success."""
+    output_prefix = output_path[:-len('.jpg')]
+    result = subprocess.run(
+        ['pdftoppm', '-jpeg', '-jpegopt', f'quality={PAGE_JPEG_QUALITY}', '-f', '1', '-l', '1',
+         '-singlefile', '-scale-to-x', str(PREVIEW_WIDTH), '-scale-to-y', '-1',
+         pdf_path, output_prefix],
+        capture_output=True,
+        text=True
+    )
+    if result.returncode != 0:
+        print(f"    pdftoppm error: {result.stderr.strip()}")
+        return False
+    return os.path.exists(output_path)
+
+
+def render_diagram_preview(svg_path, output_path):
+    """Render an SVG diagram to a PNG thumbnail. Returns True on success."""
+    result = subprocess.run(
+        ['rsvg-convert', '-w', str(PREVIEW_WIDTH), '-f', 'png', '-o', output_path, svg_path],
+        capture_output=True,
+        text=True
+    )
+    if result.returncode != 0:
+        print(f"    rsvg-convert error: {result.stderr.strip()}")
+        if os.path.exists(output_path):
+            os.unlink(output_path)
+        return False
+    return True
+
+
+# Preview kind -> (file suffix, renderer, tool it needs)
+PREVIEW_KINDS = {
+    'page': ('page.jpg', render_page_preview, 'pdftoppm'),
+    'diagram': ('diagram.png', render_diagram_preview, 'rsvg-convert'),
+}
+
+
+def ensure_preview(kind, source_path, previews_dir, can_render=True):
+    """
+    Return the file name of the preview of source_path, rendering it if it
+    isn't cached. Returns None if it is not cached and could not be rendered.
+    """
+    suffix, render, _ = PREVIEW_KINDS[kind]
+    name = f'{file_digest(source_path)}-{suffix}'
+    output_path = os.path.join(previews_dir, name)
+    if os.path.exists(output_path):
+        return name
+    if not can_render:
+        return None
+
+    # Render to a temporary name so an interrupted run leaves no partial preview
+    temp_name = f'tmp{os.getpid()}-{suffix}'
+    temp_path = os.path.join(previews_dir, temp_name)
+    if not render(source_path, temp_path):
+        return None
+    os.replace(temp_path, output_path)
+    print(f"  Rendered {kind} preview of {os.path.basename(source_path)}")
+    return name
+
+
+def card_documents(index_html):
+    """Return the document basenames of the index cards, in page order."""
+    documents = []
+    for card in index_html.split(CARD_START)[1:]:
+        link = CARD_PDF_LINK.search(card)
+        if link:
+            documents.append(link.group(1))
+    return documents
+
+
+def preview_block(title, previews):
+    """Return the preview markup of one card."""
+    images = ''.join(
+        f'\n                        <img src="{PREVIEWS_DIRNAME}/{name}" alt="{title} {kind} preview" '
+        f'loading="lazy" decoding="async" width="{PREVIEW_WIDTH // 2}">'
+        for kind, name in previews)
+    return f'                    <div class="doc-previews">{images}\n                    </div>\n'
+
+
+def embed_previews(index_html, previews):
+    """
+    Return index_html with each card's previews before its body.
+    previews maps a document basename to [(kind, file name)]; cards without
+    previews lose any previously embedded ones.
+    """
+    if PREVIEW_CSS.strip() not in index_html and CSS_ANCHOR in index_html:
+        index_html = index_html.replace(CSS_ANCHOR, PREVIEW_CSS.lstrip('\n') + '\n' + CSS_ANCHOR, 1)
+
+    parts = index_html.split(CARD_START)
+    for i in range(1, len(parts)):
+        card = PREVIEW_BLOCK.sub('', parts[i], count=1)
+        link = CARD_PDF_LINK.search(card)
+        document_previews = previews.get(link.group(1)) if link else None
+        if document_previews and CARD_BODY in card:
+            title = re.search(r'<h3>(.*?)</h3>', card)
+            block = preview_block(title.group(1) if title else link.group(1), document_previews)
+            body = card.index(CARD_BODY)
+            line_start = card.rindex('\n', 0, body) + 1
+            card = card[:line_start] + block + card[line_start:]
+        parts[i] = card
+    return CARD_START.join(parts)
+
+
+def remove_stale_previews(previews_dir, keep):
+    """Delete preview files that no card uses any more. Returns the number removed."""
+    removed = 0
+    for name in os.listdir(previews_dir):
+        if PREVIEW_FILE.match(name) and name not in keep:
+            os.unlink(os.path.join(previews_dir, name))
+            removed += 1
+    return removed
+
+
+def build_previews(documents, pdf_dir, images_dir, previews_dir, history=None):
+    """
+    Render (or reuse) the page and diagram previews of each document.
+    Returns {basename: [(kind, file name)]}.
+    """
+    os.makedirs(previews_dir, exist_ok=True)
+    available = {kind for kind, (_, _, tool) in PREVIEW_KINDS.items() if shutil.which(tool)}
+    for kind, (_, _, tool) in PREVIEW_KINDS.items():
+        if kind not in available:
+            print(f"  Warning: {tool} not found, only cached {kind} previews are used")
+
+    previews = {}
+    for basename in documents:
+        start = time.perf_counter()
+        sources = []
+        pdf_path = os.path.join(pdf_dir, f'{basename}.pdf')
+        if os.path.exists(pdf_path):
+            sources.append(('page', pdf_path))
+        diagrams = diagram_store.document_diagrams(images_dir, basename)
+        if diagrams:
+            sources.append(('diagram', diagrams[0]))
+
+        document_previews = []
+        for kind, source_path in sources:
+            name = ensure_preview(kind, source_path, previews_dir, kind in available)
+            if name:
+                document_previews.append((kind, name))
+        previews[basename] = document_previews
+
+        if history is not None and document_previews:
+            outputs = [os.path.join(previews_dir, name) for _, name in document_previews]
+            history.record('previews', basename, time.perf_counter() - start,
+                           build_history.output_size(outputs))
+    return previews
+
+
+def main():
+    """Render document previews and embed them in the portal index."""
+    parser = argparse.ArgumentParser(description='Render document previews for the portal index.')
+    parser.parse_args()
+
+    base_dir = '/home/ubuntu/go/src/customers-docs'
+    docs_dir = os.path.join(base_dir, 'docs')
+    index_path = os.path.join(docs_dir, 'index.html')
+    previews_dir = os.path.join(docs_dir, PREVIEWS_DIRNAME)
+
+    with open(index_path, 'r', encoding='utf-8') as f:
+        index_html = f.read()
+    documents = card_documents(index_html)
+
+    print(f"Building previews for {len(documents)} documents")
+    print("-" * 50)
+
+    with build_history.open_history(base_dir) as history:
+        previews = build_previews(documents, os.path.join(docs_dir, 'pdf'),
+                                  os.path.join(docs_dir, 'images'), previews_dir, history)
+
+    updated = embed_previews(index_html, previews)
+    if updated != index_html:
+        with open(index_path, 'w', encoding='utf-8') as f:
+            f.write(updated)
+        print(f"  Updated: {os.path.basename(index_path)}")
+
+    keep = {name for document_previews in previews.values() for _, name in document_previews}
+    removed = remove_stale_previews(previews_dir, keep)
+
+    print("-" * 50)
+    total = sum(os.path.getsize(os.path.join(previews_dir, name)) for name in keep)
+    print(f"{len(keep)} previews ({total / 1024:.0f} KB) for {len(documents)} documents"
+          + (f", removed {removed} stale" if removed else ""))
+
+if __name__ == '__main__':
+    main()
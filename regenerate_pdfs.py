@@ -2,17 +2,184 @@
 """
 Script to regenerate PDF files from HTML files using weasyprint.
 The HTML files embed SVG diagrams which now have proper text elements.
+With --book, all documents are rendered into a single PDF with bookmarks
+and a generated table of contents.
 """
 
 import os
 import sys
 import glob
 import re
+import time
+import base64
+import shutil
+import argparse
+import tempfile
+import subprocess
+from html import escape
 
-# Add weasyprint from venv
-sys.path.insert(0, '/tmp/pdfenv/lib/python3.12/site-packages')
+import sharding
+import build_history
+from worker_limits import WorkerResult, run_limited
 
-from weasyprint import HTML, CSS
+# WeasyPrint venv used on the build host when it isn't installed system-wide
+WEASYPRINT_SITE_PACKAGES = '/tmp/pdfenv/lib/python3.12/site-packages'
+
+# Custom CSS to ensure good PDF output with clear diagrams
+PDF_STYLESHEET = '''
+@page {
+    size: A4;
+    margin: 1.5cm;
+}
+body {
+    font-family: 'Segoe UI', Tahoma, Geneva, Verdana, sans-serif;
+    font-size: 11pt;
+    line-height: 1.4;
+}
+.diagram {
+    page-break-inside: avoid;
+    margin: 20px 0;
+    padding: 15px;
+    background-color: #fafafa;
+    border: 1px solid #e0e0e0;
+    border-radius: 4px;
+    overflow: visible;
+}
+/* SVG diagram styling - DO NOT use height: auto as it overrides calculated heights */
+svg {
+    max-width: 100%;
+    display: block;
+    margin: 0 auto;
+}
+/* Ensure SVG text is crisp and readable */
+svg text {
+    font-family: 'trebuchet ms', verdana, arial, sans-serif;
+}
+svg tspan {
+    font-family: 'trebuchet ms', verdana, arial, sans-serif;
+}
+/* Make diagram lines clear */
+svg .flowchart-link,
+svg .edgePath path {
+    stroke-width: 2px !important;
+}
+/* Ensure node boxes are visible */
+svg .node rect,
+svg .node circle,
+svg .node ellipse,
+svg .node polygon {
+    stroke-width: 1.5px !important;
+}
+/* Cluster/subgraph borders */
+svg .cluster rect {
+    stroke-width: 1.5px !important;
+}
+table {
+    width: 100%;
+    border-collapse: collapse;
+    margin: 15px 0;
+}
+th, td {
+    border: 1px solid #ddd;
+    padding: 8px;
+}
+th {
+    background-color: #f8f9fa;
+}
+pre {
+    background-color: #f5f5f5;
+    padding: 10px;
+    font-size: 9pt;
+    overflow-wrap: break-word;
+    white-space: pre-wrap;
+    border-radius: 4px;
+}
+code {
+    font-family: 'Consolas', 'Monaco', monospace;
+    font-size: 0.9em;
+}
+h1, h2, h3, h4, h5, h6 {
+    page-break-after: avoid;
+}
+/* Avoid orphaned headers */
+h1 + *, h2 + *, h3 + * {
+    page-break-before: avoid;
+}
+'''
+
+# Extra CSS for book mode: each document's title becomes a top-level
+# bookmark and the document's own headings nest beneath it
+BOOK_STYLESHEET = '''
+.header-section h1, .book-toc h1 {
+    bookmark-level: 1;
+}
+h1 { bookmark-level: 2; }
+h2 { bookmark-level: 3; }
+h3 { bookmark-level: 4; }
+h4, h5, h6 { bookmark-level: none; }
+.book-toc table, .book-toc th, .book-toc td {
+    border: none;
+}
+.book-toc td {
+    padding: 6px 0;
+    border-bottom: 1px dotted #ccc;
+}
+.book-toc td.page {
+    text-align: right;
+    width: 60px;
+}
+'''
+
+# Table of contents page for book mode
+BOOK_TOC_TEMPLATE = '''<!DOCTYPE html>
+<html lang="en">
+<head>
+    <meta charset="UTF-8">
+    <title>{title}</title>
+</head>
+<body>
+    <div class="book-toc">
+        <h1>{title}</h1>
+        <p>SECURAA Security Documentation</p>
+        <table>
+            {rows}
+        </table>
+    </div>
+</body>
+</html>
+'''
+
+BOOK_TITLE = 'SECURAA Security Documentation Pack'
+BOOK_FILENAME = 'SECURAA_Security_Documentation_Pack.pdf'
+
+# Resident memory ceiling (MB) and time limit (seconds) for one PDF render
+RENDER_RSS_LIMIT_MB = 2048
+RENDER_TIMEOUT = 600
+
+# Render settings, lightest last. When a render goes over the memory ceiling
+# or times out it is retried with the next one: "chunked" renders each <h2>
+# section in its own worker and joins the PDFs, "chunked-raster-diagrams"
+# also replaces the SVG diagrams with PNG images, which are far cheaper to lay out.
+RENDER_MODES = ['full', 'chunked', 'chunked-raster-diagrams']
+
+# Scale of the rasterized diagrams relative to their SVG size, for print quality
+RASTER_ZOOM = 2
+RASTER_TIMEOUT = 60
+
+def import_weasyprint():
+    """
+    Import WeasyPrint on first use.
+    Loading it (and cairo/pango) takes around a second, so commands that
+    never render a PDF should not pay for it at import time.
+    """
+    try:
+        import weasyprint
+    except ImportError:
+        if not os.path.isdir(WEASYPRINT_SITE_PACKAGES):
+            raise
+        sys.path.insert(0, WEASYPRINT_SITE_PACKAGES)
+        import weasyprint
+    return weasyprint
 
 def preprocess_html_for_svgs(html_content):
     """
@@ -68,102 +235,243 @@ def preprocess_html_for_svgs(html_content):
 
     return html_content
 
+def render_pdf_bytes(html_content, base_url=None, stylesheets=None):
+    """
+    Render HTML content already in memory and return the PDF as bytes.
+    stylesheets may be passed in to reuse parsed stylesheets across renders.
+    """
+    # Fix SVG dimensions for proper rendering
+    html_content = preprocess_html_for_svgs(html_content)
+
+    weasyprint = import_weasyprint()
+    if stylesheets is None:
+        stylesheets = [weasyprint.CSS(string=PDF_STYLESHEET)]
+
+    html = weasyprint.HTML(string=html_content, base_url=base_url)
+    return html.write_pdf(stylesheets=stylesheets)
+
+def render_pdf(html_content, pdf_path, base_url):
+    """Render a PDF from HTML content already in memory."""
+    pdf = render_pdf_bytes(html_content, base_url)
+    with open(pdf_path, 'wb') as f:
+        f.write(pdf)
+
+def render_pdf_from_file(html_file, pdf_path, base_url):
+    """
+    Render a PDF from HTML saved in html_file.
+    Worker entry point: the HTML is handed over as a file rather than as a
+    (large) argument to the worker process.
+    """
+    with open(html_file, 'r', encoding='utf-8') as f:
+        render_pdf(f.read(), pdf_path, base_url)
+
 def regenerate_pdf(html_path, pdf_path):
     """Regenerate a single PDF from HTML."""
     print(f"  Generating: {os.path.basename(pdf_path)}")
 
     try:
-        # Read and preprocess the HTML
+        # Read the HTML
         with open(html_path, 'r', encoding='utf-8') as f:
             html_content = f.read()
 
-        # Fix SVG dimensions for proper rendering
-        html_content = preprocess_html_for_svgs(html_content)
-
-        # Custom CSS to ensure good PDF output with clear diagrams
-        custom_css = CSS(string='''
-            @page {
-                size: A4;
-                margin: 1.5cm;
-            }
-            body {
-                font-family: 'Segoe UI', Tahoma, Geneva, Verdana, sans-serif;
-                font-size: 11pt;
-                line-height: 1.4;
-            }
-            .diagram {
-                page-break-inside: avoid;
-                margin: 20px 0;
-                padding: 15px;
-                background-color: #fafafa;
-                border: 1px solid #e0e0e0;
-                border-radius: 4px;
-                overflow: visible;
-            }
-            /* SVG diagram styling - DO NOT use height: auto as it overrides calculated heights */
-            svg {
-                max-width: 100%;
-                display: block;
-                margin: 0 auto;
-            }
-            /* Ensure SVG text is crisp and readable */
-            svg text {
-                font-family: 'trebuchet ms', verdana, arial, sans-serif;
-            }
-            svg tspan {
-                font-family: 'trebuchet ms', verdana, arial, sans-serif;
-            }
-            /* Make diagram lines clear */
-            svg .flowchart-link,
-            svg .edgePath path {
-                stroke-width: 2px !important;
-            }
-            /* Ensure node boxes are visible */
-            svg .node rect,
-            svg .node circle,
-            svg .node ellipse,
-            svg .node polygon {
-                stroke-width: 1.5px !important;
-            }
-            /* Cluster/subgraph borders */
-            svg .cluster rect {
-                stroke-width: 1.5px !important;
-            }
-            table {
-                width: 100%;
-                border-collapse: collapse;
-                margin: 15px 0;
-            }
-            th, td {
-                border: 1px solid #ddd;
-                padding: 8px;
-            }
-            th {
-                background-color: #f8f9fa;
-            }
-            pre {
-                background-color: #f5f5f5;
-                padding: 10px;
-                font-size: 9pt;
-                overflow-wrap: break-word;
-                white-space: pre-wrap;
-                border-radius: 4px;
-            }
-            code {
-                font-family: 'Consolas', 'Monaco', monospace;
-                font-size: 0.9em;
-            }
-            h1, h2, h3, h4, h5, h6 {
-                page-break-after: avoid;
-            }
-            /* Avoid orphaned headers */
-            h1 + *, h2 + *, h3 + * {
-                page-break-before: avoid;
-            }
-        ''')
-
-        html = HTML(string=html_content, base_url=os.path.dirname(html_path))
-        html.write_pdf(pdf_path, stylesheets=[custom_css])
+        render_pdf(html_content, pdf_path, os.path.dirname(html_path))
+        return True
+    except Exception as e:
+        print(f"    Error: {e}")
+        return False
+
+def rasterize_svg(svg_content):
+    """Render an SVG diagram to PNG bytes with rsvg-convert (librsvg)."""
+    result = subprocess.run(
+        ['rsvg-convert', '-f', 'png', '-z', str(RASTER_ZOOM)],
+        input=svg_content.encode('utf-8'),
+        capture_output=True,
+        timeout=RASTER_TIMEOUT
+    )
+    if result.returncode != 0:
+        raise RuntimeError(f"rsvg-convert: {result.stderr.decode('utf-8', errors='replace').strip()}")
+    return result.stdout
+
+def rasterize_diagrams(html_content):
+    """
+    Replace every inline SVG diagram with a PNG image of it, at the same width.
+    Raises if a diagram can't be rasterized, so no PDF is written without it.
+    """
+    def rasterize(match):
+        png = base64.b64encode(rasterize_svg(match.group(1))).decode('ascii')
+        return f'<div class="diagram"><img src="data:image/png;base64,{png}" alt="Diagram" style="width: 100%"></div>'
+
+    return re.sub(r'<div class="diagram">\s*(<svg\b.*?</svg>)\s*</div>', rasterize,
+                  html_content, flags=re.DOTALL)
+
+def split_into_chunks(html_content):
+    """
+    Split an HTML document into standalone documents, one per <h2> section.
+    Each chunk keeps the document's head, so it renders with the same styles.
+    """
+    from convert_md_to_html import split_html_sections
+
+    head, _, body = html_content.partition('<body>')
+    body = body.rsplit('</body>', 1)[0]
+    return [f'{head}<body>\n{section_html}\n</body>\n</html>\n'
+            for _, section_html in split_html_sections(body, '')]
+
+def join_pdfs(pdf_paths, output_path):
+    """Concatenate PDFs into output_path."""
+    import pikepdf
+
+    with pikepdf.new() as joined:
+        for path in pdf_paths:
+            with pikepdf.open(path) as part:
+                joined.pages.extend(part.pages)
+        joined.save(output_path)
+
+def render_pdf_limited(html_content, pdf_path, base_url, rss_limit, timeout, temp_dir):
+    """Render a PDF in one limited worker and return its WorkerResult."""
+    html_file = os.path.join(temp_dir, os.path.splitext(os.path.basename(pdf_path))[0] + '.html')
+    with open(html_file, 'w', encoding='utf-8') as f:
+        f.write(html_content)
+    return run_limited(render_pdf_from_file, (html_file, pdf_path, base_url), rss_limit, timeout)
+
+def render_pdf_chunked(html_content, pdf_path, base_url, rss_limit, timeout, temp_dir):
+    """
+    Render each section in its own limited worker and join the results.
+    Returns the WorkerResult of the first chunk that failed, or of the last
+    one; an 'error' result if the page has no sections to render.
+    """
+    result = WorkerResult('error', 'no sections to render')
+    chunk_paths = []
+    for number, chunk in enumerate(split_into_chunks(html_content), 1):
+        chunk_path = os.path.join(temp_dir, f'chunk_{number}.pdf')
+        result = render_pdf_limited(chunk, chunk_path, base_url, rss_limit, timeout, temp_dir)
+        if not result.ok:
+            result.message = f'section {number}: {result.message}'
+            return result
+        chunk_paths.append(chunk_path)
+    if chunk_paths:
+        join_pdfs(chunk_paths, pdf_path)
+    return result
+
+def render_pdf_isolated(html_content, pdf_path, base_url,
+                        rss_limit_mb=RENDER_RSS_LIMIT_MB, timeout=RENDER_TIMEOUT):
+    """
+    Render a PDF in memory-capped worker processes.
+    Tries each of RENDER_MODES in turn while the render runs out of memory
+    or time; an ordinary rendering error is not retried. The PDF is written
+    to a temporary directory and only moved into place once complete.
+    Returns (mode, problems): the mode that succeeded, or None, and one
+    message per failed attempt.
+    """
+    rss_limit = rss_limit_mb * 2**20
+    problems = []
+
+    with tempfile.TemporaryDirectory(prefix='pdf-render-') as temp_dir:
+        partial_path = os.path.join(temp_dir, os.path.basename(pdf_path))
+        for mode in RENDER_MODES:
+            if mode == 'full':
+                result = render_pdf_limited(html_content, partial_path, base_url, rss_limit, timeout, temp_dir)
+            else:
+                try:
+                    content = rasterize_diagrams(html_content) if mode == 'chunked-raster-diagrams' else html_content
+                    result = render_pdf_chunked(content, partial_path, base_url, rss_limit, timeout, temp_dir)
+                except Exception as e:
+                    problems.append(f'{mode}: {e}')
+                    break
+
+            if result.ok:
+                shutil.move(partial_path, pdf_path)
+                return mode, problems
+
+            problems.append(f'{mode}: {result.message}')
+            if result.status == 'error':
+                break
+
+    return None, problems
+
+def regenerate_pdf_isolated(html_path, pdf_path, rss_limit_mb=RENDER_RSS_LIMIT_MB, timeout=RENDER_TIMEOUT):
+    """
+    Regenerate a single PDF from HTML in memory-capped workers.
+    Returns the render mode used, or None if the PDF could not be rendered.
+    """
+    print(f"  Generating: {os.path.basename(pdf_path)}")
+
+    with open(html_path, 'r', encoding='utf-8') as f:
+        html_content = f.read()
+
+    mode, problems = render_pdf_isolated(html_content, pdf_path, os.path.dirname(html_path),
+                                         rss_limit_mb, timeout)
+    for problem in problems:
+        print(f"    {os.path.basename(pdf_path)}: {problem}")
+    if mode is not None and mode != 'full':
+        print(f"    {os.path.basename(pdf_path)}: degraded, rendered {mode}")
+    return mode
+
+def document_title(html_content, default):
+    """Return the <title> of an HTML document."""
+    match = re.search(r'<title>(.*?)</title>', html_content, flags=re.DOTALL)
+    return match.group(1).strip() if match else default
+
+def render_book_toc(weasyprint, entries, stylesheets, font_config):
+    """
+    Render the table of contents for book mode.
+    entries is a list of (title, page_count) tuples in book order.
+    """
+    toc_pages = 1
+    while True:
+        rows = []
+        page = toc_pages + 1
+        for title, page_count in entries:
+            rows.append(f'<tr><td>{escape(title)}</td><td class="page">{page}</td></tr>')
+            page += page_count
+
+        toc_html = BOOK_TOC_TEMPLATE.format(title=BOOK_TITLE, rows='\n            '.join(rows))
+        toc = weasyprint.HTML(string=toc_html).render(stylesheets=stylesheets, font_config=font_config)
+
+        # Page numbers are only right once the TOC's own length is known
+        if len(toc.pages) == toc_pages:
+            return toc
+        toc_pages = len(toc.pages)
+
+def regenerate_book(html_files, pdf_path):
+    """
+    Render all HTML documents into a single PDF.
+    The stylesheet is parsed once and fonts are shared across documents,
+    so each font is embedded only once in the combined file.
+    """
+    print(f"  Generating: {os.path.basename(pdf_path)}")
+
+    try:
+        weasyprint = import_weasyprint()
+        from weasyprint.text.fonts import FontConfiguration
+
+        font_config = FontConfiguration()
+        stylesheets = [
+            weasyprint.CSS(string=PDF_STYLESHEET, font_config=font_config),
+            weasyprint.CSS(string=BOOK_STYLESHEET, font_config=font_config),
+        ]
+
+        entries = []
+        documents = []
+        for html_path in html_files:
+            print(f"    Rendering: {os.path.basename(html_path)}")
+            with open(html_path, 'r', encoding='utf-8') as f:
+                html_content = f.read()
+
+            title = document_title(html_content, os.path.basename(html_path))
+            html_content = preprocess_html_for_svgs(html_content)
+
+            html = weasyprint.HTML(string=html_content, base_url=os.path.dirname(html_path))
+            document = html.render(stylesheets=stylesheets, font_config=font_config)
+            entries.append((title, len(document.pages)))
+            documents.append(document)
+
+        toc = render_book_toc(weasyprint, entries, stylesheets, font_config)
+        all_pages = list(toc.pages)
+        for document in documents:
+            all_pages.extend(document.pages)
+
+        toc.copy(all_pages).write_pdf(pdf_path)
+        print(f"  Created: {os.path.basename(pdf_path)} ({len(all_pages)} pages)")
         return True
     except Exception as e:
         print(f"    Error: {e}")
@@ -171,27 +479,89 @@ def regenerate_pdf(html_path, pdf_path):
 
 def main():
     """Main function to regenerate all PDFs."""
-    html_dir = '/home/ubuntu/go/src/customers-docs/docs/html'
-    pdf_dir = '/home/ubuntu/go/src/customers-docs/docs/pdf'
+    parser = argparse.ArgumentParser(description='Regenerate PDF files from HTML files.')
+    parser.add_argument('--optimize', action='store_true',
+                        help='post-process each PDF with optimize_pdfs and report sizes')
+    parser.add_argument('--linearize', action='store_true',
+                        help='write linearized ("fast web view") PDFs for portal downloads')
+    parser.add_argument('--book', action='store_true',
+                        help=f'render all documents into a single {BOOK_FILENAME}')
+    parser.add_argument('--jobs', type=int, default=1,
+                        help='number of documents to render at once (default: 1)')
+    parser.add_argument('--rss-limit', type=int, default=RENDER_RSS_LIMIT_MB, metavar='MB',
+                        help=f'memory ceiling per render worker (default: {RENDER_RSS_LIMIT_MB})')
+    parser.add_argument('--timeout', type=int, default=RENDER_TIMEOUT, metavar='SECONDS',
+                        help=f'time limit per render (default: {RENDER_TIMEOUT})')
+    sharding.add_shard_argument(parser)
+    args = parser.parse_args()
+    if args.book and args.shard:
+        parser.error('--book renders a single PDF and cannot be sharded')
+
+    base_dir = '/home/ubuntu/go/src/customers-docs'
+    html_dir = os.path.join(base_dir, 'docs/html')
+    images_dir = os.path.join(base_dir, 'docs/images')
+    pdf_dir = os.path.join(base_dir, 'docs/pdf')
 
     # Get all HTML files (excluding index.html)
-    html_files = [f for f in glob.glob(os.path.join(html_dir, '*.html'))
-                  if not f.endswith('index.html')]
+    all_files = [f for f in glob.glob(os.path.join(html_dir, '*.html'))
+                 if not f.endswith('index.html')]
+    html_files = sharding.select_shard(all_files, args.shard, cost=sharding.manifest_cost(images_dir))
 
     print(f"Found {len(html_files)} HTML files to convert to PDF")
     print("-" * 50)
 
-    success_count = 0
-    for html_path in sorted(html_files):
-        basename = os.path.basename(html_path)
-        pdf_name = basename.replace('.html', '.pdf')
-        pdf_path = os.path.join(pdf_dir, pdf_name)
+    if args.book:
+        book_path = os.path.join(pdf_dir, BOOK_FILENAME)
+        if regenerate_book(sorted(html_files), book_path) and (args.optimize or args.linearize):
+            from optimize_pdfs import optimize_pdf, format_size_change
+            sizes = optimize_pdf(book_path, linearize=args.linearize)
+            if sizes is not None:
+                print('  ' + format_size_change(BOOK_FILENAME, *sizes))
+        print("-" * 50)
+        return
+
+    from concurrent.futures import ThreadPoolExecutor
 
-        if regenerate_pdf(html_path, pdf_path):
+    def render(html_path):
+        pdf_path = os.path.join(pdf_dir, os.path.basename(html_path).replace('.html', '.pdf'))
+        start = time.perf_counter()
+        mode = regenerate_pdf_isolated(html_path, pdf_path, args.rss_limit, args.timeout)
+        return html_path, pdf_path, mode, time.perf_counter() - start
+
+    with build_history.open_history(base_dir) as history:
+        # Renders run in their own worker processes; the threads only wait on them
+        with ThreadPoolExecutor(max_workers=args.jobs) as executor:
+            results = list(executor.map(render, history.longest_first('pdf', html_files)))
+
+        success_count = 0
+        built = {}
+        degraded = []
+        for html_path, pdf_path, mode, seconds in sorted(results):
+            built[html_path] = []
+            if mode is None:
+                continue
+
+            pdf_name = os.path.basename(pdf_path)
+            history.record('pdf', os.path.basename(html_path), seconds, build_history.output_size([pdf_path]))
+            built[html_path] = [pdf_path]
             success_count += 1
+            if mode != 'full':
+                degraded.append((pdf_name, mode))
+            if args.optimize or args.linearize:
+                from optimize_pdfs import optimize_pdf, format_size_change
+                with history.measure('optimize-pdf', pdf_name, [pdf_path]):
+                    sizes = optimize_pdf(pdf_path, linearize=args.linearize)
+                if sizes is not None:
+                    print('  ' + format_size_change(pdf_name, *sizes))
+
+    sharding.write_shard_manifest(base_dir, 'pdf', args.shard, all_files, built)
 
     print("-" * 50)
     print(f"Successfully generated {success_count} out of {len(html_files)} PDFs")
+    if degraded:
+        print(f"Degraded {len(degraded)} PDFs to stay within {args.rss_limit} MB / {args.timeout}s:")
+        for pdf_name, mode in degraded:
+            print(f"  {pdf_name}: {mode}")
 
 if __name__ == '__main__':
     main()
@@ -0,0 +1,335 @@
+#!/usr/bin/env python3
+"""
+Local preview server for reviewing documentation changes.
+Serves docs/ over HTTP, but builds html/<name>.html and pdf/<name>.pdf on
+request from the matching source/**/<name>.md, with the same conversion
+and SVG fix functions as the in-memory pipeline. Only the pages someone
+opens are built; PDFs are rendered on their first request.
+Results are cached in memory and under .build_cache/serve/, keyed by a
+hash of the document's markdown, its diagrams and the build code, and
+served with that key as ETag, so a repeat view is answered from the cache
+or with 304 Not Modified without building anything.
+"""
+
+import io
+import os
+import glob
+import hashlib
+import argparse
+import threading
+import collections
+import http.server
+
+import diagram_store
+import md_index
+
+SERVE_CACHE_DIRNAME = '.build_cache/serve'
+
+# Bump when the way pages are built changes so cached results are ignored
+SERVE_VERSION = 1
+
+KEY_LENGTH = 16
+
+# Rendered results kept in memory, in bytes; the disk cache has no limit
+MEMORY_CACHE_BYTES = 128 * 2**20
+
+# Modules whose code decides what a page looks like; editing any of them
+# invalidates the cached results
+BUILD_MODULES = [
+    'convert_md_to_html', 'pipeline', 'fix_svg_text', 'fix_all_svg_text', 'fix_svg_text_colors',
+    'node_colors', 'update_html_svgs', 'regenerate_pdfs',
+]
+
+# Generated kind -> (URL directory, file suffix, content type)
+GENERATED_KINDS = {
+    'html': ('html', '.html', 'text/html; charset=utf-8'),
+    'pdf': ('pdf', '.pdf', 'application/pdf'),
+}
+
+
+def code_digest():
+    """Return a hash of the build modules' source code."""
+    import importlib
+
+    digest = hashlib.sha256()
+    for name in BUILD_MODULES:
+        with open(importlib.import_module(name).__file__, 'rb') as f:
+            digest.update(f.read())
+    return digest.hexdigest()
+
+
+def find_sources(source_dir):
+    """Return {basename: markdown path} for source/**/*.md; the first path wins on a clash."""
+    sources = {}
+    for md_path in sorted(glob.glob(os.path.join(source_dir, '**', '*.md'), recursive=True)):
+        sources.setdefault(os.path.basename(md_path)[:-len('.md')], md_path)
+    return sources
+
+
+class FileHashes:
+    """Content hashes of files, re-read only when their size or mtime changes."""
+
+    def __init__(self):
+        self.hashes = {}
+        self.lock = threading.Lock()
+
+    def get(self, path):
+        """Return the sha256 hex digest of a file, or '-' if it doesn't exist."""
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return '-'
+        signature = (stat.st_size, stat.st_mtime_ns)
+        with self.lock:
+            cached = self.hashes.get(path)
+        if cached and cached[0] == signature:
+            return cached[1]
+        with open(path, 'rb') as f:
+            digest = hashlib.sha256(f.read()).hexdigest()
+        with self.lock:
+            self.hashes[path] = (signature, digest)
+        return digest
+
+
+class ResultCache:
+    """
+    Rendered results by key: a size-bounded in-memory LRU in front of a
+    directory of files named <key><suffix>.
+    """
+
+    def __init__(self, cache_dir, memory_bytes=MEMORY_CACHE_BYTES):
+        self.cache_dir = cache_dir
+        self.memory_bytes = memory_bytes
+        self.entries = collections.OrderedDict()
+        self.size = 0
+        self.lock = threading.Lock()
+
+    def path(self, key, suffix):
+        return os.path.join(self.cache_dir, f'{key}{suffix}')
+
+    def remember(self, name, body):
+        """Add a result to the memory cache, evicting the least recently used ones."""
+        with self.lock:
+            if name in self.entries:
+                return
+            self.entries[name] = body
+            self.size += len(body)
+            while self.size > self.memory_bytes and len(self.entries) > 1:
+                _, evicted = self.entries.popitem(last=False)
+                self.size -= len(evicted)
+
+    def get(self, key, suffix):
+        """Return a cached result from memory or disk, or None."""
+        name = f'{key}{suffix}'
+        with self.lock:
+            body = self.entries.get(name)
+            if body is not None:
+                self.entries.move_to_end(name)
+                return body
+        try:
+            with open(self.path(key, suffix), 'rb') as f:
+                body = f.read()
+        except OSError:
+            return None
+        self.remember(name, body)
+        return body
+
+    def put(self, key, suffix, body):
+        """Store a result in memory and, atomically, on disk."""
+        os.makedirs(self.cache_dir, exist_ok=True)
+        path = self.path(key, suffix)
+        temp_path = f'{path}.{os.getpid()}.{threading.get_ident()}.tmp'
+        with open(temp_path, 'wb') as f:
+            f.write(body)
+        os.replace(temp_path, path)
+        self.remember(f'{key}{suffix}', body)
+
+
+class PreviewBuilder:
+    """Builds and caches the HTML pages and PDFs of the source documents."""
+
+    def __init__(self, base_dir):
+        self.source_dir = os.path.join(base_dir, 'source')
+        self.html_dir = os.path.join(base_dir, 'docs/html')
+        self.images_dir = os.path.join(base_dir, 'docs/images')
+        self.index_dir = md_index.index_dir(base_dir)
+        self.cache = ResultCache(os.path.join(base_dir, SERVE_CACHE_DIRNAME))
+        self.file_hashes = FileHashes()
+        self.code_digest = code_digest()
+        self.sources = find_sources(self.source_dir)
+
+        # One build at a time: builds update the shared diagram store and manifest.
+        # PDFs take longer and have their own lock so pages can still be built meanwhile
+        self.build_lock = threading.Lock()
+        self.pdf_lock = threading.Lock()
+
+    def source_path(self, basename):
+        """Return the markdown source of a document, looking for new sources on a miss."""
+        if basename not in self.sources:
+            self.sources = find_sources(self.source_dir)
+        return self.sources.get(basename)
+
+    def document_key(self, md_path):
+        """Return the cache key of a document: a hash of everything its output is built from."""
+        basename = os.path.basename(md_path)[:-len('.md')]
+        _, index = md_index.load_index(md_path, self.index_dir)
+        digest = hashlib.sha256(f'{SERVE_VERSION}:{self.code_digest}:{basename}:{index["hash"]}'.encode())
+        for block in index['diagrams']:
+            blob = diagram_store.blob_path(self.images_dir, block['key'])
+            digest.update(f'\n{block["key"]}:{self.file_hashes.get(blob)}'.encode())
+        return digest.hexdigest()[:KEY_LENGTH]
+
+    def build_html(self, md_path):
+        """Build a document's HTML page with the pipeline stages. Returns (key, page)."""
+        from fix_svg_text_colors import HA_DR_DOCUMENT
+        from pipeline import load_document, fix_document_diagrams, build_document_html
+
+        document = load_document(md_path, self.images_dir, self.index_dir)
+        ha_dr_keys = set(diagram_store.load_manifest(self.images_dir).get(HA_DR_DOCUMENT, []))
+        fix_document_diagrams(document, self.images_dir, {}, ha_dr_keys)
+        build_document_html(document)
+        print(f"  Built: {document.basename}.html")
+
+        # Key by the inputs as they are after the build, which may have
+        # adopted or fixed diagrams, so the next request finds this page
+        key = self.document_key(md_path)
+        page = document.html.encode('utf-8')
+        self.cache.put(key, '.html', page)
+        return key, page
+
+    def html(self, md_path, key):
+        """Return (key, page) of a document's HTML, building it if it isn't cached."""
+        page = self.cache.get(key, '.html')
+        if page is not None:
+            return key, page
+        with self.build_lock:
+            # Another request may have built it while this one waited
+            key = self.document_key(md_path)
+            page = self.cache.get(key, '.html')
+            if page is not None:
+                return key, page
+            return self.build_html(md_path)
+
+    def pdf(self, md_path, key):
+        """
+        Return (key, pdf) of a document, rendering it from its HTML if it
+        isn't cached. Returns (key, None) if the PDF could not be rendered.
+        """
+        from regenerate_pdfs import render_pdf_isolated
+
+        pdf = self.cache.get(key, '.pdf')
+        if pdf is not None:
+            return key, pdf
+        key, page = self.html(md_path, key)
+        with self.pdf_lock:
+            pdf = self.cache.get(key, '.pdf')
+            if pdf is not None:
+                return key, pdf
+
+            basename = os.path.basename(md_path)[:-len('.md')]
+            print(f"  Generating: {basename}.pdf")
+            pdf_path = self.cache.path(key, '.pdf')
+            os.makedirs(self.cache.cache_dir, exist_ok=True)
+            mode, problems = render_pdf_isolated(page.decode('utf-8'), pdf_path, self.html_dir)
+            for problem in problems:
+                print(f"    {basename}.pdf: {problem}")
+            if mode is None:
+                return key, None
+            if mode != 'full':
+                print(f"    Degraded: rendered {mode}")
+            return key, self.cache.get(key, '.pdf')
+
+
+def etag_matches(header, etag):
+    """Check whether an If-None-Match header matches an ETag."""
+    if not header:
+        return False
+    candidates = [candidate.strip() for candidate in header.split(',')]
+    candidates = [candidate[2:] if candidate.startswith('W/') else candidate for candidate in candidates]
+    return '*' in candidates or etag in candidates
+
+
+def make_handler(builder, docs_dir):
+    """Return a request handler class serving docs_dir with generated pages from builder."""
+
+    class PreviewHandler(http.server.SimpleHTTPRequestHandler):
+
+        def __init__(self, *args, **kwargs):
+            super().__init__(*args, directory=docs_dir, **kwargs)
+
+        def generated_document(self):
+            """Return (kind, markdown path) if the request is for a generated page, else None."""
+            path = self.path.split('?', 1)[0].split('#', 1)[0]
+            for kind, (directory, suffix, _) in GENERATED_KINDS.items():
+                prefix = f'/{directory}/'
+                if path.startswith(prefix) and path.endswith(suffix):
+                    basename = path[len(prefix):-len(suffix)]
+                    if '/' not in basename:
+                        md_path = builder.source_path(basename)
+                        if md_path:
+                            return kind, md_path
+            return None
+
+        def send_head(self):
+            generated = self.generated_document()
+            if generated is None:
+                return super().send_head()
+            kind, md_path = generated
+            _, suffix, content_type = GENERATED_KINDS[kind]
+
+            try:
+                key = builder.document_key(md_path)
+                etag = f'"{key}{suffix}"'
+                if etag_matches(self.headers.get('If-None-Match'), etag):
+                    self.send_response(304)
+                    self.send_header('ETag', etag)
+                    self.end_headers()
+                    return None
+                key, body = builder.html(md_path, key) if kind == 'html' else builder.pdf(md_path, key)
+            except Exception as e:
+                self.send_error(500, f'Building {os.path.basename(md_path)} failed: {e}')
+                return None
+            if body is None:
+                self.send_error(500, f'Rendering the PDF of {os.path.basename(md_path)} failed')
+                return None
+
+            self.send_response(200)
+            self.send_header('Content-Type', content_type)
+            self.send_header('Content-Length', str(len(body)))
+            self.send_header('ETag', f'"{key}{suffix}"')
+            # Revalidate on every view so edits show up, answered with 304 when unchanged
+            self.send_header('Cache-Control', 'no-cache')
+            self.end_headers()
+            return io.BytesIO(body)
+
+    return PreviewHandler
+
+
+def main():
+    """Serve the documentation with pages built on request."""
+    parser = argparse.ArgumentParser(description='Serve the documentation, building pages on request.')
+    parser.add_argument('--host', default='127.0.0.1', help='address to listen on (default: 127.0.0.1)')
+    parser.add_argument('--port', type=int, default=8000, help='port to listen on (default: 8000)')
+    args = parser.parse_args()
+
+    base_dir = '/home/ubuntu/go/src/customers-docs'
+    docs_dir = os.path.join(base_dir, 'docs')
+
+    builder = PreviewBuilder(base_dir)
+    server = http.server.ThreadingHTTPServer((args.host, args.port), make_handler(builder, docs_dir))
+
+    print(f"Serving {len(builder.sources)} source documents")
+    print("-" * 50)
+    print(f"  http://{args.host}:{args.port}/")
+    print(f"  Pages: /html/<name>.html, PDFs: /pdf/<name>.pdf")
+    print("-" * 50)
+
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print("\nStopped")
+    finally:
+        server.server_close()
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,291 @@
+#!/usr/bin/env python3
+"""
+Deterministic sharding of the build stages across machines or processes.
+Every stage accepts --shard i/N (1-based) and processes only the documents
+assigned to shard i. Documents are assigned by a greedy longest-first split
+on estimated cost, keyed by file basename. Costs are only estimated from
+files that no stage rewrites (the source markdown and the diagram
+manifest), never from the stage's own inputs, which the SVG fix and
+update-html stages change in place: every runner and every local shard
+process computes the same assignment, whenever it starts.
+
+Each sharded run writes a shard manifest to .build_cache/shards/ listing
+its outputs and their hashes. The merge step (docs-build merge-shards)
+collects the manifests of all N shards, optionally copies the outputs in
+from per-runner directories, and checks that every document was built
+exactly once and that the merged files are the ones the shards produced.
+"""
+
+import os
+import sys
+import glob
+import json
+import shutil
+import hashlib
+import argparse
+
+import diagram_store
+
+SHARD_DIRNAME = '.build_cache/shards'
+
+# Estimated cost of one diagram, in bytes of document. Rendering a diagram
+# with mmdc costs far more than converting the surrounding text.
+DIAGRAM_COST = 100 * 1024
+
+# Estimated cost of a document page apart from its diagrams
+DOCUMENT_COST = 20 * 1024
+
+
+def parse_shard(value):
+    """Parse an "i/N" shard spec (1 <= i <= N) for argparse."""
+    try:
+        index, count = (int(part) for part in value.split('/'))
+    except ValueError:
+        raise argparse.ArgumentTypeError(f'expected i/N, got {value!r}')
+    if count < 1 or not 1 <= index <= count:
+        raise argparse.ArgumentTypeError(f'shard index must be between 1 and N, got {value!r}')
+    return index, count
+
+
+def add_shard_argument(parser):
+    """Add the common --shard option to a stage's argument parser."""
+    parser.add_argument('--shard', type=parse_shard, metavar='i/N',
+                        help='process only shard i of N (1-based); see docs-build merge-shards')
+
+
+def markdown_cost(md_path, cache_dir=None):
+    """Estimate the build cost of a markdown source from its structural index."""
+    import md_index
+
+    text, index = md_index.load_index(md_path, cache_dir)
+    return len(text.encode('utf-8')) + len(index['diagrams']) * DIAGRAM_COST
+
+
+def estimate_cost(path):
+    """
+    Estimate the build cost of a stage input without reading it.
+    Markdown sources are costed from their content, which no stage changes;
+    any other input (a diagram SVG) counts as one diagram.
+    """
+    if path.endswith('.md'):
+        return markdown_cost(path)
+    return DIAGRAM_COST
+
+
+def manifest_cost(images_dir):
+    """
+    Return a cost function for per-document outputs (HTML pages, PDFs) that
+    counts each document's diagrams in the diagram manifest.
+    """
+    manifest = diagram_store.load_manifest(images_dir)
+
+    def cost(path):
+        basename = os.path.splitext(os.path.basename(path))[0]
+        return DOCUMENT_COST + len(manifest.get(basename, [])) * DIAGRAM_COST
+    return cost
+
+
+def assign_shards(paths, count, cost=estimate_cost):
+    """
+    Split paths into count shards balanced by estimated cost.
+    Returns a list of count lists of paths. The split only depends on the
+    basenames and on cost, which must not depend on files the stages
+    rewrite, so it is the same on every runner and in every shard process.
+    """
+    costed = sorted(((cost(path), os.path.basename(path), path) for path in paths),
+                    key=lambda item: (-item[0], item[1]))
+
+    shards = [[] for _ in range(count)]
+    loads = [0] * count
+    for item_cost, _, path in costed:
+        # Least-loaded shard, lowest index on ties
+        target = min(range(count), key=lambda i: (loads[i], i))
+        shards[target].append(path)
+        loads[target] += item_cost
+
+    return [sorted(shard) for shard in shards]
+
+
+def select_shard(paths, shard, cost=estimate_cost):
+    """Return the paths assigned to shard (index, count), or all paths if shard is None."""
+    if shard is None:
+        return sorted(paths)
+    index, count = shard
+    selected = assign_shards(paths, count, cost)[index - 1]
+    print(f"Shard {index}/{count}: {len(selected)} of {len(paths)} inputs")
+    return selected
+
+
+def file_sha256(path):
+    """Return the sha256 hex digest of a file."""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def shard_manifest_path(base_dir, stage, shard):
+    """Return the manifest path for one shard of a stage."""
+    index, count = shard
+    return os.path.join(base_dir, SHARD_DIRNAME, f'{stage}-{index}-of-{count}.json')
+
+
+def write_shard_manifest(base_dir, stage, shard, inputs, outputs, diagrams=None):
+    """
+    Record what one shard of a stage built.
+    inputs is the full (unsharded) input list; outputs maps each assigned
+    input to the output files it produced. Outputs that don't exist (failed
+    documents) are left out, so the merge step reports them as missing.
+    diagrams optionally maps document basenames to their diagram store keys.
+    """
+    if shard is None:
+        return
+
+    entries = {}
+    for input_path, output_paths in outputs.items():
+        entries[os.path.basename(input_path)] = {
+            os.path.relpath(path, base_dir): file_sha256(path)
+            for path in output_paths if os.path.exists(path)
+        }
+
+    manifest = {
+        'stage': stage,
+        'shard': list(shard),
+        'inputs': sorted(os.path.basename(path) for path in inputs),
+        'outputs': entries,
+        'diagrams': diagrams or {},
+    }
+
+    manifest_path = shard_manifest_path(base_dir, stage, shard)
+    os.makedirs(os.path.dirname(manifest_path), exist_ok=True)
+
+    # Drop manifests left by an earlier run with a different shard count
+    pattern = os.path.join(base_dir, SHARD_DIRNAME, f'{glob.escape(stage)}-*-of-*.json')
+    for stale_path in glob.glob(pattern):
+        if not stale_path.endswith(f'-of-{shard[1]}.json'):
+            os.unlink(stale_path)
+
+    with open(manifest_path, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, indent=1, sort_keys=True)
+
+
+def load_shard_manifests(roots, stage):
+    """Load every shard manifest of a stage as (root, manifest) pairs."""
+    manifests = []
+    for root in roots:
+        pattern = os.path.join(root, SHARD_DIRNAME, f'{glob.escape(stage)}-*-of-*.json')
+        for path in sorted(glob.glob(pattern)):
+            with open(path, 'r', encoding='utf-8') as f:
+                manifests.append((root, json.load(f)))
+    return manifests
+
+
+def check_shard_set(manifests):
+    """
+    Check that the manifests form one complete set of shards.
+    Returns a list of problems.
+    """
+    if not manifests:
+        return ['no shard manifests found']
+
+    problems = []
+    counts = {manifest['shard'][1] for _, manifest in manifests}
+    input_sets = {tuple(manifest['inputs']) for _, manifest in manifests}
+    if len(counts) != 1:
+        problems.append(f'shard manifests disagree on the shard count: {sorted(counts)}')
+    if len(input_sets) != 1:
+        problems.append('shard manifests were built from different input sets')
+    if problems:
+        return problems
+
+    count = counts.pop()
+    indexes = sorted(manifest['shard'][0] for _, manifest in manifests)
+    if indexes != list(range(1, count + 1)):
+        problems.append(f'expected shards 1..{count}, found {indexes}')
+
+    inputs = set(input_sets.pop())
+    seen = {}
+    for _, manifest in manifests:
+        for name in manifest['outputs']:
+            if name in seen:
+                problems.append(f'{name} built by shards {seen[name]} and {manifest["shard"][0]}')
+            seen[name] = manifest['shard'][0]
+
+    for name in sorted(inputs - set(seen)):
+        problems.append(f'{name} was not built by any shard')
+    for name in sorted(set(seen) - inputs):
+        problems.append(f'{name} is not one of the stage inputs')
+
+    return problems
+
+
+def merge_shards(base_dir, stage, shard_roots=None):
+    """
+    Merge and verify the outputs of all shards of a stage into base_dir.
+    shard_roots are per-runner copies of the build tree; their outputs are
+    copied into base_dir first. Without shard_roots the shards are assumed
+    to have written into base_dir directly (e.g. processes on one machine).
+    Returns a list of problems; an empty list means the merge is complete.
+    """
+    roots = shard_roots or [base_dir]
+    manifests = load_shard_manifests(roots, stage)
+    problems = check_shard_set(manifests)
+    if problems:
+        return problems
+
+    images_dir = os.path.join(base_dir, 'docs/images')
+    for root, manifest in manifests:
+        for name, files in sorted(manifest['outputs'].items()):
+            if not files:
+                problems.append(f'{name}: shard {manifest["shard"][0]} produced no output')
+            for relpath, digest in sorted(files.items()):
+                source = os.path.join(root, relpath)
+                target = os.path.join(base_dir, relpath)
+                if os.path.abspath(root) != os.path.abspath(base_dir) and os.path.exists(source):
+                    os.makedirs(os.path.dirname(target), exist_ok=True)
+                    shutil.copyfile(source, target)
+                if not os.path.exists(target):
+                    problems.append(f'{name}: missing output {relpath}')
+                elif file_sha256(target) != digest:
+                    problems.append(f'{name}: {relpath} differs from what shard {manifest["shard"][0]} built')
+
+        for basename, keys in manifest['diagrams'].items():
+            diagram_store.record_document(images_dir, basename, keys)
+
+        if os.path.abspath(root) != os.path.abspath(base_dir):
+            source = shard_manifest_path(root, stage, manifest['shard'])
+            target = shard_manifest_path(base_dir, stage, manifest['shard'])
+            os.makedirs(os.path.dirname(target), exist_ok=True)
+            shutil.copyfile(source, target)
+
+    return problems
+
+
+def main():
+    """Merge and verify the outputs of a sharded stage."""
+    parser = argparse.ArgumentParser(description='Merge and verify the outputs of a sharded build stage.')
+    parser.add_argument('stage', help='stage name as passed to docs-build (e.g. html, pdf)')
+    parser.add_argument('shard_roots', nargs='*', metavar='shard_root',
+                        help='per-runner build directories to merge from '
+                             '(default: shards wrote into this tree)')
+    args = parser.parse_args()
+
+    base_dir = '/home/ubuntu/go/src/customers-docs'
+
+    print(f"Merging shards of stage '{args.stage}'")
+    print("-" * 50)
+
+    problems = merge_shards(base_dir, args.stage, args.shard_roots)
+    for problem in problems:
+        print(f"  {problem}")
+
+    print("-" * 50)
+    if problems:
+        print(f"Merge incomplete: {len(problems)} problems")
+        return 1
+    print("All shards merged, outputs complete")
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,425 @@
+#!/usr/bin/env python3
+"""
+Output snapshots for regression checks.
+A snapshot records normalized content hashes of every build artifact: each
+HTML page (its text and each inline diagram separately), each SVG, and for
+each PDF the text, drawn images/diagrams and layout of every page. Comparing
+the current outputs with a snapshot names the exact document, diagram or
+page that changed, so an optimization of a build stage can be checked
+against the outputs it produced before.
+Files whose size and modification time match the snapshot are not re-read,
+and files whose bytes match are not re-parsed, so a compare of an unchanged
+tree only stats the files.
+"""
+
+import os
+import re
+import sys
+import json
+import array
+import time
+import hashlib
+import argparse
+
+import diagram_store
+
+SNAPSHOT_DIRNAME = '.build_cache/snapshots'
+DEFAULT_SNAPSHOT = 'baseline'
+
+# Bump when hashing or normalization changes so old snapshots are rehashed
+SNAPSHOT_VERSION = 1
+
+# Output directories under docs/ and the artifact types they hold
+ARTIFACT_DIRS = [('html', '.html'), ('images', '.svg'), ('pdf', '.pdf')]
+
+INLINE_SVG = re.compile(r'<svg\b.*?</svg>', flags=re.DOTALL)
+TRAILING_SPACE = re.compile(r'[ \t]+$', flags=re.MULTILINE)
+
+# Content stream tokens: a font selection, or a text-showing operator
+TEXT_TOKEN = re.compile(
+    rb'/([^\s/\[\]<>()]+)\s+[-\d.]+\s+Tf\b'
+    rb'|(\[[^\]\\]*(?:\\.[^\]\\]*)*\]|<[0-9A-Fa-f\s]*>|\([^\\)]*(?:\\.[^\\)]*)*\))\s*(?:TJ|Tj|\'|")'
+)
+HEX_STRING = re.compile(rb'<([0-9A-Fa-f\s]*)>')
+STRING_IN_ARRAY = re.compile(rb'<[0-9A-Fa-f\s]*>|\((?:\\.|[^\\)])*\)')
+FONT_SELECTION = re.compile(rb'/([^\s/\[\]<>()]+)(\s+[-\d.]+\s+Tf\b)')
+XOBJECT_DRAW = re.compile(rb'/([^\s/\[\]<>()]+)\s+Do\b')
+BF_CHAR = re.compile(rb'<([0-9A-Fa-f]+)>\s*<([0-9A-Fa-f]+)>')
+BF_RANGE = re.compile(rb'<([0-9A-Fa-f]+)>\s*<([0-9A-Fa-f]+)>\s*<([0-9A-Fa-f]+)>')
+
+
+def snapshot_path(base_dir, name):
+    """Return the path of a named snapshot of a build tree."""
+    return os.path.join(base_dir, SNAPSHOT_DIRNAME, f'{name}.json')
+
+
+def digest(data):
+    """Return the hex SHA-256 of bytes or text."""
+    if isinstance(data, str):
+        data = data.encode('utf-8')
+    return hashlib.sha256(data).hexdigest()
+
+
+def normalize_markup(text):
+    """Normalize line endings and trailing whitespace of HTML or SVG text."""
+    return TRAILING_SPACE.sub('', text.replace('\r\n', '\n')).strip()
+
+
+def svg_entry(data):
+    """Return the snapshot details of an SVG file's bytes."""
+    return {'content': digest(normalize_markup(data.decode('utf-8', errors='replace')))}
+
+
+def html_entry(data):
+    """
+    Return the snapshot details of an HTML page's bytes: a hash of the page
+    with its inline diagrams cut out, and one hash per diagram.
+    """
+    text = normalize_markup(data.decode('utf-8', errors='replace'))
+    diagrams = [digest(normalize_markup(svg)) for svg in INLINE_SVG.findall(text)]
+    return {'content': digest(INLINE_SVG.sub('<svg/>', text)), 'diagrams': diagrams}
+
+
+def parse_to_unicode(cmap_data):
+    """Return {code: text} from a ToUnicode CMap stream."""
+    mapping = {}
+
+    def unicode_text(hex_digits):
+        raw = bytes.fromhex(hex_digits.decode())
+        return raw.decode('utf-16-be', errors='replace')
+
+    for block in re.findall(rb'beginbfrange(.*?)endbfrange', cmap_data, flags=re.DOTALL):
+        for first, last, target in BF_RANGE.findall(block):
+            start = int(first, 16)
+            base = unicode_text(target)
+            for offset in range(int(last, 16) - start + 1):
+                mapping[start + offset] = base[:-1] + chr(ord(base[-1]) + offset) if base else ''
+    for block in re.findall(rb'beginbfchar(.*?)endbfchar', cmap_data, flags=re.DOTALL):
+        for code, target in BF_CHAR.findall(block):
+            mapping[int(code, 16)] = unicode_text(target)
+    return mapping
+
+
+def literal_or_hex_bytes(string):
+    """Return the bytes of a PDF string token, <hex> or (literal)."""
+    if string.startswith(b'<'):
+        return bytes.fromhex(string[1:-1].decode())
+    return re.sub(rb'\\(.)', rb'\1', string[1:-1])
+
+
+class FontInfo:
+    """What text hashing needs to know about a PDF font: name, code width and ToUnicode map."""
+
+    def __init__(self, font):
+        base_font = str(font.get('/BaseFont', ''))
+        # Drop the random subset tag (ABCDEF+) so re-renders hash the same
+        self.name = base_font.split('+', 1)[-1].lstrip('/')
+        self.code_bytes = 2 if str(font.get('/Subtype', '')) == '/Type0' else 1
+        to_unicode = font.get('/ToUnicode')
+        self.to_unicode = parse_to_unicode(to_unicode.read_bytes()) if to_unicode is not None else {}
+
+    def decode(self, operand):
+        """
+        Decode the strings of a text operator's operand to text. WeasyPrint
+        writes one <hex> string per glyph, so hex strings are decoded together.
+        """
+        if b'(' in operand:
+            raw = b''.join(literal_or_hex_bytes(s) for s in STRING_IN_ARRAY.findall(operand))
+        else:
+            raw = bytes.fromhex(b''.join(HEX_STRING.findall(operand)).decode())
+        if self.code_bytes == 1:
+            return ''.join(self.to_unicode.get(code, chr(code)) for code in raw)
+        codes = array.array('H', raw[:len(raw) // 2 * 2])
+        if sys.byteorder == 'little':
+            codes.byteswap()
+        return ''.join(self.to_unicode.get(code, '\ufffd') for code in codes)
+
+
+class PdfHasher:
+    """Hash PDF pages, caching font and XObject details shared across pages."""
+
+    def __init__(self):
+        self.fonts = {}
+        self.resources = {}
+        self.xobjects = {}
+
+    def font_info(self, font):
+        key = font.objgen
+        if key not in self.fonts or key == (0, 0):
+            self.fonts[key] = FontInfo(font)
+        return self.fonts[key]
+
+    def resource_fonts(self, resources):
+        """Return {resource name: FontInfo} of a resource dictionary."""
+        fonts = resources.get('/Font') if resources is not None else None
+        if fonts is None:
+            return {}
+        # WeasyPrint shares one resource dictionary between pages
+        key = fonts.objgen
+        if key in self.resources and key != (0, 0):
+            return self.resources[key]
+        self.resources[key] = {name[1:].encode(): self.font_info(fonts[name]) for name in fonts.keys()}
+        return self.resources[key]
+
+    def stream_text(self, content, fonts):
+        """Return the text a content stream shows, one line per text operator."""
+        lines = []
+        font = None
+        for match in TEXT_TOKEN.finditer(content):
+            if match.group(1) is not None:
+                font = fonts.get(match.group(1))
+                continue
+            if font is None:
+                continue
+            lines.append(font.decode(match.group(2)))
+        return '\n'.join(lines)
+
+    def normalized_content(self, content, fonts):
+        """Return a content stream with font resource names replaced by font names."""
+        def font_name(match):
+            font = fonts.get(match.group(1))
+            name = font.name.encode() if font is not None else match.group(1)
+            return b'/' + name + match.group(2)
+        return FONT_SELECTION.sub(font_name, content)
+
+    def xobject_hash(self, xobject):
+        """Return a stable hash of an image or form XObject (e.g. a diagram)."""
+        key = xobject.objgen
+        if key in self.xobjects and key != (0, 0):
+            return self.xobjects[key]
+        if str(xobject.get('/Subtype', '')) == '/Form':
+            resources = xobject.get('/Resources')
+            content = xobject.read_bytes()
+            geometry = f"{xobject.get('/BBox')} {xobject.get('/Matrix')}".encode()
+            parts = [geometry, self.normalized_content(content, self.resource_fonts(resources))]
+            parts += [self.drawn_xobject_hash(resources, name).encode()
+                      for name in XOBJECT_DRAW.findall(content)]
+            value = digest(b'\n'.join(parts))
+        else:
+            # Decoded, so recompressing the PDF (optimize-pdf) keeps the hash
+            try:
+                data = xobject.read_bytes()
+            except Exception:
+                data = xobject.read_raw_bytes()
+            size = f"{xobject.get('/Width')}x{xobject.get('/Height')}".encode()
+            value = digest(size + b'\n' + data)
+        self.xobjects[key] = value
+        return value
+
+    def drawn_xobject_hash(self, resources, name):
+        """Return the hash of the XObject a Do operator draws, or '' if it is missing."""
+        xobjects = resources.get('/XObject') if resources is not None else None
+        if xobjects is None or f'/{name.decode()}' not in xobjects:
+            return ''
+        return self.xobject_hash(xobjects[f'/{name.decode()}'])
+
+    def page_entry(self, page):
+        """Return {'text', 'images', 'layout'} hashes of one page."""
+        import pikepdf
+
+        contents = page.obj.get('/Contents')
+        if contents is None:
+            content = b''
+        elif isinstance(contents, pikepdf.Array):
+            content = b'\n'.join(stream.read_bytes() for stream in contents)
+        else:
+            content = contents.read_bytes()
+        resources = page.obj.get('/Resources')
+        fonts = self.resource_fonts(resources)
+        return {
+            'text': digest(self.stream_text(content, fonts)),
+            'images': [self.drawn_xobject_hash(resources, name) for name in XOBJECT_DRAW.findall(content)],
+            'layout': digest(self.normalized_content(content, fonts)),
+        }
+
+
+def pdf_entry(path):
+    """Return the snapshot details of a PDF: per-page hashes."""
+    import pikepdf
+
+    hasher = PdfHasher()
+    with pikepdf.open(path) as pdf:
+        return {'pages': [hasher.page_entry(page) for page in pdf.pages]}
+
+
+def artifact_entry(path, kind, data):
+    """Return the snapshot details of an artifact's bytes."""
+    if kind == 'html':
+        return html_entry(data)
+    if kind == 'pdf':
+        return pdf_entry(path)
+    return svg_entry(data)
+
+
+def list_artifacts(docs_dir):
+    """Return [(relative path, kind, absolute path)] of the build outputs under docs/."""
+    artifacts = []
+    for dirname, extension in ARTIFACT_DIRS:
+        top = os.path.join(docs_dir, dirname)
+        for root, dirs, files in os.walk(top):
+            dirs.sort()
+            for name in sorted(files):
+                if name.endswith(extension):
+                    path = os.path.join(root, name)
+                    artifacts.append((os.path.relpath(path, docs_dir), extension[1:], path))
+    return artifacts
+
+
+def take_snapshot(docs_dir, previous=None):
+    """
+    Hash the build outputs under docs_dir.
+    Entries of files unchanged since the previous snapshot are reused: by
+    size and mtime without reading the file, or by raw hash without parsing.
+    Returns (snapshot, problems).
+    """
+    previous_entries = {}
+    if previous and previous.get('version') == SNAPSHOT_VERSION:
+        previous_entries = previous['artifacts']
+
+    artifacts = {}
+    problems = []
+    for relative, kind, path in list_artifacts(docs_dir):
+        stat = os.stat(path)
+        old = previous_entries.get(relative)
+        if old and old['size'] == stat.st_size and old['mtime_ns'] == stat.st_mtime_ns:
+            artifacts[relative] = old
+            continue
+
+        with open(path, 'rb') as f:
+            data = f.read()
+        raw = digest(data)
+        if old and old['raw'] == raw:
+            entry = dict(old)
+        else:
+            try:
+                entry = artifact_entry(path, kind, data)
+            except Exception as e:
+                problems.append(f"{relative}: could not hash ({e})")
+                continue
+            entry['raw'] = raw
+        entry.update(kind=kind, size=stat.st_size, mtime_ns=stat.st_mtime_ns)
+        artifacts[relative] = entry
+
+    return {'version': SNAPSHOT_VERSION, 'created': time.time(), 'artifacts': artifacts}, problems
+
+
+def load_snapshot(path):
+    """Load a snapshot, or return None if it doesn't exist."""
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+
+
+def save_snapshot(path, snapshot):
+    """Write a snapshot atomically."""
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    temp_path = f'{path}.{os.getpid()}.tmp'
+    with open(temp_path, 'w', encoding='utf-8') as f:
+        json.dump(snapshot, f, indent=1, sort_keys=True)
+    os.replace(temp_path, path)
+
+
+def diagram_label(relative, index, diagram_manifest):
+    """Name inline diagram index of an HTML page, with its store key if known."""
+    document = os.path.splitext(os.path.basename(relative))[0]
+    keys = diagram_manifest.get(document, [])
+    if index < len(keys):
+        return f"diagram {index + 1} ({keys[index]}.svg)"
+    return f"diagram {index + 1}"
+
+
+def compare_entries(relative, old, new, diagram_manifest):
+    """Return the differences between two snapshot entries of one artifact."""
+    if old['raw'] == new['raw']:
+        return []
+    kind = new['kind']
+
+    if kind == 'html':
+        differences = []
+        if old['content'] != new['content']:
+            differences.append(f"{relative}: page content differs")
+        old_diagrams, new_diagrams = old['diagrams'], new['diagrams']
+        if len(old_diagrams) != len(new_diagrams):
+            differences.append(f"{relative}: {len(old_diagrams)} -> {len(new_diagrams)} diagrams")
+        for i, (before, after) in enumerate(zip(old_diagrams, new_diagrams)):
+            if before != after:
+                differences.append(f"{relative}: {diagram_label(relative, i, diagram_manifest)} differs")
+        return differences
+
+    if kind == 'pdf':
+        differences = []
+        old_pages, new_pages = old['pages'], new['pages']
+        if len(old_pages) != len(new_pages):
+            differences.append(f"{relative}: {len(old_pages)} -> {len(new_pages)} pages")
+        for number, (before, after) in enumerate(zip(old_pages, new_pages), 1):
+            changed = [part for part in ('text', 'images') if before[part] != after[part]]
+            if not changed and before['layout'] != after['layout']:
+                changed = ['layout']
+            if changed:
+                differences.append(f"{relative}: page {number} {' and '.join(changed)} differ")
+        return differences
+
+    if old['content'] != new['content']:
+        return [f"{relative}: differs"]
+    return []
+
+
+def compare_snapshots(old, new, diagram_manifest=None):
+    """Return the differences between two snapshots, in artifact order."""
+    diagram_manifest = diagram_manifest or {}
+    old_artifacts, new_artifacts = old['artifacts'], new['artifacts']
+    differences = []
+    for relative in sorted(set(old_artifacts) | set(new_artifacts)):
+        if relative not in new_artifacts:
+            differences.append(f"{relative}: missing")
+        elif relative not in old_artifacts:
+            differences.append(f"{relative}: new")
+        else:
+            differences.extend(compare_entries(relative, old_artifacts[relative],
+                                               new_artifacts[relative], diagram_manifest))
+    return differences
+
+
+def main():
+    """Record a snapshot of the build outputs, or compare the outputs with one."""
+    parser = argparse.ArgumentParser(description='Snapshot build outputs and compare them for regressions.')
+    parser.add_argument('action', choices=['save', 'compare'],
+                        help='save a snapshot of the current outputs, or compare them with one')
+    parser.add_argument('--name', default=DEFAULT_SNAPSHOT,
+                        help=f'snapshot name (default: {DEFAULT_SNAPSHOT})')
+    args = parser.parse_args()
+
+    base_dir = '/home/ubuntu/go/src/customers-docs'
+    docs_dir = os.path.join(base_dir, 'docs')
+    path = snapshot_path(base_dir, args.name)
+
+    start = time.perf_counter()
+    previous = load_snapshot(path)
+    if args.action == 'compare' and previous is None:
+        print(f"No snapshot named '{args.name}' ({path})")
+        return 1
+
+    current, problems = take_snapshot(docs_dir, previous)
+    for problem in problems:
+        print(f"  {problem}")
+
+    if args.action == 'save':
+        save_snapshot(path, current)
+        print(f"Saved snapshot '{args.name}' of {len(current['artifacts'])} artifacts "
+              f"in {time.perf_counter() - start:.2f}s")
+        return 1 if problems else 0
+
+    diagram_manifest = diagram_store.load_manifest(os.path.join(docs_dir, 'images'))
+    differences = compare_snapshots(previous, current, diagram_manifest)
+    for difference in differences:
+        print(f"  {difference}")
+
+    print("-" * 50)
+    print(f"Compared {len(current['artifacts'])} artifacts with snapshot '{args.name}' "
+          f"in {time.perf_counter() - start:.2f}s: {len(differences)} differences")
+    return 1 if differences or problems else 0
+
+if __name__ == '__main__':
+    sys.exit(main())
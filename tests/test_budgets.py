@@ -0,0 +1,61 @@
+"""
+Tests for the performance budget checks.
+"""
+
+import os
+import json
+
+import budgets
+import diagram_store
+
+
+def write_file(path, content):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write(content)
+
+
+def svg_with_nodes(count):
+    return '<svg>' + '<g class="node default"></g>' * count + '</svg>'
+
+
+def test_check_outputs_without_manifest(tmp_path):
+    """Diagrams of documents not migrated to the store are checked from the legacy files."""
+    images_dir = str(tmp_path / 'images')
+    html_dir = str(tmp_path / 'html')
+    write_file(os.path.join(images_dir, 'Guide_diagram_1.svg'), svg_with_nodes(1))
+    write_file(os.path.join(images_dir, 'Guide_diagram_2.svg'), svg_with_nodes(3))
+    os.makedirs(html_dir)
+    assert not os.path.exists(os.path.join(images_dir, diagram_store.MANIFEST_FILENAME))
+
+    report = budgets.BudgetReport({'svg_bytes': None, 'svg_nodes': 2, 'html_bytes': None, 'pdf_seconds': None})
+    budgets.check_outputs(report, html_dir, images_dir)
+
+    assert report.offenders == [('svg_nodes', 'Guide diagram 2 (Guide_diagram_2.svg)', 3)]
+
+
+def test_check_outputs_with_manifest(tmp_path):
+    """Stored diagrams are checked once, and diagrams without a blob are skipped."""
+    images_dir = str(tmp_path / 'images')
+    html_dir = str(tmp_path / 'html')
+    write_file(diagram_store.blob_path(images_dir, 'aaaa'), svg_with_nodes(3))
+    write_file(os.path.join(images_dir, diagram_store.MANIFEST_FILENAME),
+               json.dumps({'Guide': ['aaaa', 'missing'], 'Other': ['aaaa']}))
+    os.makedirs(html_dir)
+
+    report = budgets.BudgetReport({'svg_bytes': None, 'svg_nodes': 2, 'html_bytes': None, 'pdf_seconds': None})
+    budgets.check_outputs(report, html_dir, images_dir)
+
+    assert [subject for _, subject, _ in report.offenders] == ['Guide diagram 1 (aaaa.svg)']
+
+
+def test_load_budgets_ignores_invalid_files(tmp_path):
+    """A budgets file that is not an object of positive limits falls back to the defaults."""
+    defaults = {name: default for name, (default, _, _) in budgets.BUDGETS.items()}
+    path = tmp_path / budgets.BUDGETS_FILENAME
+
+    path.write_text('[1, 2]')
+    assert budgets.load_budgets(str(tmp_path)) == defaults
+
+    path.write_text('{"svg_nodes": 0, "html_bytes": true, "pdf_seconds": null}')
+    assert budgets.load_budgets(str(tmp_path)) == dict(defaults, pdf_seconds=None)
@@ -7,15 +7,21 @@ The HTML files have inline SVGs that need to be replaced with the fixed versions
 import os
 import re
 import glob
+import argparse
+
+import diagram_store
+import diagram_offsets
+import sharding
+import build_history
+from prescreen import contains_any
 
 def get_svg_id_mapping(html_path):
     """Get mapping of SVG position to external file name based on document name."""
     basename = os.path.basename(html_path).replace('.html', '')
     images_dir = '/home/ubuntu/go/src/customers-docs/docs/images'
 
-    # Find all SVG files for this document
-    svg_files = sorted(glob.glob(os.path.join(images_dir, f'{basename}_diagram_*.svg')))
-    return svg_files
+    # Find all SVG files for this document, in diagram order
+    return diagram_store.document_diagrams(images_dir, basename)
 
 def read_svg_file(filepath):
     """Read SVG file content."""
@@ -70,10 +76,17 @@ def fix_svg_dimensions(svg_content):
 
     return svg_content
 
-def update_html_with_svgs(html_path):
-    """Update HTML file by replacing inline SVGs with fixed versions."""
-    with open(html_path, 'r', encoding='utf-8') as f:
-        html_content = f.read()
+def update_html_with_svgs(html_path, offsets_dir=None):
+    """
+    Update HTML file by replacing inline SVGs with fixed versions.
+    With offsets_dir, the diagram offsets recorded by the HTML stage are used
+    to splice in only the diagrams that changed, in one pass over the page;
+    a page without a valid index is rescanned.
+    """
+    # Pages without diagram blocks have nothing to replace; skip them undecoded
+    if not contains_any(html_path, [b'<div class="diagram">']):
+        print(f"  No diagrams in {os.path.basename(html_path)}")
+        return False
 
     # Get the SVG files for this document
     svg_files = get_svg_id_mapping(html_path)
@@ -82,54 +95,72 @@ def update_html_with_svgs(html_path):
         print(f"  No SVG files found for {os.path.basename(html_path)}")
         return False
 
-    # Find all inline SVGs in the HTML
-    # Pattern to match SVG elements inside diagram divs
-    svg_pattern = r'(<div class="diagram">\s*)(<svg[^>]*>.*?</svg>)(\s*</div>)'
-
-    matches = list(re.finditer(svg_pattern, html_content, flags=re.DOTALL))
-
-    if len(matches) != len(svg_files):
-        print(f"  Warning: {os.path.basename(html_path)} has {len(matches)} inline SVGs but {len(svg_files)} SVG files")
-
-    # Replace SVGs from last to first to preserve positions
-    modified = False
-    for i in range(min(len(matches), len(svg_files)) - 1, -1, -1):
-        match = matches[i]
-        svg_file = svg_files[i]
-
-        new_svg_content = read_svg_file(svg_file)
-        # Fix SVG dimensions to prevent over-scaling
-        new_svg_content = fix_svg_dimensions(new_svg_content)
-
-        # Reconstruct the diagram div with new SVG
-        new_block = match.group(1) + new_svg_content + match.group(3)
-
-        html_content = html_content[:match.start()] + new_block + html_content[match.end():]
-        modified = True
-
-    if modified:
-        with open(html_path, 'w', encoding='utf-8') as f:
-            f.write(html_content)
-        print(f"  Updated {os.path.basename(html_path)} with {min(len(matches), len(svg_files))} SVGs")
+    with open(html_path, 'rb') as f:
+        page = f.read()
+
+    name = os.path.basename(html_path)
+    blocks = diagram_offsets.load_offsets(offsets_dir, html_path, page) if offsets_dir else None
+    indexed = blocks is not None
+    if not indexed:
+        blocks = diagram_offsets.scan_diagram_blocks(page)
+
+    if len(blocks) != len(svg_files):
+        print(f"  Warning: {name} has {len(blocks)} inline SVGs but {len(svg_files)} SVG files")
+
+    # Fix SVG dimensions to prevent over-scaling
+    svgs = [fix_svg_dimensions(read_svg_file(svg_file)).encode('utf-8')
+            for svg_file in svg_files[:len(blocks)]]
+    page, blocks, changed = diagram_offsets.splice_diagrams(page, blocks, svgs)
+
+    # Only rewrite pages whose diagrams actually changed
+    if changed:
+        with open(html_path, 'wb') as f:
+            f.write(page)
+        if offsets_dir:
+            diagram_offsets.save_offsets(offsets_dir, html_path, blocks)
+        print(f"  Updated {name}: {changed} of {len(svgs)} SVGs changed")
+
+        # Keep split section pages (convert_md_to_html --split) in step
+        from convert_md_to_html import section_dir_for, write_section_pages
+        if os.path.isdir(section_dir_for(html_path)):
+            write_section_pages(html_path)
         return True
 
+    if offsets_dir and not indexed:
+        diagram_offsets.save_offsets(offsets_dir, html_path, blocks)
     return False
 
 def main():
     """Main function to update all HTML files."""
-    html_dir = '/home/ubuntu/go/src/customers-docs/docs/html'
+    parser = argparse.ArgumentParser(description='Replace inline SVGs in HTML with the fixed versions.')
+    sharding.add_shard_argument(parser)
+    args = parser.parse_args()
+
+    base_dir = '/home/ubuntu/go/src/customers-docs'
+    html_dir = os.path.join(base_dir, 'docs/html')
+    images_dir = os.path.join(base_dir, 'docs/images')
+    offsets_dir = diagram_offsets.offsets_dir(base_dir)
 
     # Get all HTML files (excluding index.html)
-    html_files = [f for f in glob.glob(os.path.join(html_dir, '*.html'))
-                  if not f.endswith('index.html')]
+    all_files = [f for f in glob.glob(os.path.join(html_dir, '*.html'))
+                 if not f.endswith('index.html')]
+    html_files = sharding.select_shard(all_files, args.shard, cost=sharding.manifest_cost(images_dir))
 
     print(f"Found {len(html_files)} HTML files to update")
     print("-" * 50)
 
     updated_count = 0
-    for html_path in sorted(html_files):
-        if update_html_with_svgs(html_path):
-            updated_count += 1
+    with build_history.open_history(base_dir) as history:
+        for html_path in sorted(html_files):
+            with history.measure('update-html', os.path.basename(html_path), [html_path]):
+                if update_html_with_svgs(html_path, offsets_dir):
+                    updated_count += 1
+
+    from convert_md_to_html import section_dir_for
+    sharding.write_shard_manifest(
+        base_dir, 'update-html', args.shard, all_files,
+        {path: [path] + sorted(glob.glob(os.path.join(section_dir_for(path), 'section_*.html')))
+         for path in html_files})
 
     print("-" * 50)
     print(f"Updated {updated_count} out of {len(html_files)} HTML files")
@@ -0,0 +1,115 @@
+"""
+Run a function in a child process under a resident memory ceiling and a
+time limit. The parent polls the child's RSS and kills it when it goes over
+the ceiling or runs too long, so one runaway job (e.g. a WeasyPrint layout
+of a very large document) fails on its own instead of getting the whole
+build OOM-killed.
+"""
+
+import time
+import multiprocessing
+
+# Seconds between memory checks of a running worker
+POLL_INTERVAL = 0.1
+
+
+class WorkerResult:
+    """
+    Outcome of a limited worker run.
+    status is 'ok', 'memory' (over the RSS ceiling or killed by the OOM
+    killer), 'timeout' or 'error' (the function raised).
+    """
+
+    def __init__(self, status, message=None, peak_rss=0):
+        self.status = status
+        self.message = message
+        self.peak_rss = peak_rss
+
+    @property
+    def ok(self):
+        return self.status == 'ok'
+
+
+def process_rss(pid):
+    """Return the resident set size of a process in bytes, or None if unknown."""
+    try:
+        with open(f'/proc/{pid}/status', 'r') as f:
+            for line in f:
+                if line.startswith('VmRSS:'):
+                    return int(line.split()[1]) * 1024
+    except (OSError, ValueError):
+        pass
+    return None
+
+
+def call_and_report(conn, func, args):
+    """Worker entry point: call func and send back None or the error message."""
+    try:
+        func(*args)
+        conn.send(None)
+    except BaseException as e:
+        conn.send(f'{type(e).__name__}: {e}')
+    finally:
+        conn.close()
+
+
+def receive(receiver):
+    """Return the worker's report if one is waiting, or None."""
+    try:
+        if receiver.poll():
+            return receiver.recv()
+    except EOFError:
+        # The worker died without reporting
+        pass
+    return None
+
+
+def stop(process):
+    """Kill a worker and wait for it to exit."""
+    process.kill()
+    process.join()
+
+
+def run_limited(func, args=(), rss_limit=None, timeout=None):
+    """
+    Run func(*args) in a fresh process and return a WorkerResult.
+    rss_limit is in bytes; either limit may be None for no limit. func and
+    its arguments must be picklable (module-level functions). Workers are
+    spawned rather than forked, so callers may use threads to run several
+    at once.
+    """
+    context = multiprocessing.get_context('spawn')
+    receiver, sender = context.Pipe(duplex=False)
+    process = context.Process(target=call_and_report, args=(sender, func, args), daemon=True)
+    process.start()
+    sender.close()
+
+    start = time.monotonic()
+    peak_rss = 0
+    message = None
+    while process.is_alive():
+        process.join(POLL_INTERVAL)
+        if message is None:
+            message = receive(receiver)
+
+        rss = process_rss(process.pid) or 0
+        peak_rss = max(peak_rss, rss)
+        if rss_limit and rss > rss_limit:
+            stop(process)
+            return WorkerResult('memory', f'RSS {rss / 2**20:.0f} MB over the '
+                                          f'{rss_limit / 2**20:.0f} MB ceiling', peak_rss)
+        if timeout and time.monotonic() - start > timeout:
+            stop(process)
+            return WorkerResult('timeout', f'timed out after {timeout}s', peak_rss)
+
+    if message is None:
+        message = receive(receiver)
+    receiver.close()
+
+    if process.exitcode == 0 and message is None:
+        return WorkerResult('ok', peak_rss=peak_rss)
+    if message is not None:
+        return WorkerResult('error', message, peak_rss)
+    if process.exitcode == -9:
+        return WorkerResult('memory', 'killed (SIGKILL), most likely by the OOM killer', peak_rss)
+    return WorkerResult('error', f'worker exited with status {process.exitcode}', peak_rss)